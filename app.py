@@ -1,20 +1,248 @@
 # Importa as bibliotecas necessárias do Flask e os agentes de chat
-from flask import Flask, request, render_template
-from chat_agents import (
-    text_agent,
-    ux_research_agent,
-    ux_design_agent,
-    business_agent,
-    photographer_agent,
-    spec_agent,
-    code_agent,
-    extract_tag_content
+import contextvars
+import queue
+import threading
+from flask import (
+    Flask, Response, jsonify, make_response, redirect, request, render_template, send_file, stream_with_context,
+    url_for,
 )
+from artifacts import artifact_store
+from pipeline import regenerate, run_pipeline, stages_for
+from cache import bypass_cache
+from image_store import image_store
+from jobs import job_queue
+from metrics import current_trace_id, render_prometheus, set_trace_id
+from routing import model_profile
+from storefronts import storefront_store
+from web import etag_matches, server_timing, sse, storefront_headers, variant_links
 
 # Cria uma instância do Flask
 # Configura o Flask para servir arquivos estáticos do diretório 'static'
 app = Flask(__name__, template_folder='templates', static_folder='static')
 
+# O trabalho em segundo plano sobe com o servidor (primeira requisição de cada
+# processo), não na importação: scripts e testes que importam o app não
+# disputam a fila com o servidor nem apagam nada dos armazenamentos
+_background_lock = threading.Lock()
+_background_started = False
+
+@app.before_request
+def _start_background_work():
+    global _background_started
+    if _background_started:
+        return
+    with _background_lock:
+        if _background_started:
+            return
+        # Pool que consome a fila de jobs
+        job_queue.start()
+        # Remove as imagens usadas há mais tempo quando o disco passa da cota
+        image_store.start_gc()
+        # Apaga os artefatos das execuções antigas (ARTIFACTS_MAX_AGE_DAYS / ARTIFACTS_MAX_RUNS)
+        artifact_store.start_gc()
+        _background_started = True
+
+# Cada requisição recebe um trace ID (ou reaproveita o X-Request-ID recebido),
+# que aparece nos logs de todas as chamadas feitas durante a geração
+@app.before_request
+def _start_trace():
+    set_trace_id(request.headers.get("X-Request-ID"))
+
+@app.after_request
+def _add_trace_header(response):
+    response.headers["X-Trace-Id"] = current_trace_id()
+    return response
+
+def save_variants(result, product: str) -> tuple:
+    """
+    Renderiza e salva a página de cada variante de layout.
+    Retorna a página da primeira variante e as URLs (/s/<id>) de todas.
+    """
+    pages = [render_template('base.html', generated_content=page.html) for page in result.variants]
+    return pages[0], [storefront_store.save(page, product).url for page in pages]
+
+# Métricas por agente (latência, tokens, custo) no formato do Prometheus
+@app.route("/metrics")
+def metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+# Rota de streaming: emite um evento a cada etapa concluída e os tokens do
+# CodeGeneratorAgent conforme chegam. O evento final "done" traz a página pronta.
+@app.route("/stream")
+def stream():
+    product = request.args.get("product")
+    fresh = request.args.get("fresh") == "1"
+    mode = request.args.get("mode")
+    variants = request.args.get("variants")
+    profile = request.args.get("profile")
+    if not product:
+        return Response(sse("error", {"message": "Informe o parâmetro 'product'."}),
+                        mimetype="text/event-stream")
+
+    events = queue.Queue()
+
+    def worker():
+        try:
+            with bypass_cache(fresh), model_profile(profile):
+                result = run_pipeline(product, stages=stages_for(mode, variants),
+                                      on_event=lambda kind, data: events.put((kind, data)))
+            events.put(("result", result))
+        except Exception as e:
+            print(f"\n❌ Erro durante a geração: {str(e)}")
+            events.put(("error", {"message": str(e)}))
+
+    print(f"\n🚀 [trace={current_trace_id()}] Iniciando geração (streaming) de e-commerce para: {product}")
+    # Copia o contexto para manter o trace ID da requisição na thread
+    threading.Thread(target=contextvars.copy_context().run, args=(worker,), daemon=True).start()
+
+    def generate():
+        while True:
+            kind, data = events.get()
+            if kind == "result":
+                page, urls = save_variants(data, product)
+                yield sse("done", {"total": data.total, "html": page, "url": urls[0],
+                                    "variants": urls, "run_id": data.run_id})
+                return
+            yield sse(kind, data)
+            if kind == "error":
+                return
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- E-commerces salvos ---
+
+# Serve a página salva direto do disco, já comprimida, com ETag e cache longo
+# (o ID é o hash do conteúdo, então a página nunca muda)
+@app.route("/s/<storefront_id>")
+def storefront_page(storefront_id):
+    storefront = storefront_store.get(storefront_id)
+    if storefront is None:
+        return "E-commerce não encontrado.", 404
+
+    path, encoding, etag = storefront_store.representation(storefront, request.headers.get("Accept-Encoding"))
+    headers = storefront_headers(etag)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status=304, headers=headers)
+
+    response = send_file(path, mimetype="text/html", etag=False, conditional=False, max_age=None)
+    response.headers.update(headers)
+    response.headers.pop("Content-Disposition", None)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+# CSS extraído das páginas (html_optimizer.py): também nomeado pelo hash, então nunca muda
+@app.route("/s/assets/<name>")
+def storefront_asset(name):
+    found = storefront_store.asset(name, request.headers.get("Accept-Encoding"))
+    if found is None:
+        return "Arquivo não encontrado.", 404
+
+    path, encoding, etag = found
+    headers = storefront_headers(etag)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status=304, headers=headers)
+
+    response = send_file(path, mimetype="text/css", etag=False, conditional=False, max_age=None)
+    response.headers.update(headers)
+    response.headers.pop("Content-Disposition", None)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+# --- Execuções armazenadas (regeneração incremental) ---
+
+# Lista as etapas gravadas de uma execução, com o hash das entradas de cada uma
+@app.route("/runs/<run_id>")
+def run_status(run_id):
+    run = artifact_store.get_run(run_id)
+    if run is None:
+        return jsonify({"error": "Execução não encontrada."}), 404
+    return jsonify(run)
+
+# Refaz uma execução a partir de uma etapa ({"stage": "code"}): a etapa escolhida
+# roda de novo e as seguintes só são recalculadas se suas entradas mudarem
+@app.route("/runs/<run_id>/regenerate", methods=["POST"])
+def regenerate_run(run_id):
+    data = request.get_json(silent=True) or request.form
+    stage = data.get("stage")
+    if not stage:
+        return jsonify({"error": "Informe o campo 'stage'."}), 400
+    print(f"\n🔁 [trace={current_trace_id()}] Regenerando a execução {run_id} a partir de '{stage}'")
+    try:
+        result = regenerate(run_id, stage)
+    except KeyError:
+        return jsonify({"error": "Execução não encontrada."}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    _, urls = save_variants(result, result.outputs["product"])
+    response = jsonify({
+        "run_id": result.run_id,
+        "parent_id": run_id,
+        "reused": result.reused,
+        "recomputed": [t.name for t in result.timings if not t.reused],
+        "total": result.total,
+        "url": urls[0],
+        "variants": urls,
+    })
+    response.headers["Server-Timing"] = server_timing(result)
+    return response
+
+# --- Jobs em segundo plano ---
+
+# Enfileira uma geração e responde imediatamente com o ID do job
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    data = request.get_json(silent=True) or request.form
+    product = data.get("product")
+    if not product:
+        return jsonify({"error": "Informe o campo 'product'."}), 400
+    job_id = job_queue.enqueue(product, fresh=str(data.get("fresh")) in ("1", "true", "True"))
+    print(f"\n📥 Job {job_id} enfileirado para: {product}")
+    if _wants_html():
+        # Formulário sem JavaScript: vai direto para a página que aguarda o resultado
+        return redirect(url_for("job_result", job_id=job_id), code=303)
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": url_for("job_status", job_id=job_id),
+        "result_url": url_for("job_result", job_id=job_id),
+    }), 202
+
+def _wants_html() -> bool:
+    """Navegadores preferem text/html; clientes da API (curl, JSON) recebem JSON."""
+    return request.accept_mimetypes.best_match(["application/json", "text/html"]) == "text/html"
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado."}), 404
+    job.pop("result")
+    return jsonify(job)
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado."}), 404
+    if job["status"] == "error":
+        if _wants_html():
+            return render_template('error.html', error=job["error"]), 500
+        return jsonify({"status": "error", "error": job["error"]}), 500
+    if job["status"] != "done":
+        if _wants_html():
+            # Página de espera que se recarrega até o job terminar
+            return render_template('job_wait.html', job=job), 202
+        return jsonify({"status": job["status"]}), 202
+    page = render_template('base.html', generated_content=job["result"])
+    storefront = storefront_store.save(page, job["product"])
+    response = make_response(page)
+    response.headers["Content-Location"] = storefront.url
+    return response
+
 # Define a rota principal da aplicação, que aceita métodos GET e POST
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -24,183 +252,40 @@ def index():
         product = request.form.get("product")
         if product:
             try:
-                print(f"\n🚀 Iniciando geração de e-commerce para: {product}")
-                
-                # Fluxo dos agentes usando XML para troca de dados
-                print("\n📝 Etapa 1: Gerando contexto do produto...")
-                context_xml = text_agent.respond(product)
-                
-                print("\n👥 Etapa 2: Criando persona do cliente...")
-                persona_xml = ux_research_agent.respond(context_xml)
-                
-                print("\n🎨 Etapa 3: Definindo elementos de UX...")
-                ux_elements_xml = ux_design_agent.respond(persona_xml)
-                
-                print("\n🛒 Etapa 4: Criando lista de produtos (Máx 3)...")
-                products_xml = business_agent.respond(persona_xml)
-                
-                print("\n🖼️ Etapa 5: Gerando e SALVANDO imagens dos produtos (Máx 3)...")
-                images_xml = photographer_agent.respond(products_xml)
-                
-                print("\n📜 Etapa 6: Criando especificação técnica...")
-                specification_xml = spec_agent.respond(persona_xml, ux_elements_xml, images_xml)
-                
-                print("\n💻 Etapa 7: Gerando código HTML/CSS (Sem blocos Markdown)...")
-                generated_code_xml = code_agent.respond(specification_xml, images_xml, products_xml)
+                print(f"\n🚀 [trace={current_trace_id()}] Iniciando geração de e-commerce para: {product}")
                 
-                # Extrai o código gerado do XML
-                code_output = extract_tag_content(generated_code_xml, tag="generated_code")
+                # Fluxo dos agentes (mensagens tipadas em memória; XML só sob demanda).
+                # As etapas independentes (UX, negócios e imagens) rodam em paralelo.
+                # "fresh=1" ignora o cache e força respostas novas dos agentes;
+                # "mode=fused" gera contexto, persona, UX e produtos numa só chamada;
+                # "variants=K" gera K layouts a partir das mesmas etapas anteriores;
+                # "profile=fast|balanced|quality" escolhe os modelos dos agentes
+                with bypass_cache(request.values.get("fresh") == "1"), model_profile(request.values.get("profile")):
+                    result = run_pipeline(product, stages=stages_for(request.values.get("mode"),
+                                                                     request.values.get("variants")))
                 
-                print("\n✅ E-commerce gerado com sucesso!")
+                print(f"\n✅ E-commerce gerado com sucesso em {result.total:.2f}s!")
                 print("\n🌐 Renderizando no navegador...")
                 
-                # Renderiza o template com o código gerado
-                return render_template('base.html', generated_content=code_output)
+                # Renderiza o template com o código gerado e salva a página (gzip/brotli)
+                # para ser revisitada em /s/<id> sem gerar de novo; com variantes, todas
+                # são salvas e a primeira é a exibida
+                page, urls = save_variants(result, product)
+                response = make_response(page)
+                response.headers["Server-Timing"] = server_timing(result)
+                response.headers["Content-Location"] = urls[0]
+                if len(urls) > 1:
+                    response.headers["Link"] = variant_links(urls)
+                if result.run_id:
+                    response.headers["X-Run-Id"] = result.run_id
+                return response
             
             except Exception as e:
                 print(f"\n❌ Erro durante a geração: {str(e)}")
-                return f"""
-                <!DOCTYPE html>
-                <html>
-                    <head>
-                        <meta charset="UTF-8">
-                        <title>Erro na Geração</title>
-                        <style>
-                            body {{ font-family: Arial, sans-serif; margin: 50px; }}
-                            .error {{ color: red; padding: 20px; border: 1px solid red; border-radius: 5px; }}
-                        </style>
-                    </head>
-                    <body>
-                        <div class="error">
-                            <h1>❌ Erro na Geração do E-commerce</h1>
-                            <p><strong>Detalhes:</strong> {str(e)}</p>
-                            <p><a href="/">Voltar</a></p>
-                        </div>
-                    </body>
-                </html>
-                """
+                return render_template('error.html', error=str(e))
     
     # Retorna o formulário HTML para o método GET (mantido do app_novo.py)
-    return """
-    <!DOCTYPE html>
-    <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Gerador de E-commerce com Multiagentes e IA</title>
-            <style>
-                * {
-                    margin: 0;
-                    padding: 0;
-                    box-sizing: border-box;
-                }
-                
-                body {
-                    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    min-height: 100vh;
-                    display: flex;
-                    justify-content: center;
-                    align-items: center;
-                    padding: 20px;
-                }
-                
-                .container {
-                    background: white;
-                    padding: 40px;
-                    border-radius: 10px;
-                    box-shadow: 0 10px 40px rgba(0, 0, 0, 0.2);
-                    max-width: 500px;
-                    width: 100%;
-                }
-                
-                h1 {
-                    color: #333;
-                    margin-bottom: 10px;
-                    font-size: 28px;
-                }
-                
-                .subtitle {
-                    color: #666;
-                    margin-bottom: 30px;
-                    font-size: 14px;
-                }
-                
-                label {
-                    display: block;
-                    margin-bottom: 8px;
-                    color: #333;
-                    font-weight: 500;
-                }
-                
-                input[type="text"] {
-                    width: 100%;
-                    padding: 12px;
-                    margin-bottom: 20px;
-                    border: 2px solid #e0e0e0;
-                    border-radius: 5px;
-                    font-size: 16px;
-                    transition: border-color 0.3s;
-                }
-                
-                input[type="text"]:focus {
-                    outline: none;
-                    border-color: #667eea;
-                }
-                
-                input[type="submit"] {
-                    width: 100%;
-                    padding: 12px;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                    border: none;
-                    border-radius: 5px;
-                    font-size: 16px;
-                    font-weight: 600;
-                    cursor: pointer;
-                    transition: transform 0.2s, box-shadow 0.2s;
-                }
-                
-                input[type="submit"]:hover {
-                    transform: translateY(-2px);
-                    box-shadow: 0 5px 20px rgba(102, 126, 234, 0.4);
-                }
-                
-                input[type="submit"]:active {
-                    transform: translateY(0);
-                }
-                
-                .info {
-                    margin-top: 20px;
-                    padding: 15px;
-                    background: #f5f5f5;
-                    border-radius: 5px;
-                    font-size: 13px;
-                    color: #666;
-                    line-height: 1.6;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>🛍️ Gerador de E-commerce</h1>
-                <p class="subtitle">Crie um e-commerce único com IA multiagente</p>
-                <form method="post">
-                    <label for="product">Digite um produto para vender:</label>
-                    <input type="text" id="product" name="product" placeholder="Ex: Fones de ouvido wireless" required autofocus>
-                    <input type="submit" value="Gerar E-commerce">
-                </form>
-                <div class="info">
-                    <strong>💡 Como funciona:</strong><br>
-                    1. Digite o nome de um produto<br>
-                    2. Nossos agentes de IA analisam e criam uma persona<br>
-                    3. Um e-commerce personalizado é gerado<br>
-                    4. Você vê o resultado em tempo real
-                </div>
-            </div>
-        </body>
-    </html>
-    """
+    return render_template('index.html')
 
 # Executa a aplicação Flask no modo debug
 if __name__ == "__main__":
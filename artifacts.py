@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+from messages import AgentText, Image, ImageList, ImageVariant, Page, Product, ProductList, Specification
+
+# Banco onde ficam as saídas de cada etapa de cada execução
+ARTIFACTS_ENABLED = os.getenv("ARTIFACTS_ENABLED", "1") != "0"
+ARTIFACTS_DB_PATH = os.getenv("ARTIFACTS_DB_PATH", "artifacts.sqlite3")
+# Retenção: execuções mais antigas que isso, ou além das N mais recentes, são apagadas (0 = sem limite)
+ARTIFACTS_MAX_AGE_DAYS = float(os.getenv("ARTIFACTS_MAX_AGE_DAYS", "30"))
+ARTIFACTS_MAX_RUNS = int(os.getenv("ARTIFACTS_MAX_RUNS", "5000"))
+ARTIFACTS_GC_INTERVAL = float(os.getenv("ARTIFACTS_GC_INTERVAL", "3600"))
+
+# Versão do formato/prompt de cada etapa: incrementar invalida os artefatos antigos.
+# As variantes de layout ("code_2", ...) seguem a versão da etapa original.
+# 2: produtos, especificação, código e a chamada fundida passaram a ser saídas estruturadas (JSON Schema)
+STAGE_VERSIONS = {"upstream": 2, "products": 2, "specification": 2, "code": 2}
+
+# --- Serialização das mensagens (JSON, preservando os tipos) ---
+
+_TYPES = {cls.__name__: cls for cls in (AgentText, Specification, Product, ProductList, Image, ImageVariant, ImageList, Page)}
+
+def encode(value):
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        data = {field: encode(getattr(value, field)) for field in value._fields}
+        return {"__type__": type(value).__name__, **data}
+    if isinstance(value, dict):
+        return {k: encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(v) for v in value]
+    return value
+
+def decode(value):
+    if isinstance(value, dict) and "__type__" in value:
+        cls = _TYPES[value["__type__"]]
+        return cls(**{k: decode(v) for k, v in value.items() if k != "__type__"})
+    if isinstance(value, dict):
+        return {k: decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return tuple(decode(v) for v in value)
+    return value
+
+def dumps(value) -> str:
+    return json.dumps(encode(value), ensure_ascii=False, sort_keys=True)
+
+def input_hash(stage: str, inputs: dict) -> str:
+    """Hash das entradas de uma etapa: se nada mudou, a saída armazenada continua válida."""
+    payload = json.dumps(
+        {"stage": stage, "version": STAGE_VERSIONS.get(re.sub(r"_\d+$", "", stage), 1),
+         "inputs": {name: encode(value) for name, value in inputs.items()}},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ArtifactStore:
+    """
+    Guarda, para cada execução (run), a saída de cada etapa junto com o hash
+    das entradas que a produziram. `collect` apaga as execuções mais antigas
+    que ARTIFACTS_MAX_AGE_DAYS ou além das ARTIFACTS_MAX_RUNS mais recentes.
+    """
+    def __init__(self, path: str = ARTIFACTS_DB_PATH, max_age_days: float = ARTIFACTS_MAX_AGE_DAYS,
+                 max_runs: int = ARTIFACTS_MAX_RUNS):
+        self.path = path
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.max_runs = max_runs
+        self._thread = None
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " id TEXT PRIMARY KEY, product TEXT NOT NULL, parent_id TEXT, created REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS artifacts ("
+                " run_id TEXT NOT NULL, stage TEXT NOT NULL, input_hash TEXT NOT NULL,"
+                " value TEXT NOT NULL, reused INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL,"
+                " PRIMARY KEY (run_id, stage))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS runs_created ON runs (created)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create_run(self, product: str, parent_id: str = None) -> str:
+        run_id = uuid.uuid4().hex[:16]
+        with self._connect() as conn:
+            conn.execute("INSERT INTO runs (id, product, parent_id, created) VALUES (?, ?, ?, ?)",
+                         (run_id, product, parent_id, time.time()))
+        return run_id
+
+    def recorder(self, product: str, parent_id: str = None, previous: dict = None,
+                 force=()) -> "RunRecorder":
+        return RunRecorder(self, self.create_run(product, parent_id), previous, force)
+
+    def get_run(self, run_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            run = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+            if run is None:
+                return None
+            rows = conn.execute(
+                "SELECT stage, input_hash, reused, created FROM artifacts WHERE run_id = ? ORDER BY created",
+                (run_id,)
+            ).fetchall()
+        return {**dict(run), "stages": [dict(row) for row in rows]}
+
+    def load_outputs(self, run_id: str) -> dict:
+        """Saídas de todas as etapas da execução: {etapa: (input_hash, valor)}."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT stage, input_hash, value FROM artifacts WHERE run_id = ?",
+                                (run_id,)).fetchall()
+        return {row["stage"]: (row["input_hash"], decode(json.loads(row["value"]))) for row in rows}
+
+    def save(self, run_id: str, stage: str, stage_hash: str, value, reused: bool = False) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts (run_id, stage, input_hash, value, reused, created)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (run_id, stage, stage_hash, dumps(value), int(reused), time.time())
+            )
+
+    # --- Retenção ---
+
+    def collect(self) -> dict:
+        """Apaga as execuções (e seus artefatos) que passaram da idade ou da quantidade máxima."""
+        removed = {"runs": 0, "artifacts": 0}
+        with self._connect() as conn:
+            expired = []
+            if self.max_age_seconds:
+                expired += [row["id"] for row in conn.execute(
+                    "SELECT id FROM runs WHERE created < ?", (time.time() - self.max_age_seconds,))]
+            if self.max_runs:
+                expired += [row["id"] for row in conn.execute(
+                    "SELECT id FROM runs ORDER BY created DESC LIMIT -1 OFFSET ?", (self.max_runs,))]
+            for start in range(0, len(expired), 500):
+                batch = expired[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                removed["artifacts"] += conn.execute(
+                    f"DELETE FROM artifacts WHERE run_id IN ({marks})", batch).rowcount
+                removed["runs"] += conn.execute(f"DELETE FROM runs WHERE id IN ({marks})", batch).rowcount
+        if removed["runs"]:
+            print(f"🧹 Artefatos: {removed['runs']} execuções e {removed['artifacts']} saídas removidas")
+        return removed
+
+    def start_gc(self, interval: float = ARTIFACTS_GC_INTERVAL) -> None:
+        """Coleta em segundo plano a cada `interval` segundos."""
+        if self._thread or not (self.max_age_seconds or self.max_runs):
+            return
+
+        def loop():
+            while True:
+                try:
+                    self.collect()
+                except Exception as e:
+                    print(f"❌ Erro na coleta de artefatos: {e}")
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=loop, name="artifacts-gc", daemon=True)
+        self._thread.start()
+
+class RunRecorder:
+    """
+    Liga o pipeline ao ArtifactStore: grava cada saída e, numa regeneração,
+    reaproveita as etapas cujas entradas não mudaram. Etapas em `force` são
+    sempre recalculadas, ignorando também o cache de respostas.
+    """
+    def __init__(self, store: ArtifactStore, run_id: str, previous: dict = None, force=()):
+        self.store = store
+        self.run_id = run_id
+        self.previous = previous or {}
+        self.force = set(force)
+
+    def fresh(self, stage: str) -> bool:
+        return stage in self.force
+
+    def lookup(self, stage: str, inputs: dict) -> tuple:
+        """Retorna (hash das entradas, encontrado?, valor armazenado)."""
+        stage_hash = input_hash(stage, inputs)
+        stored = self.previous.get(stage)
+        if stage not in self.force and stored and stored[0] == stage_hash:
+            return stage_hash, True, stored[1]
+        return stage_hash, False, None
+
+    def record(self, stage: str, stage_hash: str, value, reused: bool = False) -> None:
+        self.store.save(self.run_id, stage, stage_hash, value, reused)
+
+artifact_store = ArtifactStore()
@@ -0,0 +1,160 @@
+# Servidor ASGI (Quart) para muitas gerações simultâneas: as rotas são
+# assíncronas e os agentes usam o AsyncOpenAI, então cada geração em andamento
+# é um conjunto de tasks no event loop, não um pool de threads bloqueadas
+# esperando a OpenAI. Rode com:  hypercorn asgi_app:app
+#
+# Regeneração (/runs) e a fila de jobs continuam no servidor Flask (app.py).
+import asyncio
+from quart import Quart, Response, make_response, render_template, request, send_file, stream_with_context
+from pipeline import arun_pipeline, stages_for
+from artifacts import artifact_store
+from cache import bypass_cache
+from image_store import image_store
+from metrics import current_trace_id, render_prometheus, set_trace_id
+from resilience import to_thread
+from routing import model_profile
+from storefronts import storefront_store
+from web import etag_matches, server_timing, sse, storefront_headers, variant_links
+
+app = Quart(__name__, template_folder='templates', static_folder='static')
+
+@app.before_serving
+async def _start_gc():
+    image_store.start_gc()
+    artifact_store.start_gc()
+
+# Mesmo trace ID por requisição do app.py (o contexto de cada requisição é isolado)
+@app.before_request
+async def _start_trace():
+    set_trace_id(request.headers.get("X-Request-ID"))
+
+@app.after_request
+async def _add_trace_header(response):
+    response.headers["X-Trace-Id"] = current_trace_id()
+    return response
+
+async def save_variants(result, product: str) -> tuple:
+    """Versão assíncrona do save_variants do app.py (as gravações rodam fora do event loop)."""
+    pages = [await render_template('base.html', generated_content=page.html) for page in result.variants]
+    storefronts = [await to_thread(storefront_store.save, page, product) for page in pages]
+    return pages[0], [storefront.url for storefront in storefronts]
+
+@app.route("/metrics")
+async def metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/stream")
+async def stream():
+    product = request.args.get("product")
+    fresh = request.args.get("fresh") == "1"
+    mode = request.args.get("mode")
+    variants = request.args.get("variants")
+    profile = request.args.get("profile")
+    if not product:
+        return Response(sse("error", {"message": "Informe o parâmetro 'product'."}),
+                        mimetype="text/event-stream")
+
+    events = asyncio.Queue()
+
+    async def worker():
+        try:
+            with bypass_cache(fresh), model_profile(profile):
+                result = await arun_pipeline(product, stages=stages_for(mode, variants),
+                                             on_event=lambda kind, data: events.put_nowait((kind, data)))
+            events.put_nowait(("result", result))
+        except Exception as e:
+            print(f"\n❌ Erro durante a geração: {str(e)}")
+            events.put_nowait(("error", {"message": str(e)}))
+
+    print(f"\n🚀 [trace={current_trace_id()}] Iniciando geração (streaming) de e-commerce para: {product}")
+
+    @stream_with_context
+    async def generate():
+        task = asyncio.ensure_future(worker())
+        try:
+            while True:
+                kind, data = await events.get()
+                if kind == "result":
+                    page, urls = await save_variants(data, product)
+                    yield sse("done", {"total": data.total, "html": page, "url": urls[0],
+                                       "variants": urls, "run_id": data.run_id})
+                    return
+                yield sse(kind, data)
+                if kind == "error":
+                    return
+        finally:
+            # Cliente desconectou: cancela a geração em vez de deixá-la rodando
+            task.cancel()
+
+    response = Response(generate(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.timeout = None
+    return response
+
+@app.route("/s/<storefront_id>")
+async def storefront_page(storefront_id):
+    storefront = storefront_store.get(storefront_id)
+    if storefront is None:
+        return "E-commerce não encontrado.", 404
+
+    path, encoding, etag = storefront_store.representation(storefront, request.headers.get("Accept-Encoding"))
+    headers = storefront_headers(etag)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status=304, headers=headers)
+
+    response = await send_file(path, mimetype="text/html", add_etags=False, conditional=False, cache_timeout=None)
+    response.headers.update(headers)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+@app.route("/s/assets/<name>")
+async def storefront_asset(name):
+    found = storefront_store.asset(name, request.headers.get("Accept-Encoding"))
+    if found is None:
+        return "Arquivo não encontrado.", 404
+
+    path, encoding, etag = found
+    headers = storefront_headers(etag)
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status=304, headers=headers)
+
+    response = await send_file(path, mimetype="text/css", add_etags=False, conditional=False, cache_timeout=None)
+    response.headers.update(headers)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+@app.route("/", methods=["GET", "POST"])
+async def index():
+    if request.method == "POST":
+        form = await request.form
+        product = form.get("product")
+        if product:
+            try:
+                print(f"\n🚀 [trace={current_trace_id()}] Iniciando geração de e-commerce para: {product}")
+                stages = stages_for(request.args.get("mode", form.get("mode")),
+                                    request.args.get("variants", form.get("variants")))
+                with bypass_cache(request.args.get("fresh", form.get("fresh")) == "1"), \
+                        model_profile(request.args.get("profile", form.get("profile"))):
+                    result = await arun_pipeline(product, stages=stages)
+                print(f"\n✅ E-commerce gerado com sucesso em {result.total:.2f}s!")
+
+                page, urls = await save_variants(result, product)
+                response = await make_response(page)
+                response.headers["Server-Timing"] = server_timing(result)
+                response.headers["Content-Location"] = urls[0]
+                if len(urls) > 1:
+                    response.headers["Link"] = variant_links(urls)
+                if result.run_id:
+                    response.headers["X-Run-Id"] = result.run_id
+                return response
+
+            except Exception as e:
+                print(f"\n❌ Erro durante a geração: {str(e)}")
+                return await render_template('error.html', error=str(e))
+
+    return await render_template('index.html')
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -0,0 +1,188 @@
+"""
+Geração em lote: lê produtos de um CSV ou JSONL e roda o pipeline dos agentes
+com concorrência limitada. Cada produto concluído é gravado imediatamente em
+results.jsonl (que também serve de checkpoint) e num arquivo HTML, então uma
+execução interrompida continua de onde parou.
+
+Uso:
+    python batch.py produtos.csv --output saida/ --concurrency 4
+    python batch.py produtos.jsonl --output saida/          # retoma se já existir
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html import escape
+
+from artifacts import artifact_store
+from cache import bypass_cache
+from image_store import image_store
+from metrics import trace
+from pipeline import run_pipeline, stages_for
+from ratelimit import BATCH, request_priority
+from routing import MODEL_PROFILES, model_profile
+
+HTML_TEMPLATE = (
+    "<!DOCTYPE html>\n<html lang=\"pt-BR\">\n<head>\n<meta charset=\"UTF-8\">\n"
+    "<meta name=\"viewport\" content=\"width=device-width, initial-scale=1.0\">\n"
+    "<title>{title}</title>\n</head>\n<body>\n{body}\n</body>\n</html>\n"
+)
+
+# IDs informados no arquivo viram nomes de arquivo: sem separadores de caminho nem ".."
+_SAFE_ID = re.compile(r"\w[\w\-.]*")
+
+def slugify(text: str) -> str:
+    return re.sub(r'[^\w\-]+', '_', text.strip().lower()).strip('_')[:60] or "produto"
+
+def read_products(path: str) -> list:
+    """
+    Lê os produtos do arquivo. CSV: coluna "product" (ou a primeira coluna);
+    JSONL: campo "product" em cada linha. Um campo "id" opcional identifica o item.
+    """
+    items = []
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            reader = csv.DictReader(f)
+            column = "product" if "product" in (reader.fieldnames or []) else reader.fieldnames[0]
+            rows = [{"id": row.get("id"), "product": row[column]} for row in reader]
+
+    seen = set()
+    for n, row in enumerate(rows, 1):
+        product = (row.get("product") or "").strip()
+        if not product:
+            continue
+        item_id = str(row.get("id") or f"{n:05d}_{slugify(product)}")
+        if not _SAFE_ID.fullmatch(item_id):
+            raise ValueError(f"ID inválido no arquivo de entrada (use letras, números, '-', '_' e '.'): {item_id!r}")
+        if item_id in seen:
+            raise ValueError(f"ID duplicado no arquivo de entrada: {item_id}")
+        seen.add(item_id)
+        items.append({"id": item_id, "product": product})
+    return items
+
+def completed_ids(results_path: str, retry_failed: bool = True) -> set:
+    """IDs já concluídos em execuções anteriores (checkpoint)."""
+    done = set()
+    if not os.path.exists(results_path):
+        return done
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # última linha pode ter ficado pela metade numa interrupção
+            if entry.get("status") == "ok" or not retry_failed:
+                done.add(entry["id"])
+    return done
+
+class BatchRunner:
+    def __init__(self, output_dir: str, concurrency: int = 4, fresh: bool = False, mode: str = None,
+                 variants: int = 1, profile: str = None):
+        self.output_dir = output_dir
+        self.html_dir = os.path.join(output_dir, "html")
+        self.results_path = os.path.join(output_dir, "results.jsonl")
+        self.concurrency = concurrency
+        self.fresh = fresh
+        self.profile = profile
+        self.stages = stages_for(mode, variants)
+        self._lock = threading.Lock()
+        os.makedirs(self.html_dir, exist_ok=True)
+
+    def _write_result(self, entry: dict) -> None:
+        with self._lock, open(self.results_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_html(self, item: dict, code: str, variant: int = 1) -> str:
+        suffix = "" if variant == 1 else f".v{variant}"
+        path = os.path.join(self.html_dir, f"{item['id']}{suffix}.html")
+        tmp_path = path + ".part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(HTML_TEMPLATE.format(title=escape(item["product"]), body=code))
+        os.replace(tmp_path, path)
+        image_store.pin(code, os.path.abspath(path))
+        return path
+
+    def _process(self, item: dict) -> dict:
+        started = time.time()
+        try:
+            # Prioridade de lote: deixa parte do limite de taxa livre para quem usa a interface
+            with trace(item["id"][:16]), bypass_cache(self.fresh), request_priority(BATCH), \
+                    model_profile(self.profile):
+                result = run_pipeline(item["product"], stages=self.stages)
+            # Arquivos avulsos: o CSS otimizado vai inline (não há /s/assets para servi-lo)
+            html_paths = [os.path.relpath(self._write_html(item, page.inline(), n), self.output_dir)
+                          for n, page in enumerate(result.variants, 1)]
+            entry = {
+                "id": item["id"], "product": item["product"], "status": "ok",
+                "html": html_paths[0],
+                "run_id": result.run_id,
+                "seconds": round(result.total, 3),
+                "timings": {t.name: round(t.duration, 3) for t in result.timings},
+            }
+            if len(html_paths) > 1:
+                entry["variants"] = html_paths
+        except Exception as e:
+            entry = {"id": item["id"], "product": item["product"], "status": "error",
+                     "error": str(e), "seconds": round(time.time() - started, 3)}
+        self._write_result(entry)
+        return entry
+
+    def run(self, items: list, retry_failed: bool = True) -> dict:
+        done = completed_ids(self.results_path, retry_failed)
+        pending = [item for item in items if item["id"] not in done]
+        total = len(pending)
+        print(f"📦 {len(items)} produtos no arquivo, {len(items) - total} já concluídos, {total} a processar")
+
+        counts = {"ok": 0, "error": 0}
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self._process, item) for item in pending]
+            for n, future in enumerate(as_completed(futures), 1):
+                entry = future.result()
+                counts[entry["status"]] += 1
+                elapsed = time.time() - start
+                rate = n / elapsed if elapsed else 0.0
+                eta = (total - n) / rate if rate else 0.0
+                icon = "✅" if entry["status"] == "ok" else "❌"
+                print(f"{icon} [{n}/{total}] {entry['product']} ({entry['seconds']:.1f}s)"
+                      f" | {rate * 60:.1f} produtos/min | ETA {int(eta // 60):02d}:{int(eta % 60):02d}")
+
+        elapsed = time.time() - start
+        print(f"\n🏁 Lote finalizado em {elapsed:.1f}s: {counts['ok']} ok, {counts['error']} com erro")
+        return {**counts, "seconds": elapsed}
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera e-commerces em lote a partir de um CSV/JSONL.")
+    parser.add_argument("input", help="arquivo .csv (coluna 'product') ou .jsonl (campo 'product')")
+    parser.add_argument("--output", default="batch_output", help="diretório de saída")
+    parser.add_argument("--concurrency", type=int, default=4, help="produtos processados em paralelo")
+    parser.add_argument("--fresh", action="store_true", help="ignora o cache de respostas")
+    parser.add_argument("--mode", choices=("staged", "fused"),
+                        help="fused: contexto, persona, UX e produtos numa só chamada (padrão: PIPELINE_MODE)")
+    parser.add_argument("--variants", type=int, default=1,
+                        help="layouts por produto (especificação e código rodam uma vez por variante)")
+    parser.add_argument("--profile", choices=tuple(MODEL_PROFILES),
+                        help="perfil de modelos dos agentes (padrão: MODEL_PROFILE)")
+    parser.add_argument("--skip-failed", action="store_true",
+                        help="ao retomar, não tenta de novo os produtos que falharam")
+    args = parser.parse_args()
+
+    items = read_products(args.input)
+    runner = BatchRunner(args.output, concurrency=args.concurrency, fresh=args.fresh, mode=args.mode,
+                         variants=args.variants, profile=args.profile)
+    summary = runner.run(items, retry_failed=not args.skip_failed)
+    # Lotes grandes geram muitas imagens: aplica a cota de disco antes de sair
+    image_store.collect()
+    artifact_store.collect()
+    raise SystemExit(1 if summary["error"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Compara o custo de cada geração simultânea nos dois caminhos de execução:
+"sync" (run_pipeline: uma thread por requisição, como no Flask, mais as
+threads das etapas) e "async" (arun_pipeline com AsyncOpenAI, como no
+servidor ASGI). Cada modo roda num processo separado contra o servidor fake
+da OpenAI; o processo mede o pico de threads e de memória residente (RSS)
+durante as gerações e o relatório divide o acréscimo pelo número de
+gerações simultâneas.
+
+Uso:
+    python -m benchmarks.concurrency --users 10,50,100
+    python -m benchmarks.concurrency --users 50 --chat-latency fixed:1.0 --json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.load_test import DEFAULT_PRODUCTS
+
+MODES = ("sync", "async")
+
+def prepare_environment(base_url: str, workdir: str) -> None:
+    """Configura o ambiente ANTES de importar o pipeline (clientes e cache são criados na importação)."""
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "sk-fake-benchmark"
+    # Sem cache, artefatos e limite de taxa: mede só o modelo de execução
+    os.environ["CACHE_ENABLED"] = "0"
+    os.environ["CACHE_DIR"] = os.path.join(workdir, ".cache")
+    os.environ["ARTIFACTS_ENABLED"] = "0"
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+    os.environ["RATE_LIMIT_DB_PATH"] = os.path.join(workdir, "ratelimit.sqlite3")
+
+def process_status() -> dict:
+    """Threads do processo e memória residente (MB), lidas de /proc quando disponível."""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return {"threads": int(fields["Threads"]), "rss_mb": int(fields["VmRSS"].split()[0]) / 1024}
+    except OSError:
+        import resource
+        # Sem /proc (macOS): só threads Python e o pico de RSS do processo
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"threads": threading.active_count(), "rss_mb": rss / (1024 * 1024 if sys.platform == "darwin" else 1024)}
+
+class PeakSampler:
+    """Amostra threads e RSS em segundo plano e guarda o maior valor visto."""
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = process_status()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            status = process_status()
+            self.peak = {key: max(self.peak[key], status[key]) for key in status}
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def run_sync(products: list) -> None:
+    from pipeline import run_pipeline
+    # Uma thread por requisição, como o servidor Flask com threaded=True
+    with ThreadPoolExecutor(max_workers=len(products)) as executor:
+        list(executor.map(run_pipeline, products))
+
+def run_async(products: list) -> None:
+    from pipeline import arun_pipeline
+
+    async def main():
+        await asyncio.gather(*(arun_pipeline(product) for product in products))
+    asyncio.run(main())
+
+def worker(mode: str, users: int) -> dict:
+    """Roda `users` gerações simultâneas no modo pedido (dentro do processo filho)."""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+    import pipeline  # noqa: F401 (importa antes de medir a linha de base)
+    products = [DEFAULT_PRODUCTS[i % len(DEFAULT_PRODUCTS)] for i in range(users)]
+
+    baseline = process_status()
+    start = time.perf_counter()
+    with PeakSampler() as sampler:
+        (run_sync if mode == "sync" else run_async)(products)
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "users": users,
+        "total": elapsed,
+        "baseline": baseline,
+        "peak": sampler.peak,
+        "threads_per_request": (sampler.peak["threads"] - baseline["threads"]) / users,
+        "rss_mb_per_request": (sampler.peak["rss_mb"] - baseline["rss_mb"]) / users,
+    }
+
+def run_worker_process(mode: str, users: int, base_url: str, verbose: bool) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"ecommerce-{mode}-")
+    env = dict(os.environ)
+    prepare_environment(base_url, workdir)
+    env.update({k: os.environ[k] for k in ("OPENAI_BASE_URL", "OPENAI_API_KEY", "CACHE_ENABLED", "CACHE_DIR",
+                                           "ARTIFACTS_ENABLED", "RATE_LIMIT_ENABLED", "RATE_LIMIT_DB_PATH")})
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [project_root, env.get("PYTHONPATH")]))
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.concurrency", "--worker", mode, "--users", str(users)]
+        + (["--verbose"] if verbose else []),
+        cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    )
+    if verbose:
+        print(proc.stderr, file=sys.stderr)
+    # A última linha da saída é o resultado em JSON (os logs dos agentes vêm antes)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def print_report(results: list) -> None:
+    print(f"\n📊 Gerações simultâneas: sync (threads) x async (event loop)")
+    print(f"   {'modo':<8}{'usuários':>10}{'total (s)':>12}{'pico threads':>14}{'threads/req':>13}"
+          f"{'pico RSS MB':>13}{'MB/req':>9}")
+    for r in results:
+        print(f"   {r['mode']:<8}{r['users']:>10}{r['total']:>12.2f}{r['peak']['threads']:>14}"
+              f"{r['threads_per_request']:>13.2f}{r['peak']['rss_mb']:>13.1f}{r['rss_mb_per_request']:>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória e threads por geração simultânea: sync x async.")
+    parser.add_argument("--users", default="10,50", help="gerações simultâneas (lista separada por vírgulas)")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--chat-latency", default="lognormal:1.0,0.3")
+    parser.add_argument("--image-latency", default="lognormal:4.0,0.3")
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    parser.add_argument("--verbose", action="store_true", help="mostra os logs dos agentes")
+    parser.add_argument("--worker", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+        with quiet:
+            result = worker(args.worker, int(args.users))
+        print(json.dumps(result))
+        return
+
+    fake = FakeOpenAIServer(chat_latency=args.chat_latency, image_latency=args.image_latency).start()
+    print(f"🧪 Servidor fake da OpenAI em {fake.base_url}", file=sys.stderr)
+    results = []
+    try:
+        for users in (int(u) for u in args.users.split(",")):
+            for mode in args.modes.split(","):
+                print(f"   {mode}: {users} gerações simultâneas...", file=sys.stderr)
+                results.append(run_worker_process(mode, users, fake.base_url, args.verbose))
+    finally:
+        fake.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+if __name__ == "__main__":
+    main()
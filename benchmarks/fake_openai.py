@@ -0,0 +1,277 @@
+"""
+Servidor local que imita os endpoints da OpenAI usados pelos agentes
+(chat.completions, com e sem streaming, e images.generate), com latência
+configurável e respostas prontas. Permite medir o app sem custo de API.
+
+Uso isolado:
+    python -m benchmarks.fake_openai --port 8100 --chat-latency lognormal:1.5,0.4
+e então rode o app com OPENAI_BASE_URL=http://127.0.0.1:8100/v1
+"""
+import argparse
+import json
+import math
+import random
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Distribuições de latência ---
+
+def parse_latency(spec: str):
+    """
+    Converte "fixed:1.0", "uniform:0.5,2", "normal:1,0.2" ou
+    "lognormal:1.5,0.4" (mediana, sigma) numa função que sorteia segundos.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Distribuição de latência desconhecida: {spec}")
+
+# --- Respostas prontas ---
+
+CANNED_RESPONSES = [
+    ("CONTEXTO, PERSONA, UX E PRODUTOS EM JSON", json.dumps({
+        "contexto": "Fones de ouvido sem fio são procurados por quem quer liberdade de movimento, "
+                    "boa qualidade de áudio e bateria para o dia todo, no trabalho ou nos treinos.",
+        "persona": "Persona: Ana, 29 anos, profissional de tecnologia que trabalha remotamente. "
+                   "Busca conforto, boa qualidade de áudio e bateria duradoura. Dores: fios que "
+                   "enroscam, ruído do ambiente. Oportunidades: destacar cancelamento de ruído.",
+        "ux": "Tipografia limpa (Montserrat nos títulos, Open Sans no corpo), paleta azul e laranja, "
+              "imagens grandes em fundo branco, grid de 3 colunas e botão de compra em destaque.",
+        "produtos": [
+            {"nome": "Fone Aurora", "descricao": "Fone bluetooth com cancelamento de ruído", "preco": 199.99},
+            {"nome": "Fone Brisa", "descricao": "Fone esportivo resistente ao suor", "preco": 129.90},
+            {"nome": "Fone Cosmo", "descricao": "Headset over-ear com graves profundos", "preco": 299.00},
+        ],
+    }, ensure_ascii=False)),
+    ("EXATAMENTE 3 produtos", json.dumps({"produtos": [
+        {"nome": "Fone Aurora", "descricao": "Fone bluetooth com cancelamento de ruído", "preco": 199.99},
+        {"nome": "Fone Brisa", "descricao": "Fone esportivo resistente ao suor", "preco": 129.90},
+        {"nome": "Fone Cosmo", "descricao": "Headset over-ear com graves profundos", "preco": 299.00},
+    ]}, ensure_ascii=False)),
+    ("GERAR O CODIGO HTML/CSS", json.dumps({"html": (
+        "<style>\n"
+        "@import url('https://fonts.googleapis.com/css2?family=Montserrat:wght@400;700&display=swap');\n"
+        "body { font-family: 'Montserrat', sans-serif; background: #F5F5F5; color: #222222; }\n"
+        "header { background: #1A237E; color: #FFFFFF; padding: 24px; }\n"
+        ".grid { display: grid; grid-template-columns: repeat(3, 1fr); gap: 24px; }\n"
+        ".card { background: #FFFFFF; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,.1); }\n"
+        ".button { background: #FF6F00; color: #FFFFFF; padding: 12px 24px; }\n"
+        "</style>\n"
+        "<header><h1>Loja de Fones</h1></header>\n"
+        "<main class=\"grid\">\n"
+        "<div class=\"card\"><h2>Fone Aurora</h2><p>Fone bluetooth com cancelamento de ruído</p>"
+        "<span>$199.99</span><a class=\"button\">Comprar</a></div>\n"
+        "</main>\n"
+        "<footer><p>&copy; Loja de Fones</p></footer>"
+    )}, ensure_ascii=False)),
+    ("ESPECIFICAÇÃO TÉCNICA", json.dumps({
+        "paleta": {"primaria": "#1A237E", "secundaria": "#3949AB", "destaque": "#FF6F00",
+                   "fundo": "#F5F5F5", "texto": "#222222"},
+        "tipografia": {"fonte_titulos": "Montserrat", "fonte_corpo": "Open Sans", "tamanho_h1": "48px",
+                       "tamanho_h2": "32px", "tamanho_corpo": "16px", "peso_titulos": 700, "peso_corpo": 400},
+        "layout": {"cabecalho": "fixo, fundo na cor primária", "secao_produtos": "grid de 3 colunas",
+                   "rodape": "fundo escuro com links", "espacamento": "padding 24px, gap 24px",
+                   "largura_maxima": "1200px"},
+        "componentes": {"botoes": "laranja com hover escurecido", "cards": "sombra suave, elevam no hover",
+                        "imagens": "object-fit cover, border-radius 8px"},
+        "efeitos": {"transicoes": "0.3s ease", "hover": "botões escurecem, cards sobem 4px",
+                    "breakpoints": ["768px", "1024px"]},
+    }, ensure_ascii=False)),
+]
+
+DEFAULT_RESPONSE = (
+    "Persona: Ana, 29 anos, profissional de tecnologia que trabalha remotamente. "
+    "Busca conforto, boa qualidade de áudio e bateria duradoura. Dores: fios que "
+    "enroscam, ruído do ambiente. Oportunidades: destacar cancelamento de ruído, "
+    "tipografia limpa, paleta azul e laranja, imagens grandes em fundo branco."
+)
+
+def canned_response(prompt: str, responses=None) -> str:
+    for marker, text in (responses or CANNED_RESPONSES):
+        if marker in prompt:
+            return text
+    return DEFAULT_RESPONSE
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def make_png(width: int = 64, height: int = 64, gray: int = 230) -> bytes:
+    """Gera um PNG válido de uma cor só, sem depender de bibliotecas de imagem."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    row = b"\x00" + bytes([gray]) * (width * 3)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(row * height)) + chunk(b"IEND", b""))
+
+# --- Servidor ---
+
+class FakeOpenAIServer:
+    """
+    Sobe o servidor numa thread. `chat_latency`/`image_latency` aceitam o
+    mesmo formato de `parse_latency`; `model_latency` ({"gpt-4o-mini": "fixed:0.4"})
+    troca a latência do chat para modelos específicos; `failure_rate` devolve
+    erros 500 aleatórios.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 chat_latency: str = "lognormal:1.0,0.3", image_latency: str = "lognormal:4.0,0.3",
+                 failure_rate: float = 0.0, image_size: int = 1024, responses=None,
+                 model_latency: dict = None):
+        self.chat_latency = parse_latency(chat_latency)
+        self.model_latency = {model: parse_latency(spec) for model, spec in (model_latency or {}).items()}
+        self.image_latency = parse_latency(image_latency)
+        self.failure_rate = failure_rate
+        self.responses = responses
+        self.png = make_png(image_size, image_size)
+        self.requests = {"chat": 0, "images": 0, "files": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.requests[kind] += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, payload: dict) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _fail(self) -> bool:
+                if random.random() < server.failure_rate:
+                    server._count("errors")
+                    self._json(500, {"error": {"message": "falha simulada", "type": "server_error"}})
+                    return True
+                return False
+
+            def do_GET(self):
+                if self.path.startswith("/files/"):
+                    server._count("files")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "image/png")
+                    self.send_header("Content-Length", str(len(server.png)))
+                    self.end_headers()
+                    self.wfile.write(server.png)
+                else:
+                    self._json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.endswith("/chat/completions"):
+                    server._count("chat")
+                    if not self._fail():
+                        self._chat(payload)
+                elif self.path.endswith("/images/generations"):
+                    server._count("images")
+                    time.sleep(server.image_latency())
+                    if not self._fail():
+                        host, port = server.httpd.server_address[:2]
+                        self._json(200, {
+                            "created": int(time.time()),
+                            "data": [{"url": f"http://{host}:{port}/files/{uuid.uuid4().hex}.png"}
+                                     for _ in range(payload.get("n", 1))],
+                        })
+                else:
+                    self._json(404, {"error": {"message": "not found"}})
+
+            def _chat(self, payload: dict) -> None:
+                prompt = "\n".join(str(m.get("content", "")) for m in payload.get("messages", []))
+                text = canned_response(prompt, server.responses)
+                model = payload.get("model", "gpt-4o")
+                usage = {"prompt_tokens": estimate_tokens(prompt), "completion_tokens": estimate_tokens(text)}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                latency = server.model_latency.get(model, server.chat_latency)()
+                n = payload.get("n", 1)
+                base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": model}
+
+                if not payload.get("stream"):
+                    time.sleep(latency)
+                    choices = [{"index": i, "message": {"role": "assistant", "content": text},
+                                "finish_reason": "stop"} for i in range(n)]
+                    self._json(200, {**base, "object": "chat.completion", "choices": choices, "usage": usage})
+                    return
+
+                # Streaming: ~30% da latência até o primeiro token, o resto distribuído nos trechos
+                pieces = [text[i:i + 20] for i in range(0, len(text), 20)] or [""]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def send(data: str) -> None:
+                    raw = f"data: {data}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+                    self.wfile.flush()
+
+                time.sleep(latency * 0.3)
+                for piece in pieces:
+                    chunk = {**base, "object": "chat.completion.chunk",
+                             "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    send(json.dumps(chunk))
+                    time.sleep(latency * 0.7 / len(pieces))
+                send(json.dumps({**base, "object": "chat.completion.chunk",
+                                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+                if (payload.get("stream_options") or {}).get("include_usage"):
+                    send(json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}))
+                send("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita a API da OpenAI.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--chat-latency", default="lognormal:1.0,0.3")
+    parser.add_argument("--image-latency", default="lognormal:4.0,0.3")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.host, args.port, args.chat_latency, args.image_latency, args.failure_rate)
+    print(f"🧪 Fake OpenAI em {server.base_url} (Ctrl+C para sair)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
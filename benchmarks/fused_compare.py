@@ -0,0 +1,172 @@
+"""
+Compara o pipeline por etapas ("staged") com o modo fundido ("fused") nos
+mesmos produtos: latência total e até os produtos ficarem prontos, chamadas à
+OpenAI, tokens de prompt/resposta e as diferenças entre as saídas (tamanho dos
+textos, similaridade e produtos sugeridos).
+
+Por padrão usa o servidor fake da OpenAI (sem custo). Com --live usa a API real
+configurada no .env, para comparar a qualidade das respostas de verdade.
+
+Uso:
+    python -m benchmarks.fused_compare --chat-latency lognormal:1.5,0.3
+    python -m benchmarks.fused_compare --live --products produtos.txt --json
+"""
+import argparse
+import contextlib
+import difflib
+import json
+import os
+import sys
+import tempfile
+import time
+from statistics import mean
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.load_test import DEFAULT_PRODUCTS
+
+MODES = ("staged", "fused")
+TEXT_OUTPUTS = ("context", "persona", "ux", "specification", "code")
+
+def prepare_environment(workdir: str, base_url: str = None) -> None:
+    """Configura o ambiente ANTES de importar o pipeline (cliente e cache são criados na importação)."""
+    if base_url:
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ["OPENAI_API_KEY"] = "sk-fake-benchmark"
+    # Sem cache: os dois modos precisam chamar a API de verdade
+    os.environ["CACHE_ENABLED"] = "0"
+    os.environ["CACHE_DIR"] = os.path.join(workdir, ".cache")
+    os.environ["ARTIFACTS_ENABLED"] = "0"
+    os.environ["RATE_LIMIT_DB_PATH"] = os.path.join(workdir, "ratelimit.sqlite3")
+    os.environ["IMAGE_STORE_DB_PATH"] = os.path.join(workdir, "images.sqlite3")
+    os.environ["SIMILARITY_DB_PATH"] = os.path.join(workdir, "similarity.sqlite3")
+    os.environ["JOB_WORKERS"] = "0"
+
+def _usage():
+    from metrics import llm_calls, llm_tokens
+    return {
+        "calls": llm_calls.total(),
+        "prompt_tokens": llm_tokens.total(kind="prompt"),
+        "completion_tokens": llm_tokens.total(kind="completion"),
+    }
+
+def run_once(product: str, mode: str) -> dict:
+    """Roda o pipeline uma vez e mede tempo, chamadas e tokens daquela execução."""
+    from pipeline import FUSED_OUTPUTS, run_pipeline, stages_for
+
+    before = _usage()
+    start = time.perf_counter()
+    result = run_pipeline(product, stages=stages_for(mode))
+    elapsed = time.perf_counter() - start
+    after = _usage()
+    return {
+        "total": elapsed,
+        # Momento em que contexto, persona, UX e produtos estão todos prontos
+        "upstream": max(t.finish for t in result.timings if t.name in FUSED_OUTPUTS),
+        **{k: int(after[k] - before[k]) for k in after},
+        "outputs": result.outputs,
+    }
+
+def compare_outputs(staged: dict, fused: dict) -> dict:
+    """Diferenças entre as saídas dos dois modos para o mesmo produto."""
+    diff = {}
+    for name in TEXT_OUTPUTS:
+        a, b = staged[name].text, fused[name].text
+        diff[name] = {
+            "staged_chars": len(a),
+            "fused_chars": len(b),
+            "similarity": round(difflib.SequenceMatcher(None, a, b).ratio(), 3),
+        }
+    names_a = {p.nome.lower() for p in staged["products"].items}
+    names_b = {p.nome.lower() for p in fused["products"].items}
+    diff["products"] = {
+        "staged": len(names_a),
+        "fused": len(names_b),
+        "same_names": len(names_a & names_b),
+    }
+    return diff
+
+def run_comparison(products: list, repeat: int = 1) -> dict:
+    runs = {mode: [] for mode in MODES}
+    differences = {}
+    for product in products:
+        for _ in range(repeat):
+            outputs = {}
+            for mode in MODES:
+                run = run_once(product, mode)
+                outputs[mode] = run.pop("outputs")
+                runs[mode].append(run)
+            differences[product] = compare_outputs(outputs["staged"], outputs["fused"])
+
+    summary = {
+        mode: {key: mean(r[key] for r in mode_runs) for key in mode_runs[0]}
+        for mode, mode_runs in runs.items()
+    }
+    return {"products": products, "repeat": repeat, "summary": summary, "differences": differences}
+
+def print_report(report: dict) -> None:
+    summary = report["summary"]
+    print(f"\n📊 {len(report['products'])} produtos x {report['repeat']} execução(ões) por modo (médias)")
+    print(f"   {'':<20}{'staged':>12}{'fused':>12}{'variação':>12}")
+    rows = (("total (s)", "total"), ("até produtos (s)", "upstream"), ("chamadas LLM", "calls"),
+            ("tokens prompt", "prompt_tokens"), ("tokens resposta", "completion_tokens"))
+    for label, key in rows:
+        a, b = summary["staged"][key], summary["fused"][key]
+        change = f"{(b - a) / a * 100:+.0f}%" if a else "-"
+        print(f"   {label:<20}{a:>12.2f}{b:>12.2f}{change:>12}")
+
+    print("\n   Diferenças nas saídas (caracteres staged → fused, similaridade):")
+    for product, diff in report["differences"].items():
+        print(f"   - {product}")
+        for name in TEXT_OUTPUTS:
+            d = diff[name]
+            print(f"       {name:<14} {d['staged_chars']:>6} → {d['fused_chars']:<6} sim {d['similarity']:.2f}")
+        p = diff["products"]
+        print(f"       {'products':<14} {p['staged']} → {p['fused']} ({p['same_names']} com o mesmo nome)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o pipeline por etapas com o modo fundido.")
+    parser.add_argument("--products", help="arquivo com um produto por linha")
+    parser.add_argument("--limit", type=int, default=3, help="quantos produtos da lista usar")
+    parser.add_argument("--repeat", type=int, default=1, help="execuções por produto e modo")
+    parser.add_argument("--chat-latency", default="lognormal:1.0,0.3")
+    parser.add_argument("--image-latency", default="fixed:0.5")
+    parser.add_argument("--live", action="store_true", help="usa a API real da OpenAI (tem custo)")
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    parser.add_argument("--verbose", action="store_true", help="mostra os logs dos agentes")
+    args = parser.parse_args()
+
+    products = DEFAULT_PRODUCTS
+    if args.products:
+        with open(args.products, encoding="utf-8") as f:
+            products = [line.strip() for line in f if line.strip()]
+    products = products[:args.limit]
+
+    fake = None
+    if not args.live:
+        fake = FakeOpenAIServer(chat_latency=args.chat_latency, image_latency=args.image_latency).start()
+    workdir = tempfile.mkdtemp(prefix="ecommerce-fused-")
+    prepare_environment(workdir, fake.base_url if fake else None)
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+    import pipeline  # noqa: F401 (importa com o ambiente já configurado)
+    # As imagens baixadas vão para o diretório temporário, não para o projeto
+    os.chdir(workdir)
+
+    target = fake.base_url if fake else "API real da OpenAI"
+    print(f"🧪 Comparando staged x fused em {target} | arquivos em {workdir}", file=sys.stderr)
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    try:
+        with quiet:
+            report = run_comparison(products, args.repeat)
+    finally:
+        if fake:
+            fake.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
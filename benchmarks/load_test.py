@@ -0,0 +1,218 @@
+"""
+Teste de carga offline: sobe o servidor fake da OpenAI, aponta o cliente de
+chat_agents.py para ele e dispara N usuários simultâneos contra o app Flask.
+Reporta latência p50/p95/p99, requisições por segundo e o tempo por etapa
+(lido do cabeçalho Server-Timing).
+
+Uso:
+    python -m benchmarks.load_test --users 10 --requests 50
+    python -m benchmarks.load_test --users 20 --chat-latency fixed:0.5 --json
+"""
+import argparse
+import contextlib
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+DEFAULT_PRODUCTS = [
+    "Fones de ouvido wireless",
+    "Cafeteira italiana",
+    "Tênis de corrida",
+    "Mochila para notebook",
+    "Luminária de mesa LED",
+    "Garrafa térmica",
+]
+
+# Usado só quando o projeto não tem templates/base.html
+FALLBACK_BASE_TEMPLATE = "<!DOCTYPE html><html><body>{{ generated_content|safe }}</body></html>"
+
+def prepare_environment(base_url: str, workdir: str, cache: bool) -> None:
+    """Configura o ambiente ANTES de importar o app (cliente, cache e jobs são criados na importação)."""
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "sk-fake-benchmark"
+    os.environ["CACHE_ENABLED"] = "1" if cache else "0"
+    os.environ["CACHE_DIR"] = os.path.join(workdir, ".cache")
+    os.environ["JOB_DB_PATH"] = os.path.join(workdir, "jobs.sqlite3")
+    os.environ["ARTIFACTS_DB_PATH"] = os.path.join(workdir, "artifacts.sqlite3")
+    os.environ["RATE_LIMIT_DB_PATH"] = os.path.join(workdir, "ratelimit.sqlite3")
+    os.environ["IMAGE_STORE_DB_PATH"] = os.path.join(workdir, "images.sqlite3")
+    os.environ["SIMILARITY_DB_PATH"] = os.path.join(workdir, "similarity.sqlite3")
+    # Os produtos se repetem entre as requisições: reaproveitar persona/UX conta como cache
+    os.environ["SIMILARITY_ENABLED"] = "1" if cache else "0"
+    os.environ["JOB_WORKERS"] = "0"
+
+def load_app(workdir: str):
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+    import app as app_module
+    from jinja2 import ChoiceLoader, DictLoader
+
+    flask_app = app_module.app
+    flask_app.jinja_loader  # garante que o loader padrão foi criado
+    flask_app.jinja_env.loader = ChoiceLoader([
+        flask_app.jinja_env.loader, DictLoader({"base.html": FALLBACK_BASE_TEMPLATE})
+    ])
+    # As imagens baixadas vão para o diretório temporário, não para o projeto
+    os.chdir(workdir)
+    return flask_app
+
+def serve(flask_app):
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def parse_server_timing(header: str) -> dict:
+    timings = {}
+    for entry in filter(None, (e.strip() for e in (header or "").split(","))):
+        name, _, params = entry.partition(";")
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "dur":
+                timings[name.strip()] = float(value) / 1000
+    return timings
+
+def percentile(values: list, p: float) -> float:
+    """Percentil pelo método nearest-rank (p95 de 20 amostras = 19ª menor)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def run_load(url: str, users: int, total_requests: int, products: list) -> dict:
+    lock = threading.Lock()
+    counter = {"next": 0}
+    latencies, errors = [], 0
+    stages = defaultdict(list)
+
+    def user_loop():
+        nonlocal errors
+        session = requests.Session()
+        while True:
+            with lock:
+                if counter["next"] >= total_requests:
+                    return
+                product = products[counter["next"] % len(products)]
+                counter["next"] += 1
+            start = time.perf_counter()
+            try:
+                response = session.post(url + "/", data={"product": product}, timeout=600)
+                ok = response.status_code == 200 and "Server-Timing" in response.headers
+            except requests.RequestException:
+                response, ok = None, False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if not ok:
+                    errors += 1
+                    continue
+                latencies.append(elapsed)
+                for stage, duration in parse_server_timing(response.headers["Server-Timing"]).items():
+                    stages[stage].append(duration)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        for _ in range(users):
+            executor.submit(user_loop)
+    wall = time.perf_counter() - start
+
+    return {
+        "users": users,
+        "requests": total_requests,
+        "errors": errors,
+        "wall_seconds": wall,
+        "rps": len(latencies) / wall if wall else 0.0,
+        "latency": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+        },
+        "stages": {
+            name: {"mean": sum(v) / len(v), "p95": percentile(v, 95)}
+            for name, v in stages.items()
+        },
+    }
+
+def resilience_counters() -> dict:
+    """Quantas vezes as novas tentativas, o hedge e os prazos entraram em ação."""
+    from metrics import llm_deadline_exceeded, llm_hedges, llm_retries
+    return {
+        "retries": int(llm_retries.total()),
+        "hedges_fired": int(llm_hedges.total(event="fired")),
+        "hedges_won": int(llm_hedges.total(event="won")),
+        "deadline_exceeded": int(llm_deadline_exceeded.total()),
+    }
+
+def print_report(report: dict) -> None:
+    lat = report["latency"]
+    print(f"\n📈 {report['requests']} requisições, {report['users']} usuários simultâneos"
+          f" ({report['errors']} erros) em {report['wall_seconds']:.1f}s")
+    print(f"   Throughput: {report['rps']:.2f} req/s")
+    print(f"   Latência ponta a ponta: p50 {lat['p50']:.2f}s | p95 {lat['p95']:.2f}s"
+          f" | p99 {lat['p99']:.2f}s | média {lat['mean']:.2f}s")
+    if report["stages"]:
+        print("   Etapas (média / p95):")
+        for name, values in report["stages"].items():
+            print(f"     - {name:<14} {values['mean']:.2f}s / {values['p95']:.2f}s")
+    if "fake_openai" in report:
+        print(f"   Chamadas ao fake OpenAI: {report['fake_openai']}")
+    if "resilience" in report:
+        print(f"   Resiliência: {report['resilience']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga offline do gerador de e-commerce.")
+    parser.add_argument("--users", type=int, default=5, help="usuários simultâneos")
+    parser.add_argument("--requests", type=int, default=20, help="total de gerações")
+    parser.add_argument("--chat-latency", default="lognormal:1.0,0.3")
+    parser.add_argument("--image-latency", default="lognormal:4.0,0.3")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--products", help="arquivo com um produto por linha")
+    parser.add_argument("--cache", action="store_true", help="mantém o cache de respostas ligado")
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    parser.add_argument("--verbose", action="store_true", help="mostra os logs dos agentes")
+    args = parser.parse_args()
+
+    products = DEFAULT_PRODUCTS
+    if args.products:
+        with open(args.products, encoding="utf-8") as f:
+            products = [line.strip() for line in f if line.strip()]
+
+    fake = FakeOpenAIServer(chat_latency=args.chat_latency, image_latency=args.image_latency,
+                            failure_rate=args.failure_rate).start()
+    workdir = tempfile.mkdtemp(prefix="ecommerce-bench-")
+    prepare_environment(fake.base_url, workdir, args.cache)
+    flask_app = load_app(workdir)
+    server, url = serve(flask_app)
+
+    print(f"🧪 Fake OpenAI em {fake.base_url} | app em {url} | arquivos em {workdir}", file=sys.stderr)
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    try:
+        with quiet:
+            report = run_load(url, args.users, args.requests, products)
+        report["fake_openai"] = dict(fake.requests)
+        report["resilience"] = resilience_counters()
+    finally:
+        server.shutdown()
+        fake.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Compara os perfis de modelos ("quality", "balanced", "fast" e os que forem
+criados em routing.MODEL_PROFILES) nos mesmos produtos: latência total e por
+etapa, chamadas, tokens, custo estimado e a taxa de respostas que passam na
+validação do schema (ex.: quantas vezes o BusinessAgent devolve exatamente 3
+produtos válidos) e quantas correções foram pedidas. Serve para decidir, com
+dados, quais etapas podem ir para um modelo mais rápido.
+
+Por padrão usa o servidor fake da OpenAI (sem custo), com o gpt-4o-mini mais
+rápido que o gpt-4o (--model-latency); as respostas do fake estão sempre no
+formato certo, então a taxa de parse só diz algo com --live.
+
+Uso:
+    python -m benchmarks.model_profiles
+    python -m benchmarks.model_profiles --live --limit 5 --repeat 2 --json
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from statistics import mean
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.fused_compare import prepare_environment
+from benchmarks.load_test import DEFAULT_PRODUCTS
+
+PARSED_AGENTS = ("BusinessAgent", "FusedUpstreamAgent", "SpecificationAgent", "CodeGeneratorAgent")
+PARSE_OUTCOMES = ("ok", "repaired", "invalid")
+
+def _usage() -> dict:
+    from metrics import llm_calls, llm_cost, llm_parse, llm_tokens
+    usage = {
+        "calls": llm_calls.total(),
+        "prompt_tokens": llm_tokens.total(kind="prompt"),
+        "completion_tokens": llm_tokens.total(kind="completion"),
+        "cost": llm_cost.total(),
+    }
+    for agent in PARSED_AGENTS:
+        for outcome in PARSE_OUTCOMES:
+            usage[f"{agent}:{outcome}"] = llm_parse.total(agent=agent, outcome=outcome)
+    return usage
+
+def run_once(product: str, profile: str, mode: str) -> dict:
+    """Roda o pipeline uma vez no perfil pedido e mede tempo, chamadas, tokens, custo e parse."""
+    from pipeline import run_pipeline, stages_for
+    from routing import model_profile
+
+    before = _usage()
+    start = time.perf_counter()
+    try:
+        with model_profile(profile):
+            result = run_pipeline(product, stages=stages_for(mode))
+        stages, error = {t.name: t.duration for t in result.timings}, None
+    except Exception as e:
+        stages, error = {}, str(e)
+    elapsed = time.perf_counter() - start
+    after = _usage()
+    return {"total": elapsed, "stages": stages, "error": error,
+            **{key: after[key] - before[key] for key in after}}
+
+def summarize(runs: list) -> dict:
+    ok = [r for r in runs if r["error"] is None]
+    summary = {
+        "runs": len(runs),
+        "errors": len(runs) - len(ok),
+        "total": mean(r["total"] for r in ok) if ok else 0.0,
+        **{key: mean(r[key] for r in runs)
+           for key in ("calls", "prompt_tokens", "completion_tokens", "cost")},
+        "stages": {name: mean(r["stages"][name] for r in ok if name in r["stages"])
+                   for name in dict.fromkeys(name for r in ok for name in r["stages"])},
+        "parse": {},
+    }
+    for agent in PARSED_AGENTS:
+        counts = {outcome: int(sum(r[f"{agent}:{outcome}"] for r in runs)) for outcome in PARSE_OUTCOMES}
+        responses = sum(counts.values())
+        if responses:
+            # Fração das respostas que validaram (de primeira ou depois de uma correção)
+            summary["parse"][agent] = {**counts, "rate": (counts["ok"] + counts["repaired"]) / responses}
+    return summary
+
+def run_benchmark(products: list, profiles: list, mode: str, repeat: int = 1) -> dict:
+    from routing import model_for, model_profile
+
+    runs = {profile: [] for profile in profiles}
+    for product in products:
+        for _ in range(repeat):
+            # Perfis intercalados: variações da API afetam todos igualmente
+            for profile in profiles:
+                runs[profile].append(run_once(product, profile, mode))
+
+    models = {}
+    for profile in profiles:
+        with model_profile(profile):
+            models[profile] = {agent: model_for(agent) for agent in (
+                "TextGeneratorAgent", "UXResearchAgent", "UXDesignerAgent", "BusinessAgent",
+                "FusedUpstreamAgent", "SpecificationAgent", "CodeGeneratorAgent")}
+    return {"products": products, "repeat": repeat, "mode": mode, "models": models,
+            "summary": {profile: summarize(profile_runs) for profile, profile_runs in runs.items()}}
+
+def print_report(report: dict) -> None:
+    summary = report["summary"]
+    profiles = list(summary)
+    print(f"\n📊 {len(report['products'])} produtos x {report['repeat']} execução(ões) por perfil"
+          f" (modo {report['mode']}, médias por execução)")
+    print(f"   {'':<22}" + "".join(f"{p:>14}" for p in profiles))
+    rows = (("total (s)", "total", "{:>14.2f}"), ("chamadas LLM", "calls", "{:>14.1f}"),
+            ("tokens prompt", "prompt_tokens", "{:>14.0f}"), ("tokens resposta", "completion_tokens", "{:>14.0f}"),
+            ("custo (USD)", "cost", "{:>14.4f}"), ("execuções com erro", "errors", "{:>14d}"))
+    for label, key, fmt in rows:
+        print(f"   {label:<22}" + "".join(fmt.format(summary[p][key]) for p in profiles))
+
+    print("\n   Respostas válidas no schema (correções pedidas):")
+    agents = dict.fromkeys(agent for p in profiles for agent in summary[p]["parse"])
+    for agent in agents:
+        cells = []
+        for p in profiles:
+            parse = summary[p]["parse"].get(agent)
+            cells.append(f"{parse['rate'] * 100:>8.0f}% ({parse['invalid']:>2})" if parse else f"{'-':>14}")
+        print(f"   {agent:<22}" + "".join(cells))
+
+    print("\n   Latência média por etapa (s):")
+    stages = dict.fromkeys(name for p in profiles for name in summary[p]["stages"])
+    for name in stages:
+        print(f"   {name:<22}" + "".join(
+            f"{summary[p]['stages'][name]:>14.2f}" if name in summary[p]["stages"] else f"{'-':>14}"
+            for p in profiles))
+
+    print("\n   Modelos de cada agente:")
+    for agent in report["models"][profiles[0]]:
+        print(f"   {agent:<22}" + "".join(f"{report['models'][p][agent]:>14}" for p in profiles))
+
+def main():
+    from routing import MODEL_PROFILES
+
+    parser = argparse.ArgumentParser(description="Compara os perfis de modelos dos agentes.")
+    parser.add_argument("--profiles", default=",".join(MODEL_PROFILES), help="perfis separados por vírgulas")
+    parser.add_argument("--mode", choices=("staged", "fused"), default="staged")
+    parser.add_argument("--products", help="arquivo com um produto por linha")
+    parser.add_argument("--limit", type=int, default=3, help="quantos produtos da lista usar")
+    parser.add_argument("--repeat", type=int, default=1, help="execuções por produto e perfil")
+    parser.add_argument("--chat-latency", default="lognormal:1.0,0.3")
+    parser.add_argument("--model-latency", default="gpt-4o-mini=lognormal:0.5,0.3",
+                        help="latência do chat por modelo no servidor fake (modelo=distribuição;...)")
+    parser.add_argument("--image-latency", default="fixed:0.5")
+    parser.add_argument("--live", action="store_true", help="usa a API real da OpenAI (tem custo)")
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    parser.add_argument("--verbose", action="store_true", help="mostra os logs dos agentes")
+    args = parser.parse_args()
+
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    unknown = [p for p in profiles if p not in MODEL_PROFILES]
+    if unknown:
+        parser.error(f"perfis desconhecidos: {', '.join(unknown)}")
+    products = DEFAULT_PRODUCTS
+    if args.products:
+        with open(args.products, encoding="utf-8") as f:
+            products = [line.strip() for line in f if line.strip()]
+    products = products[:args.limit]
+
+    fake = None
+    if not args.live:
+        model_latency = dict(entry.split("=", 1) for entry in args.model_latency.split(";") if entry)
+        fake = FakeOpenAIServer(chat_latency=args.chat_latency, image_latency=args.image_latency,
+                                model_latency=model_latency).start()
+    workdir = tempfile.mkdtemp(prefix="ecommerce-profiles-")
+    prepare_environment(workdir, fake.base_url if fake else None)
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+    import pipeline  # noqa: F401 (importa com o ambiente já configurado)
+    # As imagens baixadas vão para o diretório temporário, não para o projeto
+    os.chdir(workdir)
+
+    target = fake.base_url if fake else "API real da OpenAI"
+    print(f"🧪 Comparando perfis {', '.join(profiles)} em {target} | arquivos em {workdir}", file=sys.stderr)
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    try:
+        with quiet:
+            report = run_benchmark(products, profiles, args.mode, args.repeat)
+    finally:
+        if fake:
+            fake.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Mede o índice de produtos parecidos (similarity.py) em escala: indexa N
+produtos sintéticos e reporta a taxa de inserção, a latência das consultas
+(p50/p95/p99) e quantas variações de produtos já indexados (plural, acento,
+sinônimo, ordem das palavras) são reconhecidas acima do limiar.
+
+Uso:
+    python -m benchmarks.similarity_index --entries 200000
+    python -m benchmarks.similarity_index --entries 50000 --queries 2000 --json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.load_test import percentile
+
+NOUNS = ["fone de ouvido", "cafeteira", "tênis", "mochila", "luminária", "garrafa", "relógio", "cadeira",
+         "mesa", "caneca", "camiseta", "jaqueta", "bolsa", "carregador", "teclado", "mouse", "monitor",
+         "panela", "frigideira", "liquidificador", "ventilador", "travesseiro", "lençol", "toalha", "óculos"]
+ADJECTIVES = ["wireless", "italiana", "de corrida", "para notebook", "de mesa", "térmica", "inteligente",
+              "ergonômica", "dobrável", "de cerâmica", "básica", "impermeável", "de couro", "portátil",
+              "mecânico", "gamer", "antiaderente", "silencioso", "infantil", "premium", "vintage", "compacta"]
+MATERIALS = ["azul", "preta", "branca", "verde", "de bambu", "de aço", "de algodão", "de madeira", "rosa",
+             "cinza", "vermelha", "dourada", "transparente", "fosca", "listrada"]
+
+def synthetic_topic(rng: random.Random, i: int) -> str:
+    parts = [rng.choice(NOUNS), rng.choice(ADJECTIVES), rng.choice(MATERIALS)]
+    # Modelo/coleção: mantém as entradas distintas mesmo com o vocabulário pequeno
+    return " ".join(parts + [f"linha {i % 997} modelo {i // 997}"])
+
+def variation(rng: random.Random, topic: str) -> str:
+    """Mesma ideia com outra grafia: plural, sem acento, sinônimo ou palavras trocadas de ordem."""
+    choice = rng.randrange(4)
+    if choice == 0:
+        return topic.replace("ã", "a").replace("é", "e").replace("ê", "e").replace("ó", "o").upper()
+    if choice == 1:
+        return topic.replace("wireless", "sem fio").replace("notebook", "laptop").replace("de ", "")
+    if choice == 2:
+        words = topic.split()
+        rng.shuffle(words)
+        return " ".join(words)
+    return " ".join(w + "s" if len(w) > 3 and w.isalpha() and not w.endswith("s") else w for w in topic.split())
+
+def run_benchmark(entries: int, queries: int, batch: int = 5000) -> dict:
+    from similarity import SimilarityIndex
+    rng = random.Random(42)
+    index = SimilarityIndex(os.path.join(tempfile.mkdtemp(prefix="ecommerce-similarity-"), "similarity.sqlite3"))
+
+    topics = [synthetic_topic(rng, i) for i in range(entries)]
+    start = time.perf_counter()
+    for offset in range(0, entries, batch):
+        index.add_many((topic, f"run{offset + i}") for i, topic in enumerate(topics[offset:offset + batch]))
+    insert_seconds = time.perf_counter() - start
+
+    def timed_lookups(items):
+        latencies, matches = [], []
+        for item in items:
+            t = time.perf_counter()
+            matches.append(index.lookup(item))
+            latencies.append(time.perf_counter() - t)
+        return latencies, matches
+
+    sample = [rng.choice(topics) for _ in range(queries)]
+    near_latencies, near_matches = timed_lookups([variation(rng, topic) for topic in sample])
+    found = sum(1 for topic, match in zip(sample, near_matches) if match and match.topic == topic)
+    new_latencies, new_matches = timed_lookups(
+        [f"{rng.choice(NOUNS)} {rng.choice(ADJECTIVES)} coleção {rng.randrange(10**6)}" for _ in range(queries)]
+    )
+    latencies = near_latencies + new_latencies
+    return {
+        "entries": entries,
+        "inserts_per_second": entries / insert_seconds,
+        "lookup_p50_ms": percentile(latencies, 50) * 1000,
+        "lookup_p95_ms": percentile(latencies, 95) * 1000,
+        "lookup_p99_ms": percentile(latencies, 99) * 1000,
+        "variations_matched": found / queries,
+        "unrelated_matched": sum(1 for m in new_matches if m) / queries,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do índice de produtos parecidos.")
+    parser.add_argument("--entries", type=int, default=200000, help="produtos indexados")
+    parser.add_argument("--queries", type=int, default=1000, help="consultas de cada tipo")
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    args = parser.parse_args()
+
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+    report = run_benchmark(args.entries, args.queries)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"\n📊 Índice com {report['entries']} produtos")
+    print(f"   inserção: {report['inserts_per_second']:.0f} produtos/s")
+    print(f"   consulta: p50 {report['lookup_p50_ms']:.2f} ms | p95 {report['lookup_p95_ms']:.2f} ms"
+          f" | p99 {report['lookup_p99_ms']:.2f} ms")
+    print(f"   variações reconhecidas: {report['variations_matched']:.0%}"
+          f" | produtos novos com match: {report['unrelated_matched']:.0%}")
+
+if __name__ == "__main__":
+    main()
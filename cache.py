@@ -0,0 +1,163 @@
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from metrics import register_collector
+
+# Configuração via variáveis de ambiente
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") != "0"
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_DISK_MB = int(os.getenv("CACHE_MAX_DISK_MB", "200"))
+CACHE_MEMORY_ITEMS = int(os.getenv("CACHE_MEMORY_ITEMS", "256"))
+
+# Permite ignorar o cache em uma requisição específica (resposta "fresca").
+# A resposta nova ainda é gravada, substituindo a anterior.
+_bypass = contextvars.ContextVar("cache_bypass", default=False)
+
+@contextmanager
+def bypass_cache(enabled: bool = True):
+    token = _bypass.set(enabled)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+def cache_bypassed() -> bool:
+    """True quando a requisição atual pediu respostas frescas (fresh=1)."""
+    return _bypass.get()
+
+def cache_key(kind: str, **params) -> str:
+    """
+    Gera uma chave estável a partir do tipo de chamada e dos parâmetros
+    (modelo + mensagens, ou modelo + prompt + tamanho para imagens).
+    """
+    payload = json.dumps({"kind": kind, **params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Cache em dois níveis: LRU em memória e SQLite em disco com TTL e
+    limite de tamanho (remove as entradas acessadas há mais tempo).
+    """
+    def __init__(self, directory: str = CACHE_DIR, ttl: int = CACHE_TTL_SECONDS,
+                 max_disk_bytes: int = CACHE_MAX_DISK_MB * 1024 * 1024,
+                 memory_items: int = CACHE_MEMORY_ITEMS):
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "responses.sqlite3")
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _remember(self, key: str, value: str, created: float) -> None:
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        if not CACHE_ENABLED or _bypass.get():
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] < self.ttl:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            elif row:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+
+        with self._lock:
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["disk_hits"] += 1
+            self._remember(key, row[0], row[1])
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        if not CACHE_ENABLED or value is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self.counters["writes"] += 1
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now)
+            )
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._evict(conn)
+
+    def _evict(self, conn) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        with self._lock:
+            self.counters["evictions"] += evicted
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._memory.pop(key, None)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_items"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+response_cache = ResponseCache()
+
+def _cache_metrics() -> list:
+    stats = response_cache.stats()
+    lines = ["# HELP response_cache_events_total Eventos do cache de respostas da OpenAI.",
+             "# TYPE response_cache_events_total counter"]
+    for event in ("memory_hits", "disk_hits", "misses", "writes", "evictions"):
+        lines.append(f'response_cache_events_total{{event="{event}"}} {stats[event]}')
+    lines += ["# HELP response_cache_memory_items Entradas no cache em memória.",
+              "# TYPE response_cache_memory_items gauge",
+              f"response_cache_memory_items {stats['memory_items']}"]
+    return lines
+
+register_collector(_cache_metrics)
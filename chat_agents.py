@@ -1,108 +1,121 @@
+import asyncio
+import contextvars
+import hashlib
+import json
 import openai
 import os
 import re
-import xml.etree.ElementTree as ET
+import tempfile
+import time
+import uuid
 from dotenv import load_dotenv
+from pydantic import ValidationError
 from pydantic_ai import Agent
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from cache import cache_key, response_cache
+from image_optimizer import image_tag, placeholder_png, plan_image, url_to_path
+from image_store import file_digest, image_store
+from metrics import current_trace_id, llm_parse, observe_call
+from ratelimit import estimate_tokens, rate_limiter
+from resilience import (
+    acall_with_policy, astream_within_deadline, call_with_policy, deadline_for, stream_within_deadline, to_thread,
+)
+from routing import model_for
+from schemas import (
+    FusedUpstreamSchema, HtmlCodeSchema, JsonFieldStream, ProductListSchema, SpecificationSchema, response_format,
+)
+from messages import (
+    AgentText,
+    Image,
+    ImageList,
+    Product,
+    ProductList,
+    Specification,
+    as_images,
+    as_products,
+    as_text,
+    extract_images,
+    extract_products,
+    extract_tag_content,
+    wrap_images,
+    wrap_products,
+    wrap_xml,
+)
 
 # Carregar variáveis do ambiente
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 client = openai.OpenAI(api_key=OPENAI_API_KEY)
+# Cliente assíncrono do caminho ASGI (asgi_app.py): as chamadas não prendem uma thread
+async_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+# Quantas imagens o PhotographerAgent gera ao mesmo tempo (1 = modo sequencial)
+PHOTOGRAPHER_MAX_WORKERS = int(os.getenv("PHOTOGRAPHER_MAX_WORKERS", "3"))
+# Tentativas por imagem antes de usar o placeholder
+PHOTOGRAPHER_ATTEMPTS = int(os.getenv("PHOTOGRAPHER_ATTEMPTS", "2"))
+IMAGE_SIZE = "1024x1024"
+# Novas chamadas de correção quando uma saída estruturada não passa na validação
+STRUCTURED_REPAIR_ATTEMPTS = int(os.getenv("STRUCTURED_REPAIR_ATTEMPTS", "1"))
 
 # --- Funções Auxiliares ---
 
-def wrap_xml(agent_name: str, content: str, tag: str = "content") -> str:
-    root = ET.Element("result")
-    agent_elem = ET.SubElement(root, "agent")
-    agent_elem.text = agent_name
-    content_elem = ET.SubElement(root, tag)
-    content_elem.text = content
-    return ET.tostring(root, encoding="unicode")
+# Sessão HTTP compartilhada: reaproveita conexões keep-alive entre downloads
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+IMAGE_POOL_SIZE = int(os.getenv("IMAGE_POOL_SIZE", "10"))
 
-def extract_tag_content(xml_str: str, tag: str = "content") -> str:
-    root = ET.fromstring(xml_str)
-    elem = root.find(tag)
-    return elem.text if elem is not None else ""
+http_session = requests.Session()
+_http_adapter = requests.adapters.HTTPAdapter(pool_connections=IMAGE_POOL_SIZE, pool_maxsize=IMAGE_POOL_SIZE)
+http_session.mount("https://", _http_adapter)
+http_session.mount("http://", _http_adapter)
 
-def clean_markdown_code(code: str) -> str:
-    """
-    Remove blocos de código Markdown (```) do código gerado.
+def download_and_save_image(image_url: str, product_name: str, target_url: str = None) -> str or None:
     """
-    code = re.sub(r'```[\w]*\n?', '', code)
-    code = re.sub(r'```', '', code)
-    code = re.sub(r'(^|\n)#+\s*.*', '', code)
-    code = re.sub(r'(^|\n)(Claro!|Abaixo|Aqui está|Segue|Pronto).*?:\n', '\n', code, flags=re.IGNORECASE)
-    code = code.strip()
-    return code
-
-# Para dados estruturados de produtos
-def wrap_products(products: list) -> str:
-    root = ET.Element("products")
-    for prod in products:
-        prod_elem = ET.SubElement(root, "product")
-        nome_elem = ET.SubElement(prod_elem, "nome")
-        nome_elem.text = prod["nome"]
-        desc_elem = ET.SubElement(prod_elem, "descricao")
-        desc_elem.text = prod["descricao"]
-        preco_elem = ET.SubElement(prod_elem, "preco")
-        preco_elem.text = str(prod["preco"])
-    return ET.tostring(root, encoding="unicode")
-
-def extract_products(xml_str: str) -> list:
-    root = ET.fromstring(xml_str)
-    products = []
-    for prod_elem in root.findall("product"):
-        nome = prod_elem.find("nome").text
-        descricao = prod_elem.find("descricao").text
-        preco = float(prod_elem.find("preco").text)
-        products.append({"nome": nome, "descricao": descricao, "preco": preco})
-    return products
-
-# Para dados estruturados de imagens
-def wrap_images(images: list) -> str:
-    root = ET.Element("images")
-    for img in images:
-        img_elem = ET.SubElement(root, "image")
-        pname_elem = ET.SubElement(img_elem, "product_name")
-        pname_elem.text = img["product_name"]
-        url_elem = ET.SubElement(img_elem, "image_url")
-        url_elem.text = img["image_url"]
-    return ET.tostring(root, encoding="unicode")
-
-def extract_images(xml_str: str) -> list:
-    root = ET.fromstring(xml_str)
-    images = []
-    for img_elem in root.findall("image"):
-        product_name = img_elem.find("product_name").text
-        image_url = img_elem.find("image_url").text
-        images.append({"product_name": product_name, "image_url": image_url})
-    return images
-
-def download_and_save_image(image_url: str, product_name: str) -> str or None:
-    """
-    Faz download da imagem e a salva localmente no diretório 'static/images'.
-    Retorna a URL local relativa.
+    Faz download da imagem e a salva localmente no diretório 'static/images'
+    (ou no caminho já reservado em `target_url`).
+    O conteúdo é gravado em blocos num arquivo temporário e renomeado no final,
+    então nunca fica um arquivo pela metade. Retorna a URL local relativa.
     """
+    tmp_path = None
     try:
         # Criar diretório se não existir
         os.makedirs('static/images', exist_ok=True)
         
-        # Fazer download
-        response = requests.get(image_url, timeout=10)
-        response.raise_for_status()
-        
-        # Gerar nome único para o arquivo
-        safe_name = re.sub(r'[^\w\-_\.]', '_', product_name).lower()
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{safe_name}_{timestamp}.png"
+        if target_url:
+            filename = os.path.basename(target_url)
+        else:
+            # Gerar nome único para o arquivo (o sufixo evita colisões entre downloads simultâneos)
+            safe_name = re.sub(r'[^\w\-_\.]', '_', product_name).lower()
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            filename = f"{safe_name}_{timestamp}_{uuid.uuid4().hex[:8]}.png"
         filepath = os.path.join('static/images', filename)
         
-        # Salvar arquivo
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
+        # Fazer download em streaming
+        with http_session.get(image_url, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            length = response.headers.get("Content-Length")
+            if length and int(length) > IMAGE_MAX_BYTES:
+                raise ValueError(f"imagem com {length} bytes excede o limite de {IMAGE_MAX_BYTES}")
+            
+            fd, tmp_path = tempfile.mkstemp(dir='static/images', suffix='.part')
+            size = 0
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+                    if size > IMAGE_MAX_BYTES:
+                        raise ValueError(f"imagem excede o limite de {IMAGE_MAX_BYTES} bytes")
+                    f.write(chunk)
+        
+        # Guarda pelo hash do conteúdo e liga ao caminho final (renomeação atômica);
+        # mkstemp cria com 0600, o servidor estático precisa ler.
+        # Um caminho reservado que já tem outra imagem (página publicada) não é trocado
+        os.chmod(tmp_path, 0o644)
+        if target_url:
+            filepath = image_store.free_path(filepath, file_digest(tmp_path))
+            filename = os.path.basename(filepath)
+        image_store.put_file(tmp_path, filepath, product_name)
+        tmp_path = None
         
         # Retornar URL local (relativa)
         return f"/static/images/{filename}"
@@ -110,215 +123,624 @@ def download_and_save_image(image_url: str, product_name: str) -> str or None:
     except Exception as e:
         print(f"❌ Erro ao fazer download da imagem para '{product_name}': {e}")
         return None
+    
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# --- Chamadas à OpenAI (com cache e métricas) ---
+
+def _chat_options(json_mode: bool = False, schema=None) -> dict:
+    if schema is not None:
+        return {"response_format": response_format(schema)}
+    return {"response_format": {"type": "json_object"}} if json_mode else {}
+
+def _cacheable(response_text: str, schema=None) -> bool:
+    """
+    Só respostas que passam no schema vão para o cache (e só elas são lidas
+    dele): uma resposta inválida em cache faria toda nova execução gastar as
+    correções lendo o mesmo texto, sem chamar a API.
+    """
+    if schema is None:
+        return True
+    try:
+        schema.model_validate_json(response_text or "")
+    except ValidationError:
+        return False
+    return True
+
+def chat_completion(agent_name: str, prompt: str, model: str = None, json_mode: bool = False,
+                    schema=None) -> str:
+    """
+    Envia o prompt ao chat.completions, reaproveitando respostas já geradas
+    para o mesmo modelo e mensagens. `json_mode` pede uma resposta em JSON válido;
+    `schema` (modelo pydantic de schemas.py) restringe a resposta ao JSON Schema dele.
+    Sem `model`, usa o modelo do agente no perfil atual (routing.model_for).
+    """
+    model = model or model_for(agent_name)
+    messages = [{"role": "system", "content": prompt}]
+    options = _chat_options(json_mode, schema)
+    key = cache_key("chat", model=model, messages=messages, **options)
+    with observe_call(agent_name, model) as call:
+        cached = response_cache.get(key)
+        if cached is not None and _cacheable(cached, schema):
+            call.outcome = "cache_hit"
+            return cached
+        
+        tokens = estimate_tokens(prompt)
+        response = call_with_policy(agent_name, model, lambda timeout: client.with_options(
+            timeout=timeout, max_retries=0).chat.completions.create(model=model, messages=messages, **options),
+            tokens=tokens)
+        call.record_usage(response.usage)
+        if response.usage:
+            rate_limiter.adjust(model, call.prompt_tokens + call.completion_tokens - tokens)
+    response_text = response.choices[0].message.content
+    if _cacheable(response_text, schema):
+        response_cache.set(key, response_text)
+    return response_text
+
+def chat_completion_stream(agent_name: str, prompt: str, on_token, model: str = None, schema=None) -> str:
+    """
+    Igual a chat_completion, mas usa a API de streaming e chama `on_token`
+    a cada trecho recebido. Retorna o texto completo.
+    Compartilha a mesma entrada de cache da versão sem streaming.
+    """
+    model = model or model_for(agent_name)
+    messages = [{"role": "system", "content": prompt}]
+    options = _chat_options(schema=schema)
+    key = cache_key("chat", model=model, messages=messages, **options)
+    with observe_call(agent_name, model) as call:
+        cached = response_cache.get(key)
+        if cached is not None and _cacheable(cached, schema):
+            call.outcome = "cache_hit"
+            on_token(cached)
+            return cached
+        
+        chunks = []
+        tokens = estimate_tokens(prompt)
+        # As novas tentativas cobrem a abertura do stream; depois que os tokens
+        # começam a chegar, um erro interrompe a chamada (evita tokens repetidos).
+        # O prazo do agente vale até o último trecho
+        deadline = time.monotonic() + deadline_for(agent_name)
+        stream = call_with_policy(agent_name, model, lambda timeout: client.with_options(
+            timeout=timeout, max_retries=0).chat.completions.create(
+            model=model, messages=messages, stream=True,
+            stream_options={"include_usage": True}, **options
+        ), hedge=False, tokens=tokens)
+        for chunk in stream_within_deadline(agent_name, model, stream, deadline):
+            # O último trecho traz apenas o uso de tokens
+            if getattr(chunk, "usage", None):
+                call.record_usage(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                chunks.append(delta)
+                on_token(delta)
+        if call.prompt_tokens or call.completion_tokens:
+            rate_limiter.adjust(model, call.prompt_tokens + call.completion_tokens - tokens)
+    response_text = "".join(chunks)
+    if _cacheable(response_text, schema):
+        response_cache.set(key, response_text)
+    return response_text
+
+def generate_image(agent_name: str, prompt: str, product_name: str,
+                   model: str = "dall-e-3", size: str = IMAGE_SIZE, target_url: str = None) -> str or None:
+    """
+    Gera a imagem com o DALL-E e salva localmente (em `target_url`, se o caminho
+    já foi reservado). As URLs do DALL-E expiram, então o cache guarda a URL
+    local (válida enquanto o arquivo existir).
+    """
+    key = cache_key("image", model=model, prompt=prompt, size=size)
+    with observe_call(agent_name, model) as call:
+        cached = response_cache.get(key)
+        if cached is not None and os.path.exists(url_to_path(cached)):
+            call.outcome = "cache_hit"
+            if target_url and cached != target_url:
+                return _link_cached(cached, target_url, product_name)
+            return cached
+        
+        # Sem hedge nas imagens: cada cópia é cobrada por inteiro
+        response = call_with_policy(agent_name, model, lambda timeout: client.with_options(
+            timeout=timeout, max_retries=0).images.generate(model=model, prompt=prompt, n=1, size=size),
+            hedge=False)
+        call.record_image(size)
+    local_url = download_and_save_image(response.data[0].url, product_name, target_url)
+    if local_url:
+        response_cache.set(key, local_url)
+    return local_url
+
+def _link_cached(cached_url: str, target_url: str, product_name: str) -> str:
+    """Liga a imagem do cache ao caminho reservado (ou a um livre, se ele já tem outra imagem)."""
+    cached_path = url_to_path(cached_url)
+    path = image_store.free_path(url_to_path(target_url), image_store.digest(cached_path))
+    image_store.link(cached_path, path, product_name)
+    return f"/static/images/{os.path.basename(path)}"
+
+def _file_digest(path: str) -> str:
+    return image_store.digest(path)[:16]
+
+def embed_text(text: str, model: str = "text-embedding-3-small") -> list:
+    """
+    Embedding de um texto curto. Backend opcional do índice de produtos
+    parecidos: SIMILARITY_BACKEND=chat_agents:embed_text.
+    """
+    key = cache_key("embedding", model=model, input=text)
+    with observe_call("SimilarityIndex", model) as call:
+        cached = response_cache.get(key)
+        if cached is not None:
+            call.outcome = "cache_hit"
+            return json.loads(cached)
+        
+        response = call_with_policy("SimilarityIndex", model, lambda timeout: client.with_options(
+            timeout=timeout, max_retries=0).embeddings.create(model=model, input=text),
+            hedge=False, tokens=len(text) // 4 + 1)
+        call.record_usage(response.usage)
+    vector = response.data[0].embedding
+    response_cache.set(key, json.dumps(vector))
+    return vector
+
+# --- Versões assíncronas (mesmo cache, métricas, prazos e limite de taxa) ---
+
+async def achat_completion(agent_name: str, prompt: str, model: str = None, json_mode: bool = False,
+                           schema=None) -> str:
+    model = model or model_for(agent_name)
+    messages = [{"role": "system", "content": prompt}]
+    options = _chat_options(json_mode, schema)
+    key = cache_key("chat", model=model, messages=messages, **options)
+    with observe_call(agent_name, model) as call:
+        cached = await to_thread(response_cache.get, key)
+        if cached is not None and _cacheable(cached, schema):
+            call.outcome = "cache_hit"
+            return cached
+        
+        tokens = estimate_tokens(prompt)
+        response = await acall_with_policy(agent_name, model, lambda timeout: async_client.with_options(
+            timeout=timeout, max_retries=0).chat.completions.create(model=model, messages=messages, **options),
+            tokens=tokens)
+        call.record_usage(response.usage)
+        if response.usage:
+            await to_thread(rate_limiter.adjust, model, call.prompt_tokens + call.completion_tokens - tokens)
+    response_text = response.choices[0].message.content
+    if _cacheable(response_text, schema):
+        await to_thread(response_cache.set, key, response_text)
+    return response_text
+
+async def achat_completion_stream(agent_name: str, prompt: str, on_token, model: str = None,
+                                  schema=None) -> str:
+    model = model or model_for(agent_name)
+    messages = [{"role": "system", "content": prompt}]
+    options = _chat_options(schema=schema)
+    key = cache_key("chat", model=model, messages=messages, **options)
+    with observe_call(agent_name, model) as call:
+        cached = await to_thread(response_cache.get, key)
+        if cached is not None and _cacheable(cached, schema):
+            call.outcome = "cache_hit"
+            on_token(cached)
+            return cached
+        
+        chunks = []
+        tokens = estimate_tokens(prompt)
+        deadline = time.monotonic() + deadline_for(agent_name)
+        stream = await acall_with_policy(agent_name, model, lambda timeout: async_client.with_options(
+            timeout=timeout, max_retries=0).chat.completions.create(
+            model=model, messages=messages, stream=True,
+            stream_options={"include_usage": True}, **options
+        ), hedge=False, tokens=tokens)
+        async for chunk in astream_within_deadline(agent_name, model, stream, deadline):
+            if getattr(chunk, "usage", None):
+                call.record_usage(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                chunks.append(delta)
+                on_token(delta)
+        if call.prompt_tokens or call.completion_tokens:
+            await to_thread(rate_limiter.adjust, model, call.prompt_tokens + call.completion_tokens - tokens)
+    response_text = "".join(chunks)
+    if _cacheable(response_text, schema):
+        await to_thread(response_cache.set, key, response_text)
+    return response_text
+
+async def agenerate_image(agent_name: str, prompt: str, product_name: str,
+                          model: str = "dall-e-3", size: str = IMAGE_SIZE, target_url: str = None) -> str or None:
+    key = cache_key("image", model=model, prompt=prompt, size=size)
+    with observe_call(agent_name, model) as call:
+        cached = await to_thread(response_cache.get, key)
+        if cached is not None and os.path.exists(url_to_path(cached)):
+            call.outcome = "cache_hit"
+            if target_url and cached != target_url:
+                return await to_thread(_link_cached, cached, target_url, product_name)
+            return cached
+        
+        response = await acall_with_policy(agent_name, model, lambda timeout: async_client.with_options(
+            timeout=timeout, max_retries=0).images.generate(model=model, prompt=prompt, n=1, size=size),
+            hedge=False)
+        call.record_image(size)
+    # O download é curto e usa a sessão keep-alive compartilhada: roda no executor
+    local_url = await to_thread(download_and_save_image, response.data[0].url, product_name, target_url)
+    if local_url:
+        await to_thread(response_cache.set, key, local_url)
+    return local_url
+
+# --- Saídas estruturadas (validação e correção) ---
+#
+# A resposta é restrita ao JSON Schema e validada pelo mesmo modelo pydantic.
+# Se ainda assim não validar (recusa, resposta cortada, regra que só o pydantic
+# confere), só a etapa que falhou é refeita, com os erros no prompt, em vez de
+# o usuário rodar o pipeline inteiro de novo.
+
+def _repair_prompt(prompt: str, response_text: str, error: ValidationError) -> str:
+    errors = "\n".join(f"- {'.'.join(map(str, e['loc'])) or 'resposta'}: {e['msg']}" for e in error.errors())
+    return (
+        f"{prompt}\n\n"
+        f"SUA RESPOSTA ANTERIOR NÃO PASSOU NA VALIDAÇÃO:\n{errors}\n\n"
+        f"Resposta anterior:\n{response_text}\n\n"
+        f"Corrija esses pontos e responda novamente com o JSON completo."
+    )
+
+def _validate(agent_name: str, schema, response_text: str, attempt: int) -> tuple:
+    """Valida a resposta; retorna (objeto, None) ou (None, erro) se ainda dá para corrigir."""
+    model = model_for(agent_name)
+    try:
+        value = schema.model_validate_json(response_text or "")
+    except ValidationError as e:
+        llm_parse.inc(agent=agent_name, model=model, outcome="invalid")
+        if attempt >= STRUCTURED_REPAIR_ATTEMPTS:
+            raise ValueError(f"{agent_name}: resposta fora do formato após {attempt + 1} tentativa(s): {e}") from e
+        print(f"🔧 [trace={current_trace_id()}] {agent_name}: resposta fora do formato "
+              f"({e.error_count()} erro(s)), pedindo correção")
+        return None, e
+    llm_parse.inc(agent=agent_name, model=model, outcome="ok" if attempt == 0 else "repaired")
+    return value, None
+
+def structured_completion(agent_name: str, prompt: str, schema, on_token=None):
+    """
+    Chamada com saída estruturada: retorna a instância validada de `schema`.
+    `on_token` recebe os trechos crus da primeira tentativa; as correções não
+    são transmitidas (o resultado final traz o texto certo).
+    """
+    request = prompt
+    for attempt in range(STRUCTURED_REPAIR_ATTEMPTS + 1):
+        if on_token and attempt == 0:
+            response_text = chat_completion_stream(agent_name, request, on_token, schema=schema)
+        else:
+            response_text = chat_completion(agent_name, request, schema=schema)
+        value, error = _validate(agent_name, schema, response_text, attempt)
+        if value is not None:
+            return value
+        request = _repair_prompt(prompt, response_text, error)
+
+async def astructured_completion(agent_name: str, prompt: str, schema, on_token=None):
+    request = prompt
+    for attempt in range(STRUCTURED_REPAIR_ATTEMPTS + 1):
+        if on_token and attempt == 0:
+            response_text = await achat_completion_stream(agent_name, request, on_token, schema=schema)
+        else:
+            response_text = await achat_completion(agent_name, request, schema=schema)
+        value, error = _validate(agent_name, schema, response_text, attempt)
+        if value is not None:
+            return value
+        request = _repair_prompt(prompt, response_text, error)
 
 # --- Agentes ---
+#
+# Cada agente monta o prompt e interpreta a resposta em métodos próprios;
+# `respond` (síncrono) e `arespond` (assíncrono) só mudam a forma de chamar a API.
 
 class TextGeneratorAgent(Agent):
-    def respond(self, topic: str) -> str:
-        prompt = f"Descreva um contexto detalhado sobre o seguinte produto para um e-commerce: {topic}."
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": prompt}]
-        )
-        response_text = response.choices[0].message.content
+    def _prompt(self, topic: str) -> str:
+        return f"Descreva um contexto detalhado sobre o seguinte produto para um e-commerce: {topic}."
+
+    def _result(self, response_text: str) -> AgentText:
         print("\n🔍 Resposta do TextGeneratorAgent:\n", response_text)
-        return wrap_xml("TextGeneratorAgent", response_text)
+        return AgentText("TextGeneratorAgent", response_text)
+
+    def respond(self, topic: str) -> AgentText:
+        return self._result(chat_completion("TextGeneratorAgent", self._prompt(topic)))
+
+    async def arespond(self, topic: str) -> AgentText:
+        return self._result(await achat_completion("TextGeneratorAgent", self._prompt(topic)))
 
 class UXResearchAgent(Agent):
-    def respond(self, context_xml: str) -> str:
-        context = extract_tag_content(context_xml)
-        prompt = f"Baseado neste contexto de produto: {context}, crie uma persona do cliente ideal. Inclua dores, necessidades e oportunidades para esse público."
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": prompt}]
-        )
-        response_text = response.choices[0].message.content
+    def _prompt(self, context_xml) -> str:
+        context = as_text(context_xml)
+        return f"Baseado neste contexto de produto: {context}, crie uma persona do cliente ideal. Inclua dores, necessidades e oportunidades para esse público."
+
+    def _result(self, response_text: str) -> AgentText:
         print("\n🔍 Resposta do UXResearchAgent:\n", response_text)
-        return wrap_xml("UXResearchAgent", response_text)
+        return AgentText("UXResearchAgent", response_text)
+
+    def respond(self, context_xml) -> AgentText:
+        return self._result(chat_completion("UXResearchAgent", self._prompt(context_xml)))
+
+    async def arespond(self, context_xml) -> AgentText:
+        return self._result(await achat_completion("UXResearchAgent", self._prompt(context_xml)))
 
 class UXDesignerAgent(Agent):
-    def respond(self, persona_xml: str) -> str:
-        persona = extract_tag_content(persona_xml)
-        prompt = (
+    def _prompt(self, persona_xml) -> str:
+        persona = as_text(persona_xml)
+        return (
             f"Com base nesta persona: {persona}, descreva os melhores elementos de UX para a página do e-commerce. "
             "Inclua:\n- Tipo de fonte ideal\n- Disposição das imagens\n- Estrutura para conversão de vendas\n- Paleta de cores recomendada\n"
             "NÃO mencione logo ou marca visual. Foque apenas em layout, tipografia, cores e disposição de elementos."
         )
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": prompt}]
-        )
-        response_text = response.choices[0].message.content
+
+    def _result(self, response_text: str) -> AgentText:
         print("\n🔍 Resposta do UXDesignerAgent:\n", response_text)
-        return wrap_xml("UXDesignerAgent", response_text)
+        return AgentText("UXDesignerAgent", response_text)
+
+    def respond(self, persona_xml) -> AgentText:
+        return self._result(chat_completion("UXDesignerAgent", self._prompt(persona_xml)))
+
+    async def arespond(self, persona_xml) -> AgentText:
+        return self._result(await achat_completion("UXDesignerAgent", self._prompt(persona_xml)))
 
 class BusinessAgent(Agent):
     """
     Agente de Negócios: Limita a 3 produtos.
     """
-    def respond(self, persona_xml: str) -> str:
-        persona = extract_tag_content(persona_xml)
-        prompt = (
+    def _prompt(self, persona_xml) -> str:
+        persona = as_text(persona_xml)
+        return (
             f"Com base nesta persona: {persona}, crie uma lista de EXATAMENTE 3 produtos ideais para o e-commerce. Para cada produto, forneça:\n"
-            "- Nome\n- Descrição curta\n- Preço sugerido (em USD)\n"
-            "Formato esperado (3 linhas apenas):\nProduto 1 | Descrição 1 | 199.99\nProduto 2 | Descrição 2 | 299.99\nProduto 3 | Descrição 3 | 399.99"
+            "- nome\n- descricao: descrição curta\n- preco: preço sugerido em USD (número)\n"
+            'Responda em JSON, com os 3 produtos na lista "produtos".'
         )
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": prompt}]
-        )
-        response_text = response.choices[0].message.content.strip()
-        
-        products = []
-        for line in response_text.split("\n"):
-            parts = line.split(" | ")
-            if len(parts) == 3:
-                try:
-                    products.append({
-                        "nome": parts[0].strip(),
-                        "descricao": parts[1].strip(),
-                        "preco": float(parts[2].strip())
-                    })
-                except ValueError:
-                    print(f"⚠️ Erro ao converter preço: {parts[2]}")
-        
-        products = products[:3]
+
+    def respond(self, persona_xml) -> ProductList:
+        return self._result(structured_completion("BusinessAgent", self._prompt(persona_xml), ProductListSchema))
+
+    async def arespond(self, persona_xml) -> ProductList:
+        return self._result(await astructured_completion("BusinessAgent", self._prompt(persona_xml), ProductListSchema))
+
+    def _result(self, output: ProductListSchema) -> ProductList:
+        products = [Product(nome=p.nome, descricao=p.descricao, preco=p.preco) for p in output.produtos]
         
         print(f"✅ BusinessAgent: {len(products)} produtos gerados. Lista:")
         for p in products:
-            print(f"   - {p['nome']} (Descrição: {p['descricao']}, Preço: ${p['preco']:.2f})")
+            print(f"   - {p.nome} (Descrição: {p.descricao}, Preço: ${p.preco:.2f})")
             
-        return wrap_products(products)
+        return ProductList(tuple(products))
+
+class FusedUpstreamAgent(Agent):
+    """
+    Modo fundido: uma única chamada estruturada (schemas.FusedUpstreamSchema)
+    produz contexto, persona, elementos de UX e produtos, no lugar das quatro
+    primeiras etapas. Uma resposta fora do schema é corrigida como nas demais.
+    As saídas têm os mesmos tipos dos agentes separados, então Photographer,
+    Specification e CodeGenerator seguem iguais.
+    """
+    def _prompt(self, topic: str) -> str:
+        return (
+            f"Você vai planejar um e-commerce para o seguinte produto: {topic}.\n"
+            "Responda com CONTEXTO, PERSONA, UX E PRODUTOS EM JSON, com exatamente estas chaves:\n"
+            '- "contexto": contexto detalhado sobre o produto para um e-commerce;\n'
+            '- "persona": persona do cliente ideal, com dores, necessidades e oportunidades desse público;\n'
+            '- "ux": melhores elementos de UX para a página (tipo de fonte ideal, disposição das imagens, '
+            "estrutura para conversão de vendas e paleta de cores recomendada), sem mencionar logo ou marca visual;\n"
+            '- "produtos": lista com exatamente 3 produtos ideais para a persona, cada um com '
+            '"nome", "descricao" (curta) e "preco" (número, em USD).\n'
+            "Os textos devem ser tão completos quanto se cada parte fosse pedida separadamente."
+        )
+
+    def respond(self, topic: str) -> dict:
+        return self._result(structured_completion("FusedUpstreamAgent", self._prompt(topic), FusedUpstreamSchema))
+
+    async def arespond(self, topic: str) -> dict:
+        return self._result(await astructured_completion("FusedUpstreamAgent", self._prompt(topic),
+                                                         FusedUpstreamSchema))
+
+    def _result(self, output: FusedUpstreamSchema) -> dict:
+        products = [Product(nome=p.nome, descricao=p.descricao, preco=p.preco) for p in output.produtos]
+        print(f"\n🔍 Resposta do FusedUpstreamAgent: contexto, persona, UX e {len(products)} produtos")
+        return {
+            "context": AgentText("TextGeneratorAgent", output.contexto),
+            "persona": AgentText("UXResearchAgent", output.persona),
+            "ux": AgentText("UXDesignerAgent", output.ux),
+            "products": ProductList(tuple(products)),
+        }
 
 class PhotographerAgent(Agent):
     """
     Agente Fotógrafo: Limita a 3 imagens e faz download local.
+    Os caminhos das imagens são reservados assim que os produtos existem
+    (`plan`), então especificação e código não esperam pelo DALL-E.
+    As imagens são geradas em paralelo (até `max_workers` simultâneas) e cada
+    uma é gravada no seu caminho reservado quando fica pronta; se o caminho já
+    tem outra imagem (ex.: regeneração de uma página publicada), num caminho
+    novo, que a etapa `page` troca no HTML.
     """
-    def respond(self, products_xml: str) -> str:
-        products = extract_products(products_xml)
-        products = products[:3]
+    def plan(self, products_xml, topic: str = "") -> ImageList:
+        """
+        Reserva um caminho local (e as variantes) para a imagem de cada produto.
+        O caminho é determinístico (hash do tema, do nome e da posição): os
+        prompts da especificação e do código citam esses caminhos, então a
+        mesma geração repetida continua encontrando essas etapas no cache.
+        """
+        slots = []
+        for index, product in enumerate(as_products(products_xml)[:3]):
+            safe_name = re.sub(r'[^\w\-_\.]', '_', product.nome).lower()
+            slot = hashlib.sha256(f"{topic}\0{product.nome}\0{index}".encode("utf-8")).hexdigest()[:12]
+            image_url = f"/static/images/{safe_name}_{slot}.png"
+            slots.append(plan_image(product.nome, image_url, IMAGE_SIZE))
+        print(f"🗂️ PhotographerAgent: {len(slots)} caminhos de imagem reservados")
+        return ImageList(tuple(slots))
+
+    def _generate_and_save(self, idx: int, total: int, slot: Image) -> Image:
+        prompt = f"Imagem realista de um {slot.product_name} em fundo branco, otimizada para e-commerce."
         
-        images = []
-        print(f"🖼️ Iniciando a geração de {len(products)} imagens para os produtos...")
+        for attempt in range(1, PHOTOGRAPHER_ATTEMPTS + 1):
+            print(f"🖼️ [{idx}/{total}] Gerando imagem para '{slot.product_name}' (tentativa {attempt})...")
+            try:
+                # Gera com o DALL-E, FAZ DOWNLOAD E SALVA NO CAMINHO RESERVADO
+                local_url = generate_image("PhotographerAgent", prompt, slot.product_name,
+                                           target_url=slot.image_url)
+                if local_url:
+                    print(f"✅ Imagem gerada e salva localmente: {local_url}")
+                    return Image(slot.product_name, local_url, digest=_file_digest(url_to_path(local_url)))
+            except Exception as e:
+                print(f"❌ Erro ao gerar ou salvar imagem para '{slot.product_name}': {str(e)}")
         
-        for idx, product in enumerate(products, 1):
-            prompt = f"Imagem realista de um {product['nome']} em fundo branco, otimizada para e-commerce."
-            print(f"🖼️ [{idx}/{len(products)}] Gerando imagem para '{product['nome']}'...")
-            
+        return self._placeholder(slot)
+
+    def _placeholder(self, slot: Image) -> Image:
+        # O HTML já aponta para este caminho: um placeholder evita imagem quebrada
+        print(f"⚠️ Usando placeholder para '{slot.product_name}'")
+        width, height = (int(v) for v in IMAGE_SIZE.split("x"))
+        data = placeholder_png(width, height)
+        # Todos os placeholders do mesmo tamanho são o mesmo blob no disco
+        path = image_store.free_path(url_to_path(slot.image_url), hashlib.sha256(data).hexdigest())
+        digest = image_store.put_bytes(data, path, slot.product_name)
+        return Image(slot.product_name, f"/static/images/{os.path.basename(path)}", digest=digest[:16])
+
+    async def _agenerate_and_save(self, idx: int, total: int, slot: Image) -> Image:
+        prompt = f"Imagem realista de um {slot.product_name} em fundo branco, otimizada para e-commerce."
+        
+        for attempt in range(1, PHOTOGRAPHER_ATTEMPTS + 1):
+            print(f"🖼️ [{idx}/{total}] Gerando imagem para '{slot.product_name}' (tentativa {attempt})...")
             try:
-                response = client.images.generate(
-                    model="dall-e-3",
-                    prompt=prompt,
-                    n=1,
-                    size="1024x1024"
-                )
-                
-                image_url_dalle = response.data[0].url
-                
-                # FAZ DOWNLOAD E SALVA LOCALMENTE
-                local_url = download_and_save_image(image_url_dalle, product['nome'])
-                
+                local_url = await agenerate_image("PhotographerAgent", prompt, slot.product_name,
+                                                  target_url=slot.image_url)
                 if local_url:
                     print(f"✅ Imagem gerada e salva localmente: {local_url}")
-                    images.append({
-                        "product_name": product["nome"],
-                        "image_url": local_url  # Usa a URL local
-                    })
-                
+                    return Image(slot.product_name, local_url,
+                                 digest=await to_thread(_file_digest, url_to_path(local_url)))
             except Exception as e:
-                print(f"❌ Erro ao gerar ou salvar imagem para '{product['nome']}': {str(e)}")
+                print(f"❌ Erro ao gerar ou salvar imagem para '{slot.product_name}': {str(e)}")
+        
+        return await to_thread(self._placeholder, slot)
+
+    def _slots(self, plan_xml) -> tuple:
+        """Slots reservados por `plan`; com a lista de produtos, reserva os caminhos antes."""
+        if isinstance(plan_xml, ProductList) or (isinstance(plan_xml, str) and plan_xml.lstrip().startswith("<products")):
+            plan_xml = self.plan(plan_xml)
+        return as_images(plan_xml)[:3]
+
+    def respond(self, plan_xml, max_workers: int = None) -> ImageList:
+        """
+        Gera as imagens dos slots reservados por `plan`. Também aceita a lista
+        de produtos (nesse caso reserva os caminhos antes).
+        """
+        slots = self._slots(plan_xml)
+        max_workers = max_workers or PHOTOGRAPHER_MAX_WORKERS
+        
+        print(f"🖼️ Iniciando a geração de {len(slots)} imagens para os produtos...")
+        
+        if max_workers <= 1 or len(slots) <= 1:
+            results = [self._generate_and_save(idx, len(slots), slot)
+                       for idx, slot in enumerate(slots, 1)]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(slots))) as executor:
+                # Cada tarefa roda numa cópia do contexto (mantém trace ID e bypass de cache)
+                futures = [executor.submit(contextvars.copy_context().run, self._generate_and_save,
+                                           idx, len(slots), slot)
+                           for idx, slot in enumerate(slots, 1)]
+                # Mantém a ordem original dos produtos
+                results = [f.result() for f in futures]
         
-        print(f"✅ PhotographerAgent: {len(images)} imagens processadas com sucesso")
-        return wrap_images(images)
+        print(f"✅ PhotographerAgent: {len(results)} imagens processadas")
+        return ImageList(tuple(results))
+
+    async def arespond(self, plan_xml) -> ImageList:
+        """Versão assíncrona: todas as imagens são pedidas ao mesmo tempo, sem threads."""
+        slots = self._slots(plan_xml)
+        print(f"🖼️ Iniciando a geração de {len(slots)} imagens para os produtos...")
+        results = await asyncio.gather(*(self._agenerate_and_save(idx, len(slots), slot)
+                                         for idx, slot in enumerate(slots, 1)))
+        print(f"✅ PhotographerAgent: {len(results)} imagens processadas")
+        return ImageList(tuple(results))
+
+def _variant_instruction(variant: int) -> str:
+    """
+    Instrução extra das variantes de layout (teste A/B): a partir da segunda,
+    cada especificação pede uma direção visual diferente. O prompt muda, então
+    cada variante também tem sua própria entrada no cache.
+    """
+    if variant <= 1:
+        return ""
+    return (
+        f"\n\nESTA É A VARIANTE DE LAYOUT {variant} PARA UM TESTE A/B: proponha uma direção visual "
+        f"CLARAMENTE DIFERENTE da versão padrão (outra paleta, outra tipografia e outra disposição "
+        f"do cabeçalho e dos cards), mantendo a mesma persona e os mesmos elementos de UX."
+    )
 
 class SpecificationAgent(Agent):
-    def respond(self, persona_xml: str, ux_elements_xml: str, images_xml: str) -> str:
-        persona = extract_tag_content(persona_xml)
-        ux_elements = extract_tag_content(ux_elements_xml)
-        images = extract_images(images_xml)
-        image_info = "\n".join([f"{img['product_name']}: {img['image_url']}" for img in images])
+    def _prompt(self, persona_xml, ux_elements_xml, images_xml, variant: int = 1) -> str:
+        persona = as_text(persona_xml)
+        ux_elements = as_text(ux_elements_xml)
+        images = as_images(images_xml)
+        image_info = "\n".join([f"{img.product_name}: {img.image_url}" for img in images])
         
-        prompt = (
+        return (
             f"VOCÊ É UM ESPECIALISTA EM DESIGN E ESPECIFICAÇÃO TÉCNICA DE E-COMMERCE.\n\n"
             f"Com base na seguinte persona de cliente:\n{persona}\n\n"
             f"E nos seguintes elementos de UX recomendados:\n{ux_elements}\n\n"
             f"Crie uma ESPECIFICAÇÃO TÉCNICA EXTREMAMENTE DETALHADA para um e-commerce que atenda perfeitamente essa persona.\n\n"
             f"As imagens do site serão:\n{image_info}\n\n"
             f"IMPORTANTE: NÃO inclua nenhuma especificação de logo ou marca visual. Foque apenas em layout, cores, tipografia e componentes.\n\n"
-            f"VOCÊ DEVE FORNECER (em formato estruturado e claro):\n"
-            f"1. PALETA DE CORES EXATA:\n"
-            f"   - Cor primária (com código HEX): [use uma cor que reflita a persona]"
-            f"   - Cor secundária (com código HEX): [complementar]"
-            f"   - Cor de destaque (com código HEX): [para CTAs]"
-            f"   - Cor de fundo (com código HEX): [branco, cinza claro, etc]"
-            f"   - Cor de texto (com código HEX): [escuro para legibilidade]"
-            f"\n2. TIPOGRAFIA:\n"
-            f"   - Fonte para títulos: [ex: Montserrat, Playfair Display, etc]"
-            f"   - Tamanho de título (h1): [ex: 48px]"
-            f"   - Tamanho de subtítulo (h2): [ex: 32px]"
-            f"   - Fonte para corpo: [ex: Open Sans, Lato, etc]"
-            f"   - Tamanho de corpo: [ex: 16px]"
-            f"   - Peso das fontes: [ex: 400 para corpo, 700 para títulos]"
-            f"\n3. LAYOUT E ESTRUTURA:\n"
-            f"   - Cabeçalho: [descrição do design]"
-            f"   - Seção de produtos: [grid 3 colunas, cards com sombra, etc]"
-            f"   - Rodapé: [cor, conteúdo]"
-            f"   - Espaçamento entre elementos: [padding, margin]"
-            f"   - Largura máxima do container: [ex: 1200px]"
-            f"\n4. COMPONENTES:\n"
-            f"   - Botões: [cor, tamanho, hover effect]"
-            f"   - Cards de produto: [altura, sombra, efeito ao passar mouse]"
-            f"   - Imagens: [tamanho, border-radius, object-fit]"
-            f"\n5. EFEITOS E INTERATIVIDADE:\n"
-            f"   - Transições: [duração, tipo]"
-            f"   - Hover effects: [descrever para botões e cards]"
-            f"   - Responsividade: [breakpoints para mobile, tablet, desktop]"
-            f"\nFORNEÇA A ESPECIFICAÇÃO DE FORMA ESTRUTURADA E CLARA, PARA QUE POSSA SER DIRETAMENTE APLICADA NO CSS."
-        )
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": prompt}]
+            f"RESPONDA EM JSON, com valores que possam ser aplicados diretamente no CSS:\n"
+            f"1. paleta: cores em HEX (#RRGGBB) - primaria (reflete a persona), secundaria (complementar), "
+            f"destaque (CTAs), fundo (branco, cinza claro, etc) e texto (escuro para legibilidade);\n"
+            f"2. tipografia: fonte_titulos e fonte_corpo (famílias do Google Fonts, ex: Montserrat, Open Sans), "
+            f"tamanho_h1 (ex: 48px), tamanho_h2 (ex: 32px), tamanho_corpo (ex: 16px), "
+            f"peso_titulos e peso_corpo (100 a 900, ex: 700 e 400);\n"
+            f"3. layout: cabecalho, secao_produtos (grid 3 colunas, cards com sombra, etc), rodape, "
+            f"espacamento (padding, margin) e largura_maxima do container (ex: 1200px);\n"
+            f"4. componentes: botoes (cor, tamanho, hover), cards (altura, sombra, efeito ao passar o mouse) "
+            f"e imagens (tamanho, border-radius, object-fit);\n"
+            f"5. efeitos: transicoes (duração, tipo), hover (botões e cards) e breakpoints "
+            f"(larguras para mobile, tablet e desktop, ex: 768px)."
+            + _variant_instruction(variant)
         )
-        response_text = response.choices[0].message.content
-        print("\n🔍 Resposta do SpecificationAgent:\n", response_text)
-        return wrap_xml("SpecificationAgent", response_text, tag="specification")
+
+    def _result(self, output: SpecificationSchema) -> Specification:
+        text = output.to_text()
+        print("\n🔍 Resposta do SpecificationAgent:\n", text)
+        return Specification("SpecificationAgent", text, output.model_dump())
+
+    def respond(self, persona_xml, ux_elements_xml, images_xml, variant: int = 1) -> Specification:
+        prompt = self._prompt(persona_xml, ux_elements_xml, images_xml, variant)
+        return self._result(structured_completion("SpecificationAgent", prompt, SpecificationSchema))
+
+    async def arespond(self, persona_xml, ux_elements_xml, images_xml, variant: int = 1) -> Specification:
+        prompt = self._prompt(persona_xml, ux_elements_xml, images_xml, variant)
+        return self._result(await astructured_completion("SpecificationAgent", prompt, SpecificationSchema))
 
 class CodeGeneratorAgent(Agent):
     """
-    Agente Gerador de Código: Gera apenas o conteúdo do <body> e remove blocos Markdown.
+    Agente Gerador de Código: Gera apenas o conteúdo do <body>, no campo "html" de uma resposta JSON.
     CRÍTICO: Deve aplicar OBRIGATORIAMENTE as especificações de cores, tipografia e layout.
     NOVO: Recebe também os dados dos produtos para gerar descrições reais.
     """
-    def respond(self, specification_xml: str, images_xml: str, products_xml: str = None) -> str:
-        specification = extract_tag_content(specification_xml, tag="specification")
-        images = extract_images(images_xml)
+    def _prompt(self, specification_xml, images_xml, products_xml=None) -> str:
+        specification = as_text(specification_xml, tag="specification")
+        images = as_images(images_xml)
         
         # Extrair dados dos produtos se fornecidos
         products = []
         products_info = ""
         if products_xml:
-            products = extract_products(products_xml)
+            products = as_products(products_xml)
             products_info = "\n".join([
-                f"- {p['nome']}: {p['descricao']} (Preco: ${p['preco']:.2f})"
+                f"- {p.nome}: {p.descricao} (Preco: ${p.preco:.2f})"
                 for p in products
             ])
         
         # Criar mapa de imagens por nome de produto
-        image_map = {img['product_name']: img['image_url'] for img in images}
+        image_map = {img.product_name: img for img in images}
         
         # Gerar tags de imagem com dados reais dos produtos
+        # (com variantes otimizadas: <picture> com srcset/sizes, width/height e loading="lazy")
         image_tags = ""
         if products:
             image_tags = "\n".join([
-                f'<img src="{image_map.get(p["nome"], "")}" alt="{p["nome"]}" style="width:200px; height:auto; object-fit: cover;">'
+                image_tag(image_map.get(p.nome, Image(p.nome, "")), alt=p.nome)
                 for p in products
             ])
         else:
-            image_tags = "\n".join([
-                f'<img src="{img["image_url"]}" alt="{img["product_name"]}" style="width:200px; height:auto; object-fit: cover;">'
-                for img in images
-            ])
+            image_tags = "\n".join([image_tag(img) for img in images])
         
         prompt = (
             f"VOCE E UM ESPECIALISTA EM DESENVOLVIMENTO WEB E DESIGN FRONT-END.\n\n"
@@ -362,10 +784,10 @@ class CodeGeneratorAgent(Agent):
             f"6. RESPONSIVIDADE:\n"
             f"   - Inclua media queries para mobile, tablet e desktop\n"
             f"   - Garanta que o layout se adapte bem em todos os tamanhos\n\n"
-            f"7. FORMATO DO CODIGO:\n"
-            f"   - Gere APENAS o conteudo do <body> (sem <!DOCTYPE>, <html>, <head>, </body>)\n"
+            f"7. FORMATO DA RESPOSTA:\n"
+            f"   - Responda em JSON, com o codigo no campo \"html\"\n"
+            f"   - O campo html tem APENAS o conteudo do <body> (sem <!DOCTYPE>, <html>, <head>, </body>)\n"
             f"   - Inclua a tag <style> com TODO o CSS dentro do body\n"
-            f"   - NAO use blocos de codigo Markdown (```, ```html, etc)\n"
             f"   - Apenas codigo HTML/CSS puro, sem explicacoes\n\n"
             f"8. IMPORTANTE - NAO GERAR LOGO:\n"
             f"   - NAO inclua nenhuma secao de logo ou marca visual\n"
@@ -373,23 +795,38 @@ class CodeGeneratorAgent(Agent):
             f"   - Foque apenas no titulo do e-commerce e menu de navegacao\n\n"
             f"Comece a gerar o codigo agora:"
         )
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": prompt}]
-        )
-        response_text = response.choices[0].message.content
-        
-        # LIMPEZA: Remover blocos de código Markdown
-        cleaned_text = clean_markdown_code(response_text)
-        
-        return wrap_xml("CodeGeneratorAgent", cleaned_text, tag="generated_code")
+        return prompt
+
+    def _result(self, output: HtmlCodeSchema) -> AgentText:
+        return AgentText("CodeGeneratorAgent", output.html, tag="generated_code")
+
+    @staticmethod
+    def _stream(on_token):
+        # A resposta é JSON: o callback recebe o HTML do campo "html" já decodificado
+        return JsonFieldStream("html", on_token).feed if on_token else None
+
+    def respond(self, specification_xml, images_xml, products_xml=None,
+                on_token=None) -> AgentText:
+        """
+        Se `on_token` for informado, a resposta é transmitida via streaming e cada
+        trecho do HTML é repassado ao callback conforme chega.
+        """
+        prompt = self._prompt(specification_xml, images_xml, products_xml)
+        return self._result(structured_completion("CodeGeneratorAgent", prompt, HtmlCodeSchema,
+                                                  on_token=self._stream(on_token)))
+
+    async def arespond(self, specification_xml, images_xml, products_xml=None,
+                       on_token=None) -> AgentText:
+        prompt = self._prompt(specification_xml, images_xml, products_xml)
+        return self._result(await astructured_completion("CodeGeneratorAgent", prompt, HtmlCodeSchema,
+                                                         on_token=self._stream(on_token)))
 
 # Instâncias dos agentes
 text_agent = TextGeneratorAgent()
 ux_research_agent = UXResearchAgent()
 ux_design_agent = UXDesignerAgent()
 business_agent = BusinessAgent()
+fused_agent = FusedUpstreamAgent()
 photographer_agent = PhotographerAgent()
 spec_agent = SpecificationAgent()
 code_agent = CodeGeneratorAgent()
@@ -400,10 +837,15 @@ __all__ = [
     "ux_research_agent",
     "ux_design_agent",
     "business_agent",
+    "fused_agent",
     "photographer_agent",
     "spec_agent",
     "code_agent",
     "extract_tag_content",
     "extract_products",
-    "extract_images"
+    "extract_images",
+    "AgentText",
+    "ProductList",
+    "ImageList",
+    "as_text"
 ]
\ No newline at end of file
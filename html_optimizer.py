@@ -0,0 +1,338 @@
+import os
+import re
+from html import escape
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from messages import Page, as_text
+from metrics import page_bytes
+from storefronts import storefront_store
+
+# --- Pós-processamento do HTML gerado ---
+#
+# O CodeGeneratorAgent devolve o <body> com todo o CSS numa tag <style> e as
+# fontes via @import do Google Fonts. Esta etapa (determinística, sem IA):
+#   1. extrai o CSS para um arquivo nomeado pelo hash do conteúdo (cache longo,
+#      compartilhado entre páginas e variantes com o mesmo estilo);
+#   2. remove as regras cujos seletores não existem no HTML e minifica HTML e CSS;
+#   3. troca o @import das fontes (cadeia que bloqueia a renderização) por
+#      preconnect/preload com display=swap.
+
+HTML_OPTIMIZE_ENABLED = os.getenv("HTML_OPTIMIZE_ENABLED", "1") != "0"
+# Remove as regras CSS que não se aplicam a nenhum elemento da página
+CSS_PRUNE_UNUSED = os.getenv("CSS_PRUNE_UNUSED", "1") != "0"
+
+FONT_HOSTS = ("fonts.googleapis.com",)
+FONT_FILES_ORIGIN = "https://fonts.gstatic.com"
+
+# At-rules cujo bloco contém outras regras (e não declarações)
+_GROUP_RULES = {"media", "supports", "container", "layer", "document", "-moz-document"}
+_KEYFRAMES = re.compile(r"^@(-[a-z]+-)?keyframes\b", re.I)
+
+# Strings e url(...) sem aspas viram marcadores antes do parse: podem conter ; { } e espaços
+_OPAQUE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|url\(\s*[^)"\'\s]*\s*\)', re.I)
+_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_MARK = re.compile(r"\x00(\d+)\x00")
+
+# --- CSS ---
+
+class _Css:
+    """CSS com strings protegidas, parseado em regras (sem dependências externas)."""
+
+    def __init__(self, css: str):
+        self.opaque = []
+
+        def protect(match):
+            self.opaque.append(match.group())
+            return f"\x00{len(self.opaque) - 1}\x00"
+
+        # Comentários só fora das strings: protege as strings, remove os comentários
+        text = _OPAQUE.sub(protect, css)
+        self.nodes = self._parse(_COMMENT.sub(" ", text), 0)[0]
+
+    def restore(self, text: str) -> str:
+        return _MARK.sub(lambda m: self.opaque[int(m.group(1))], text)
+
+    def _parse(self, css: str, pos: int) -> tuple:
+        """Lista de ("statement", texto), ("rule", seletor, corpo) e ("group", prelúdio, filhos)."""
+        nodes, start = [], pos
+        while pos < len(css):
+            char = css[pos]
+            if char == "{":
+                prelude = css[start:pos].strip()
+                at_name = prelude[1:].split(None, 1)[0].split("(")[0].lower() if prelude.startswith("@") else ""
+                if at_name in _GROUP_RULES or _KEYFRAMES.match(prelude):
+                    children, pos = self._parse(css, pos + 1)
+                    nodes.append(("group", prelude, children))
+                else:
+                    end = self._block_end(css, pos)
+                    nodes.append(("rule", prelude, css[pos + 1:end]))
+                    pos = end + 1
+                start = pos
+                continue
+            if char == ";":
+                if css[start:pos].strip():
+                    nodes.append(("statement", css[start:pos].strip()))
+                start = pos + 1
+            elif char == "}":
+                return nodes, pos + 1
+            pos += 1
+        return nodes, pos
+
+    @staticmethod
+    def _block_end(css: str, pos: int) -> int:
+        depth = 0
+        for i in range(pos, len(css)):
+            if css[i] == "{":
+                depth += 1
+            elif css[i] == "}":
+                depth -= 1
+                if depth == 0:
+                    return i
+        return len(css)
+
+def _squeeze(text: str) -> str:
+    return " ".join(text.split())
+
+def _split_selectors(prelude: str) -> list:
+    """Separa a lista de seletores nas vírgulas de fora dos parênteses (":is(.a, .b)")."""
+    selectors, depth, start = [], 0, 0
+    for i, char in enumerate(prelude):
+        depth += (char == "(") - (char == ")")
+        if char == "," and depth == 0:
+            selectors.append(prelude[start:i])
+            start = i + 1
+    selectors.append(prelude[start:])
+    return [s for s in selectors if s.strip()]
+
+def _minify_selector(selector: str) -> str:
+    return re.sub(r"\s*([,>+~])\s*", r"\1", _squeeze(selector))
+
+def _minify_prelude(prelude: str) -> str:
+    return re.sub(r"\(\s+", "(", re.sub(r"\s+\)", ")", re.sub(r"\s*([:,])\s*", r"\1", _squeeze(prelude))))
+
+def _minify_declarations(body: str, font_face: bool = False) -> str:
+    if "{" in body:
+        # CSS aninhado: só compacta os espaços
+        return _squeeze(body)
+    declarations = []
+    for declaration in body.split(";"):
+        name, colon, value = declaration.partition(":")
+        if not colon or not name.strip():
+            continue
+        value = re.sub(r"\s*!\s*important", "!important", re.sub(r"\s*,\s*", ",", _squeeze(value)))
+        declarations.append(f"{name.strip()}:{value}")
+    if font_face and not any(d.lower().startswith("font-display:") for d in declarations):
+        declarations.append("font-display:swap")
+    return ";".join(declarations)
+
+# Classes e IDs citados por um seletor (o conteúdo de :not(...) e [attr] não conta)
+_SELECTOR_CLASS = re.compile(r"\.(-?[_a-zA-Z][\w-]*)")
+_SELECTOR_ID = re.compile(r"#(-?[_a-zA-Z][\w-]*)")
+
+def _selector_used(selector: str, used: tuple) -> bool:
+    """
+    Conservador: o seletor só é descartado quando cita uma classe ou um ID que
+    não aparece no HTML. Tags não contam (o template base.html tem as suas).
+    """
+    selector = re.sub(r"\[[^\]]*\]", "", selector)
+    while "(" in selector:
+        inner = re.sub(r"\([^()]*\)", "", selector)
+        if inner == selector:
+            break
+        selector = inner
+    if "\\" in selector:
+        return True
+    classes, ids = used
+    return (all(name in classes for name in _SELECTOR_CLASS.findall(selector))
+            and all(name in ids for name in _SELECTOR_ID.findall(selector)))
+
+def _render(nodes: list, css: _Css, used: tuple, fonts: list, prune: bool = True) -> tuple:
+    """Serializa as regras minificadas. Retorna (css, seletores removidos)."""
+    out, removed = [], 0
+    for node in nodes:
+        kind, prelude = node[0], node[1]
+        if kind == "statement":
+            url = _font_import(css.restore(prelude))
+            if url:
+                fonts.append(url)
+            else:
+                out.append(f"{_minify_prelude(prelude)};")
+        elif kind == "group":
+            keyframes = bool(_KEYFRAMES.match(prelude))
+            body, count = _render(node[2], css, used, fonts, prune and not keyframes)
+            removed += count
+            if body:
+                out.append(f"{_minify_prelude(prelude)}{{{body}}}")
+        else:
+            selectors = [_minify_selector(s) for s in _split_selectors(prelude)]
+            if prune and used is not None and not prelude.startswith("@"):
+                kept = [s for s in selectors if _selector_used(s, used)]
+                removed += len(selectors) - len(kept)
+                selectors = kept
+            declarations = _minify_declarations(node[2], font_face=prelude.lower().startswith("@font-face"))
+            if selectors and declarations:
+                head = _minify_prelude(prelude) if prelude.startswith("@") else ",".join(selectors)
+                out.append(f"{head}{{{declarations}}}")
+    return "".join(out), removed
+
+def minify_css(css: str, used: tuple = None, fonts: list = None) -> tuple:
+    """
+    Minifica `css` e, com `used` (classes, ids), remove os seletores que não
+    existem na página. Os @import do Google Fonts saem do CSS e vão para
+    `fonts`. Retorna (css minificado, seletores removidos).
+    """
+    parsed = _Css(css)
+    body, removed = _render(parsed.nodes, parsed, used, fonts if fonts is not None else [])
+    return parsed.restore(body), removed
+
+# --- Fontes ---
+
+_IMPORT_URL = re.compile(r"""^@import\s+(?:url\(\s*)?["']?([^"')\s]+)["']?""", re.I)
+
+def _font_import(statement: str) -> str:
+    """URL do @import se for uma folha de fontes do Google Fonts, senão ""."""
+    match = _IMPORT_URL.match(statement)
+    if match and urlsplit(match.group(1)).hostname in FONT_HOSTS:
+        return match.group(1)
+    return ""
+
+def font_display_swap(url: str) -> str:
+    """A mesma URL de fontes com display=swap (texto aparece com a fonte local até a web font chegar)."""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "display"]
+    query.append(("display", "swap"))
+    return urlunsplit(parts._replace(query=urlencode(query, safe=":@;,+")))
+
+def font_hints(urls: list) -> str:
+    """
+    preconnect com as origens das fontes e preload da folha de estilos, que
+    vira stylesheet ao carregar: não bloqueia a renderização.
+    """
+    if not urls:
+        return ""
+    origins = dict.fromkeys(f"{urlsplit(url).scheme}://{urlsplit(url).netloc}" for url in urls)
+    tags = [f'<link rel="preconnect" href="{origin}">' for origin in origins]
+    tags.append(f'<link rel="preconnect" href="{FONT_FILES_ORIGIN}" crossorigin>')
+    for url in dict.fromkeys(urls):
+        href = escape(font_display_swap(url), quote=True)
+        tags.append(f'<link rel="preload" as="style" href="{href}" onload="this.onload=null;this.rel=\'stylesheet\'">')
+        tags.append(f'<noscript><link rel="stylesheet" href="{href}"></noscript>')
+    return "".join(tags)
+
+# --- HTML ---
+
+_STYLE = re.compile(r"<style\b([^>]*)>(.*?)</style\s*>", re.I | re.S)
+_FONT_LINK = re.compile(r"<link\b[^>]*\bhref=[\"']([^\"']+)[\"'][^>]*>", re.I)
+_RAW_BLOCKS = re.compile(r"<(script|pre|textarea)\b.*?</\1\s*>", re.I | re.S)
+_HTML_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.S)
+_ATTRIBUTE = re.compile(r"""\b(class|id)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.I)
+# Código JavaScript fora dos <script>: handlers (onclick="...") e links javascript:
+_INLINE_SCRIPT = re.compile(
+    r"""\b(?:on[a-z]+\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))"""
+    r"""|href\s*=\s*(?:"\s*javascript:([^"]*)"|'\s*javascript:([^']*)'))""", re.I)
+_EXTERNAL_SCRIPT = re.compile(r"<script\b[^>]*\bsrc\s*=", re.I)
+_MEDIA_ATTRIBUTE = re.compile(r"""\bmedia\s*=\s*["']([^"']+)["']""", re.I)
+_BETWEEN_TAGS = re.compile(r"(</?([a-zA-Z][\w-]*)[^>]*>)\s+(?=</?([a-zA-Z][\w-]*))")
+
+# Espaços entre tags de bloco não aparecem na página; entre tags inline viram um espaço
+BLOCK_TAGS = {
+    "html", "head", "body", "header", "footer", "main", "nav", "section", "article", "aside",
+    "div", "p", "ul", "ol", "li", "dl", "dt", "dd", "table", "thead", "tbody", "tfoot", "tr", "td", "th",
+    "h1", "h2", "h3", "h4", "h5", "h6", "form", "fieldset", "figure", "figcaption", "picture", "source",
+    "link", "meta", "style", "script", "noscript", "br", "hr", "title", "template",
+}
+
+def used_names(html: str) -> Optional[tuple]:
+    """
+    Classes e IDs presentes no HTML. Palavras do código JavaScript (<script>,
+    handlers on* e links javascript:) também contam: classes adicionadas em
+    tempo de execução (ex.: classList.add("active")) não podem ser removidas.
+    Com um script externo (<script src>), cujo código não dá para ler,
+    retorna None: nenhuma regra é removida.
+    """
+    if _EXTERNAL_SCRIPT.search(html):
+        return None
+    classes, ids = set(), set()
+    for match in _ATTRIBUTE.finditer(html):
+        value = next(v for v in match.groups()[1:] if v is not None)
+        (classes if match.group(1).lower() == "class" else ids).update(value.split())
+    scripts = re.findall(r"<script\b[^>]*>(.*?)</script\s*>", html, re.I | re.S)
+    scripts += [next(v for v in match.groups() if v is not None) for match in _INLINE_SCRIPT.finditer(html)]
+    for script in scripts:
+        words = set(re.findall(r"[\w-]+", script))
+        classes.update(words)
+        ids.update(words)
+    return classes, ids
+
+def minify_html(html: str) -> str:
+    """Remove comentários e espaços redundantes (sem tocar em <script>, <pre> e <textarea>)."""
+    raw = []
+
+    def protect(match):
+        raw.append(match.group())
+        return f"\x00{len(raw) - 1}\x00"
+
+    text = _HTML_COMMENT.sub("", _RAW_BLOCKS.sub(protect, html))
+    text = re.sub(r"\s+", " ", text)
+
+    def between(match):
+        block = match.group(2).lower() in BLOCK_TAGS or match.group(3).lower() in BLOCK_TAGS
+        return match.group(1) if block else f"{match.group(1)} "
+
+    text = _BETWEEN_TAGS.sub(between, text).strip()
+    return _MARK.sub(lambda m: raw[int(m.group(1))], text)
+
+def optimize_html(html: str) -> Page:
+    """
+    Extrai o CSS inline para um arquivo com hash (gravado em /s/assets), poda e
+    minifica o CSS, minifica o HTML e coloca os hints das fontes no início.
+    """
+    original_bytes = len(html.encode("utf-8"))
+    blocks = []
+
+    def extract(match):
+        media = _MEDIA_ATTRIBUTE.search(match.group(1))
+        blocks.append(f"@media {media.group(1)}{{{match.group(2)}}}" if media else match.group(2))
+        return ""
+
+    body = _STYLE.sub(extract, html)
+    fonts = []
+
+    def font_link(match):
+        if urlsplit(match.group(1)).hostname in FONT_HOSTS and "stylesheet" in match.group().lower():
+            fonts.append(match.group(1).replace("&amp;", "&"))
+            return ""
+        return match.group()
+
+    body = _FONT_LINK.sub(font_link, body)
+    used = used_names(body) if CSS_PRUNE_UNUSED else None
+    # Os @import ficam antes das regras; o mesmo vale depois de juntar os blocos
+    css, removed = minify_css("\n".join(blocks), used, fonts)
+    stylesheet = storefront_store.save_asset(css) if css else ""
+    head = font_hints(fonts) + (f'<link rel="stylesheet" href="{stylesheet}">' if stylesheet else "")
+    page_html = head + minify_html(body)
+
+    css_bytes = len(css.encode("utf-8"))
+    page = Page(page_html, css, stylesheet, original_bytes, len(page_html.encode("utf-8")) + css_bytes)
+    print(f"🗜️ Página otimizada: {original_bytes / 1024:.1f} KB → HTML {(page.optimized_bytes - css_bytes) / 1024:.1f} KB"
+          f" + CSS {css_bytes / 1024:.1f} KB (em cache nas visitas seguintes); {removed} seletores sem uso"
+          f" removidos, {len(dict.fromkeys(fonts))} folha(s) de fontes com preload")
+    return page
+
+def optimize_page(code) -> Page:
+    """Etapa de pós-processamento do código gerado (com HTML_OPTIMIZE_ENABLED=0, só repassa o HTML)."""
+    html = as_text(code, tag="generated_code")
+    if not HTML_OPTIMIZE_ENABLED:
+        size = len(html.encode("utf-8"))
+        return Page(html, original_bytes=size, optimized_bytes=size)
+    try:
+        page = optimize_html(html)
+    except Exception as e:
+        # Otimização é opcional: em caso de erro a página segue como foi gerada
+        print(f"⚠️ Não foi possível otimizar o HTML gerado: {e}")
+        size = len(html.encode("utf-8"))
+        return Page(html, original_bytes=size, optimized_bytes=size)
+    page_bytes.inc(page.original_bytes, kind="original")
+    page_bytes.inc(page.optimized_bytes, kind="optimized")
+    return page
@@ -0,0 +1,171 @@
+import contextvars
+import os
+import struct
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+
+from image_store import image_store
+from messages import AgentText, Image, ImageList, ImageVariant, as_images
+
+try:
+    from PIL import Image as PILImage
+except ImportError:  # Pillow é opcional: sem ele as imagens seguem como PNG original
+    PILImage = None
+
+# Larguras geradas para cada imagem e largura em que o card exibe a imagem
+IMAGE_VARIANT_WIDTHS = tuple(int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "200,400,800").split(","))
+IMAGE_DISPLAY_WIDTH = int(os.getenv("IMAGE_DISPLAY_WIDTH", "200"))
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "80"))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "82"))
+
+FORMATS = ("webp", "jpeg")
+_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+def url_to_path(url: str) -> str:
+    """Converte a URL local ("/static/images/x.png") no caminho do arquivo."""
+    return url.lstrip("/")
+
+def variant_url(image_url: str, width: int, fmt: str) -> str:
+    """Nome determinístico da variante: /static/images/<nome>-<largura>w.<ext>."""
+    stem, _ = os.path.splitext(image_url)
+    return f"{stem}-{width}w.{_EXTENSIONS[fmt]}"
+
+def relink_images(code, plan, images):
+    """
+    Troca no HTML os caminhos reservados pelo `plan` pelos caminhos onde as
+    imagens foram de fato gravadas (incluindo as variantes, que derivam do nome).
+    Diferem quando o caminho reservado já tinha outra imagem, ex.: uma
+    regeneração das imagens de uma página já publicada.
+    """
+    text = code.text if isinstance(code, AgentText) else code
+    saved = {image.product_name: image.image_url for image in as_images(images)}
+    for planned in as_images(plan):
+        image_url = saved.get(planned.product_name)
+        if image_url and planned.image_url and image_url != planned.image_url:
+            text = text.replace(os.path.splitext(planned.image_url)[0], os.path.splitext(image_url)[0])
+    return code._replace(text=text) if isinstance(code, AgentText) else text
+
+def _variant_widths(orig_w: int, widths) -> list:
+    return sorted(set(w for w in widths if w < orig_w) or {orig_w})
+
+def plan_image(product_name: str, image_url: str, size: str = "1024x1024",
+               widths=IMAGE_VARIANT_WIDTHS) -> Image:
+    """
+    Reserva uma imagem antes de ela existir: com o tamanho pedido ao DALL-E já
+    se sabe o nome e as dimensões de todas as variantes, então o HTML pode ser
+    gerado enquanto a imagem ainda está sendo criada.
+    """
+    orig_w, orig_h = (int(v) for v in size.split("x"))
+    if PILImage is None:
+        return Image(product_name, image_url, orig_w, orig_h)
+    variants = tuple(
+        ImageVariant(fmt, width, round(orig_h * width / orig_w), variant_url(image_url, width, fmt))
+        for width in _variant_widths(orig_w, widths) for fmt in FORMATS
+    )
+    return Image(product_name, image_url, orig_w, orig_h, variants)
+
+def placeholder_png(width: int, height: int, gray: int = 235) -> bytes:
+    """PNG de uma cor só (gerado sem Pillow), usado quando a imagem não pôde ser criada."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    row = b"\x00" + bytes([gray]) * (width * 3)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(row * height, 9)) + chunk(b"IEND", b""))
+
+def _save_variant(img, path: str, fmt: str, product: str, parent: str, variant: str) -> None:
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+    if fmt == "webp":
+        img.save(tmp_path, "WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        img.save(tmp_path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    image_store.put_file(tmp_path, path, product, parent=parent, variant=variant)
+
+def optimize_image(image: Image, widths=IMAGE_VARIANT_WIDTHS) -> Image:
+    """
+    Gera as variantes redimensionadas (WebP e JPEG) de uma imagem salva.
+    As variantes ficam no armazenamento de imagens ligadas ao original: se o
+    mesmo conteúdo já foi otimizado (em qualquer caminho), elas são só
+    reaproveitadas. Em caso de erro, a imagem original é devolvida sem variantes.
+    """
+    if PILImage is None or not image.image_url:
+        return image
+    try:
+        original_path = url_to_path(image.image_url)
+        original_digest = image_store.digest(original_path)
+        with PILImage.open(original_path) as opened:
+            # Só decodifica os pixels se alguma variante precisar ser gerada
+            orig_w, orig_h = opened.size
+            original = None
+            variants = []
+            for width in _variant_widths(orig_w, widths):
+                height = round(orig_h * width / orig_w)
+                resized = None
+                for fmt in FORMATS:
+                    url = variant_url(image.image_url, width, fmt)
+                    path = url_to_path(url)
+                    name = f"{width}w.{_EXTENSIONS[fmt]}"
+                    # A imagem de um slot pode ser gerada de novo (regeneração): variantes de outro original são refeitas
+                    current = image_store.digest(path) if os.path.exists(path) else None
+                    if current is None or image_store.parent(current) != original_digest:
+                        if image_store.link_variant(original_digest, name, path, image.product_name) is None:
+                            if resized is None:
+                                original = original or opened.convert("RGB")
+                                resized = original.resize((width, height), PILImage.LANCZOS)
+                            _save_variant(resized, path, fmt, image.product_name, original_digest, name)
+                    variants.append(ImageVariant(fmt, width, height, url))
+        return image._replace(width=orig_w, height=orig_h, variants=tuple(variants))
+    except Exception as e:
+        print(f"⚠️ Não foi possível otimizar a imagem de '{image.product_name}': {e}")
+        return image
+
+def optimize_images(images) -> ImageList:
+    """Etapa de pós-processamento: otimiza todas as imagens em paralelo."""
+    items = as_images(images)
+    if PILImage is None:
+        print("⚠️ Pillow não instalado: imagens servidas sem variantes otimizadas")
+        return ImageList(tuple(items))
+    with ThreadPoolExecutor(max_workers=max(len(items), 1)) as executor:
+        optimized = list(executor.map(lambda img: contextvars.copy_context().run(optimize_image, img), items))
+    saved = sum(_bytes(img.image_url) for img in items)
+    served = sum(_bytes(_display_variant(img).url) for img in optimized if img.variants)
+    if served:
+        print(f"🗜️ Imagens otimizadas: {saved / 1024:.0f} KB originais → {served / 1024:.0f} KB por página")
+    return ImageList(tuple(optimized))
+
+def _bytes(url: str) -> int:
+    try:
+        return os.path.getsize(url_to_path(url))
+    except OSError:
+        return 0
+
+def _display_variant(image: Image, fmt: str = "webp") -> ImageVariant:
+    """Menor variante que cobre a largura exibida (ou a maior disponível)."""
+    candidates = [v for v in image.variants if v.format == fmt]
+    fitting = [v for v in candidates if v.width >= IMAGE_DISPLAY_WIDTH]
+    return min(fitting, key=lambda v: v.width) if fitting else max(candidates, key=lambda v: v.width)
+
+def image_tag(image: Image, alt: str = None, style: str = None) -> str:
+    """
+    Tag HTML da imagem. Com variantes: <picture> com srcset WebP e fallback
+    JPEG, width/height explícitos e carregamento lazy. Sem variantes: <img> simples.
+    """
+    alt = escape(alt if alt is not None else image.product_name, quote=True)
+    style = style or f"width:{IMAGE_DISPLAY_WIDTH}px; height:auto; object-fit: cover;"
+    if not image.variants:
+        return f'<img src="{escape(image.image_url or "", quote=True)}" alt="{alt}" style="{style}" loading="lazy">'
+
+    sizes = f"{IMAGE_DISPLAY_WIDTH}px"
+    webp_srcset = ", ".join(f"{v.url} {v.width}w" for v in image.variants if v.format == "webp")
+    jpeg_srcset = ", ".join(f"{v.url} {v.width}w" for v in image.variants if v.format == "jpeg")
+    fallback = _display_variant(image, "jpeg")
+    return (
+        f'<picture>'
+        f'<source type="image/webp" srcset="{webp_srcset}" sizes="{sizes}">'
+        f'<img src="{fallback.url}" srcset="{jpeg_srcset}" sizes="{sizes}" '
+        f'width="{fallback.width}" height="{fallback.height}" alt="{alt}" '
+        f'loading="lazy" decoding="async" style="{style}">'
+        f'</picture>'
+    )
@@ -0,0 +1,270 @@
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+# --- Configuração via variáveis de ambiente ---
+
+# Conteúdo das imagens, um arquivo por hash (sha256): bytes idênticos são gravados uma vez só
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", os.path.join("static", "images", "blobs"))
+IMAGE_STORE_DB_PATH = os.getenv("IMAGE_STORE_DB_PATH", "images.sqlite3")
+# Espaço máximo ocupado pelas imagens (originais + variantes); 0 = sem limite
+IMAGE_STORE_QUOTA_MB = float(os.getenv("IMAGE_STORE_QUOTA_MB", "2048"))
+IMAGE_GC_INTERVAL = float(os.getenv("IMAGE_GC_INTERVAL", "600"))
+# Imagens usadas há menos tempo que isso nunca são removidas (podem estar sendo geradas agora)
+IMAGE_GC_GRACE_SECONDS = float(os.getenv("IMAGE_GC_GRACE_SECONDS", "600"))
+
+# Caminhos de imagem citados numa página (src, srcset, url(...))
+_PAGE_IMAGE = re.compile(r"/static/images/[^\s\"'<>(),]+")
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+class ImageStore:
+    """
+    Imagens endereçadas pelo conteúdo. Cada arquivo que o HTML referencia
+    (o caminho reservado de um produto ou uma variante) é um hard link para o
+    blob com o hash do seu conteúdo, então imagens repetidas ocupam o disco uma
+    vez só e os caminhos já entregues continuam válidos.
+
+    O índice em SQLite guarda os blobs (tamanho, último uso e, nas variantes,
+    o blob original de onde vieram) e as referências (caminho → blob, produto).
+    Quando o total passa da cota, `collect` remove os blobs usados há mais
+    tempo, junto com suas variantes e todos os caminhos que apontam para eles,
+    exceto os caminhos fixados por uma página salva (`pin`).
+    """
+    def __init__(self, path: str = IMAGE_STORE_DB_PATH, directory: str = IMAGE_STORE_DIR,
+                 quota_mb: float = IMAGE_STORE_QUOTA_MB):
+        self.path = path
+        self.directory = directory
+        self.quota_bytes = int(quota_mb * 1024 * 1024)
+        self._wakeup = threading.Event()
+        self._thread = None
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                " digest TEXT PRIMARY KEY, ext TEXT NOT NULL, size INTEGER NOT NULL,"
+                " parent TEXT, variant TEXT, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS blobs_parent ON blobs (parent, variant)")
+            conn.execute("CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS refs ("
+                " path TEXT PRIMARY KEY, digest TEXT NOT NULL, product TEXT, created REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS refs_digest ON refs (digest)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pins ("
+                " path TEXT NOT NULL, page TEXT NOT NULL, created REAL NOT NULL, PRIMARY KEY (path, page))"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def blob_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}{ext}")
+
+    # --- Gravação ---
+
+    def put_file(self, tmp_path: str, path: str, product: str = "",
+                 parent: str = None, variant: str = None) -> str:
+        """
+        Guarda o arquivo temporário `tmp_path` (que é consumido) e faz `path`
+        apontar para ele. Se o mesmo conteúdo já existe, só cria o link.
+        Retorna o hash do conteúdo.
+        """
+        digest = file_digest(tmp_path)
+        known = self._blob(digest)
+        ext = known["ext"] if known is not None else os.path.splitext(path)[1]
+        blob = self.blob_path(digest, ext)
+        if os.path.exists(blob):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(tmp_path, blob)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO blobs (digest, ext, size, parent, variant, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (digest) DO UPDATE SET last_used = excluded.last_used",
+                (digest, ext, os.path.getsize(blob), parent, variant, now, now)
+            )
+        self._link(digest, blob, path, product)
+        if self.quota_bytes and self.total_bytes() > self.quota_bytes:
+            self._wakeup.set()
+        return digest
+
+    def free_path(self, path: str, digest: str) -> str:
+        """
+        Caminho onde gravar o conteúdo `digest` sem trocar o de um arquivo já
+        entregue: o próprio `path` se ainda não existe (ou já tem esse conteúdo);
+        senão, um caminho irmão com o hash no nome.
+        """
+        if not os.path.exists(path) or self.digest(path) == digest:
+            return path
+        stem, ext = os.path.splitext(path)
+        return f"{stem}-{digest[:10]}{ext}"
+
+    def put_bytes(self, data: bytes, path: str, product: str = "", **kwargs) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return self.put_file(tmp_path, path, product, **kwargs)
+
+    def link(self, src_path: str, path: str, product: str = "") -> str:
+        """Faz `path` apontar para o mesmo conteúdo de `src_path` (ex.: imagem vinda do cache)."""
+        digest = self.digest(src_path)
+        row = self._blob(digest)
+        if row is None:
+            # Arquivo anterior ao índice: entra no armazenamento agora
+            tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+            shutil.copyfile(src_path, tmp_path)
+            return self.put_file(tmp_path, path, product)
+        with self._connect() as conn:
+            conn.execute("UPDATE blobs SET last_used = ? WHERE digest = ?", (time.time(), digest))
+        self._link(digest, self.blob_path(digest, row["ext"]), path, product)
+        return digest
+
+    def link_variant(self, parent: str, variant: str, path: str, product: str = "") -> Optional[str]:
+        """Reaproveita uma variante já gerada do mesmo original; retorna None se ainda não existe."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT digest, ext FROM blobs WHERE parent = ? AND variant = ?",
+                               (parent, variant)).fetchone()
+        if row is None or not os.path.exists(self.blob_path(row["digest"], row["ext"])):
+            return None
+        self._link(row["digest"], self.blob_path(row["digest"], row["ext"]), path, product)
+        return row["digest"]
+
+    def _link(self, digest: str, blob: str, path: str, product: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+        try:
+            os.link(blob, tmp_path)
+        except OSError:
+            # Sistema de arquivos sem hard links: cópia (sem economia de disco, mas funciona)
+            shutil.copyfile(blob, tmp_path)
+        os.replace(tmp_path, path)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO refs (path, digest, product, created) VALUES (?, ?, ?, ?)",
+                         (os.path.normpath(path), digest, product, time.time()))
+
+    def pin(self, html: str, page: str) -> int:
+        """
+        Fixa as imagens que o HTML `html` cita, em nome da página `page`: as
+        páginas salvas são servidas com cache imutável, então essas imagens
+        nunca são removidas pela coleta. Retorna quantos caminhos foram fixados.
+        """
+        paths = {os.path.normpath(url.lstrip("/")) for url in _PAGE_IMAGE.findall(html)}
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany("INSERT OR IGNORE INTO pins (path, page, created) VALUES (?, ?, ?)",
+                             [(path, page, now) for path in paths])
+        return len(paths)
+
+    # --- Consulta ---
+
+    def _blob(self, digest: str):
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM blobs WHERE digest = ?", (digest,)).fetchone()
+
+    def digest(self, path: str) -> str:
+        """Hash do conteúdo de `path` (pelo índice; arquivos fora dele são lidos)."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT digest FROM refs WHERE path = ?", (os.path.normpath(path),)).fetchone()
+        if row is not None and os.path.exists(path):
+            return row["digest"]
+        return file_digest(path)
+
+    def parent(self, digest: str) -> Optional[str]:
+        row = self._blob(digest)
+        return row["parent"] if row is not None else None
+
+    def total_bytes(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    # --- Coleta de lixo ---
+
+    def collect(self) -> dict:
+        """
+        Enquanto o total passar da cota, remove o original usado há mais tempo,
+        suas variantes e os caminhos que apontam para eles.
+        """
+        total = self.total_bytes()
+        removed = {"blobs": 0, "paths": 0, "bytes": 0}
+        if not self.quota_bytes or total <= self.quota_bytes:
+            return removed
+        cutoff = time.time() - IMAGE_GC_GRACE_SECONDS
+        with self._connect() as conn:
+            candidates = conn.execute(
+                "SELECT digest FROM blobs WHERE parent IS NULL AND last_used < ? ORDER BY last_used",
+                (cutoff,)
+            ).fetchall()
+        for candidate in candidates:
+            if total <= self.quota_bytes:
+                break
+            freed, blobs, paths = self._evict(candidate["digest"], cutoff)
+            total -= freed
+            removed["blobs"] += blobs
+            removed["paths"] += paths
+            removed["bytes"] += freed
+        if removed["blobs"]:
+            print(f"🧹 Imagens: {removed['blobs']} blobs e {removed['paths']} caminhos removidos "
+                  f"({removed['bytes'] / 1024 / 1024:.1f} MB liberados, {total / 1024 / 1024:.1f} MB em uso)")
+        return removed
+
+    def _evict(self, digest: str, cutoff: float) -> tuple:
+        with self._connect() as conn:
+            # Reusado depois da consulta (ex.: cache de outra requisição): fica
+            if conn.execute("SELECT 1 FROM blobs WHERE digest = ? AND last_used < ?",
+                            (digest, cutoff)).fetchone() is None:
+                return 0, 0, 0
+            blobs = conn.execute("SELECT digest, ext, size FROM blobs WHERE digest = ? OR parent = ?",
+                                 (digest, digest)).fetchall()
+            digests = [row["digest"] for row in blobs]
+            marks = ",".join("?" * len(digests))
+            # Original ou variante citado por uma página salva: fica
+            if conn.execute("SELECT 1 FROM refs JOIN pins ON pins.path = refs.path"
+                            f" WHERE refs.digest IN ({marks}) LIMIT 1", digests).fetchone() is not None:
+                return 0, 0, 0
+            paths = [row["path"] for row in conn.execute(
+                f"SELECT path FROM refs WHERE digest IN ({marks})", digests)]
+            conn.execute(f"DELETE FROM refs WHERE digest IN ({marks})", digests)
+            conn.execute(f"DELETE FROM blobs WHERE digest IN ({marks})", digests)
+        for path in paths + [self.blob_path(row["digest"], row["ext"]) for row in blobs]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return sum(row["size"] for row in blobs), len(blobs), len(paths)
+
+    def start_gc(self, interval: float = IMAGE_GC_INTERVAL) -> None:
+        """Coleta em segundo plano: a cada `interval` segundos ou logo que a cota é ultrapassada."""
+        if self._thread or not self.quota_bytes:
+            return
+
+        def loop():
+            while True:
+                try:
+                    self.collect()
+                except Exception as e:
+                    print(f"❌ Erro na coleta de imagens: {e}")
+                self._wakeup.wait(interval)
+                self._wakeup.clear()
+
+        self._thread = threading.Thread(target=loop, name="image-gc", daemon=True)
+        self._thread.start()
+
+image_store = ImageStore()
@@ -0,0 +1,207 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from cache import bypass_cache
+from metrics import trace
+from pipeline import run_pipeline
+from ratelimit import BATCH, request_priority
+
+# Configuração via variáveis de ambiente
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.sqlite3")
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# Cada processo renova a cada JOB_HEARTBEAT_SECONDS os jobs que está rodando;
+# um job "running" sem renovação há JOB_LEASE_SECONDS é de um processo que morreu
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+# Prioridade no limite de taxa da OpenAI: jobs rodam em segundo plano, atrás das gerações interativas
+JOB_PRIORITY = os.getenv("JOB_PRIORITY", BATCH)
+
+class JobQueue:
+    """
+    Fila de gerações persistida em SQLite, consumida por um pool local de
+    threads (um por processo; vários processos podem dividir a mesma fila).
+    Cada job em andamento tem o dono (`worker`) e um `heartbeat` renovado
+    enquanto ele roda: só jobs com o heartbeat vencido, de um processo que
+    morreu, voltam para a fila.
+    """
+    def __init__(self, path: str = JOB_DB_PATH, workers: int = JOB_WORKERS):
+        self.path = path
+        self.workers = workers
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._running = set()
+        self._running_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, product TEXT NOT NULL, fresh INTEGER NOT NULL DEFAULT 0,"
+                " status TEXT NOT NULL, result TEXT, error TEXT, timings TEXT,"
+                " created REAL NOT NULL, started REAL, finished REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+            # Bancos criados antes da regeneração incremental não têm a coluna run_id
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "run_id" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN run_id TEXT")
+            if "worker" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN worker TEXT")
+                conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat REAL")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # --- API usada pelas rotas ---
+
+    def enqueue(self, product: str, fresh: bool = False) -> str:
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, product, fresh, status, created) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, product, int(fresh), time.time())
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: str) -> dict or None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["timings"] = json.loads(job["timings"]) if job["timings"] else None
+        if job["status"] == "queued":
+            with self._connect() as conn:
+                job["position"] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created <= ?", (job["created"],)
+                ).fetchone()[0]
+        return job
+
+    # --- Pool de workers ---
+
+    def start(self) -> None:
+        """Inicia o pool deste processo (chamado na inicialização do app; idempotente)."""
+        with self._start_lock:
+            if self._threads or self.workers <= 0:
+                return
+            self.requeue_stale()
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"👷 Pool de jobs iniciado com {self.workers} worker(s) ({self.worker_id})")
+
+    def requeue_stale(self, lease: float = JOB_LEASE_SECONDS) -> int:
+        """
+        Devolve à fila os jobs "running" cujo heartbeat venceu (o processo que
+        os rodava morreu). Jobs de outros processos vivos não são tocados.
+        """
+        with self._connect() as conn:
+            resumed = conn.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL, worker = NULL, heartbeat = NULL"
+                " WHERE status = 'running' AND COALESCE(heartbeat, started, 0) < ?",
+                (time.time() - lease,)
+            ).rowcount
+        if resumed:
+            print(f"🔁 {resumed} job(s) interrompido(s) voltaram para a fila")
+        return resumed
+
+    def _heartbeat(self) -> None:
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._running_lock:
+                running = list(self._running)
+            try:
+                if running:
+                    with self._connect() as conn:
+                        conn.execute(
+                            "UPDATE jobs SET heartbeat = ? WHERE worker = ? AND status = 'running'"
+                            f" AND id IN ({','.join('?' * len(running))})",
+                            (time.time(), self.worker_id, *running)
+                        )
+                # Aproveita o ciclo para recuperar jobs de processos que morreram
+                self.requeue_stale()
+            except sqlite3.Error as e:
+                print(f"⚠️ Não foi possível renovar o heartbeat dos jobs: {e}")
+
+    def _claim(self) -> dict or None:
+        """Reserva atomicamente o job mais antigo da fila."""
+        with self._connect() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = 'running', started = ?, worker = ?, heartbeat = ?"
+                    " WHERE id = ? AND status = 'queued'",
+                    (now, self.worker_id, now, row["id"])
+                ).rowcount
+                conn.commit()
+                if claimed:
+                    return dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def _work(self) -> None:
+        while True:
+            # Um erro no banco (ex.: "database is locked") não pode matar o worker:
+            # registra, espera um ciclo e tenta de novo
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"❌ Erro ao buscar o próximo job da fila: {e}")
+                time.sleep(JOB_POLL_SECONDS)
+                continue
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(JOB_POLL_SECONDS)
+                continue
+            with self._running_lock:
+                self._running.add(job["id"])
+            try:
+                self._run(job)
+            except Exception as e:
+                # Falha ao gravar o resultado: o job fica "running" e volta à fila quando o lease expirar
+                print(f"❌ [job {job['id']}] Erro ao registrar o resultado: {e}")
+                time.sleep(JOB_POLL_SECONDS)
+            finally:
+                with self._running_lock:
+                    self._running.discard(job["id"])
+
+    def _run(self, job: dict) -> None:
+        print(f"\n🚀 [job {job['id']}] Iniciando geração de e-commerce para: {job['product']}")
+        try:
+            with trace(job["id"][:16]), bypass_cache(bool(job["fresh"])), request_priority(JOB_PRIORITY):
+                result = run_pipeline(job["product"])
+            page_html = result.outputs["page"].html
+            timings = [{"stage": t.name, "start": t.start, "finish": t.finish} for t in result.timings]
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE jobs SET status = 'done', result = ?, timings = ?, run_id = ?, finished = ?"
+                    " WHERE id = ?",
+                    (page_html, json.dumps(timings), result.run_id, time.time(), job["id"])
+                )
+            print(f"✅ [job {job['id']}] Concluído em {result.total:.2f}s")
+        except Exception as e:
+            print(f"❌ [job {job['id']}] Erro durante a geração: {str(e)}")
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE jobs SET status = 'error', error = ?, finished = ? WHERE id = ?",
+                    (str(e), time.time(), job["id"])
+                )
+
+job_queue = JobQueue()
@@ -0,0 +1,172 @@
+import xml.etree.ElementTree as ET
+from typing import NamedTuple, Tuple
+
+# --- Mensagens trocadas entre os agentes ---
+#
+# Dentro do processo os agentes trocam estas tuplas imutáveis (sem __dict__).
+# O XML só é gerado sob demanda com `to_xml()`, para logs ou APIs externas;
+# os agentes continuam aceitando XML na entrada por compatibilidade.
+
+class AgentText(NamedTuple):
+    """Saída textual de um agente (contexto, persona, UX, especificação, código)."""
+    agent: str
+    text: str
+    tag: str = "content"
+
+    def to_xml(self) -> str:
+        return wrap_xml(self.agent, self.text, tag=self.tag)
+
+    @classmethod
+    def from_xml(cls, xml_str: str, tag: str = "content") -> "AgentText":
+        root = ET.fromstring(xml_str)
+        agent = root.find("agent")
+        return cls(agent.text if agent is not None else "", extract_tag_content(xml_str, tag), tag)
+
+class Specification(NamedTuple):
+    """
+    Especificação técnica validada (schemas.SpecificationSchema): `data` tem os
+    campos tipados (cores HEX, fontes, tamanhos) e `text` a versão legível que
+    o CodeGeneratorAgent recebe.
+    """
+    agent: str
+    text: str
+    data: dict
+    tag: str = "specification"
+
+    def to_xml(self) -> str:
+        return wrap_xml(self.agent, self.text, tag=self.tag)
+
+class Page(NamedTuple):
+    """
+    Código do CodeGeneratorAgent depois do pós-processamento (html_optimizer.py):
+    HTML minificado que carrega o CSS extraído de `stylesheet` (/s/assets/<hash>.css).
+    """
+    html: str
+    css: str = ""
+    stylesheet: str = ""
+    # Bytes antes (HTML com o CSS inline) e depois (HTML + CSS) da otimização
+    original_bytes: int = 0
+    optimized_bytes: int = 0
+
+    def inline(self) -> str:
+        """HTML autocontido, com o CSS numa tag <style> (páginas gravadas fora do servidor)."""
+        if not self.stylesheet:
+            return self.html
+        return self.html.replace(f'<link rel="stylesheet" href="{self.stylesheet}">',
+                                 f"<style>{self.css}</style>", 1)
+
+class Product(NamedTuple):
+    nome: str
+    descricao: str
+    preco: float
+
+class ProductList(NamedTuple):
+    items: Tuple[Product, ...]
+
+    def to_xml(self) -> str:
+        return wrap_products([p._asdict() for p in self.items])
+
+    @classmethod
+    def from_xml(cls, xml_str: str) -> "ProductList":
+        return cls(tuple(Product(**p) for p in extract_products(xml_str)))
+
+class ImageVariant(NamedTuple):
+    format: str  # "webp" ou "jpeg"
+    width: int
+    height: int
+    url: str
+
+class Image(NamedTuple):
+    product_name: str
+    image_url: str
+    # Preenchidos pela etapa de otimização (image_optimizer.py)
+    width: int = 0
+    height: int = 0
+    variants: Tuple[ImageVariant, ...] = ()
+    # Hash do conteúdo do arquivo: muda quando a imagem do slot é gerada de novo
+    digest: str = ""
+
+class ImageList(NamedTuple):
+    items: Tuple[Image, ...]
+
+    def to_xml(self) -> str:
+        return wrap_images([img._asdict() for img in self.items])
+
+    @classmethod
+    def from_xml(cls, xml_str: str) -> "ImageList":
+        return cls(tuple(Image(**img) for img in extract_images(xml_str)))
+
+# Aceitam tanto a mensagem tipada quanto o XML antigo
+
+def as_text(message, tag: str = "content") -> str:
+    if isinstance(message, (AgentText, Specification)):
+        return message.text
+    return extract_tag_content(message, tag=tag)
+
+def as_products(message) -> Tuple[Product, ...]:
+    if isinstance(message, ProductList):
+        return message.items
+    return ProductList.from_xml(message).items
+
+def as_images(message) -> Tuple[Image, ...]:
+    if isinstance(message, ImageList):
+        return message.items
+    return ImageList.from_xml(message).items
+
+# --- Serialização XML ---
+
+def wrap_xml(agent_name: str, content: str, tag: str = "content") -> str:
+    root = ET.Element("result")
+    agent_elem = ET.SubElement(root, "agent")
+    agent_elem.text = agent_name
+    content_elem = ET.SubElement(root, tag)
+    content_elem.text = content
+    return ET.tostring(root, encoding="unicode")
+
+def extract_tag_content(xml_str: str, tag: str = "content") -> str:
+    root = ET.fromstring(xml_str)
+    elem = root.find(tag)
+    return elem.text if elem is not None else ""
+
+# Para dados estruturados de produtos
+def wrap_products(products: list) -> str:
+    root = ET.Element("products")
+    for prod in products:
+        prod_elem = ET.SubElement(root, "product")
+        nome_elem = ET.SubElement(prod_elem, "nome")
+        nome_elem.text = prod["nome"]
+        desc_elem = ET.SubElement(prod_elem, "descricao")
+        desc_elem.text = prod["descricao"]
+        preco_elem = ET.SubElement(prod_elem, "preco")
+        preco_elem.text = str(prod["preco"])
+    return ET.tostring(root, encoding="unicode")
+
+def extract_products(xml_str: str) -> list:
+    root = ET.fromstring(xml_str)
+    products = []
+    for prod_elem in root.findall("product"):
+        nome = prod_elem.find("nome").text
+        descricao = prod_elem.find("descricao").text
+        preco = float(prod_elem.find("preco").text)
+        products.append({"nome": nome, "descricao": descricao, "preco": preco})
+    return products
+
+# Para dados estruturados de imagens
+def wrap_images(images: list) -> str:
+    root = ET.Element("images")
+    for img in images:
+        img_elem = ET.SubElement(root, "image")
+        pname_elem = ET.SubElement(img_elem, "product_name")
+        pname_elem.text = img["product_name"]
+        url_elem = ET.SubElement(img_elem, "image_url")
+        url_elem.text = img["image_url"]
+    return ET.tostring(root, encoding="unicode")
+
+def extract_images(xml_str: str) -> list:
+    root = ET.fromstring(xml_str)
+    images = []
+    for img_elem in root.findall("image"):
+        product_name = img_elem.find("product_name").text
+        image_url = img_elem.find("image_url").text
+        images.append({"product_name": product_name, "image_url": image_url})
+    return images
@@ -0,0 +1,189 @@
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# --- Trace ID por requisição ---
+
+_trace_id = contextvars.ContextVar("trace_id", default="-")
+
+def current_trace_id() -> str:
+    return _trace_id.get()
+
+def set_trace_id(trace_id: str = None) -> str:
+    """Define o trace ID no contexto atual (usado no início de cada requisição HTTP)."""
+    _trace_id.set(trace_id or uuid.uuid4().hex[:16])
+    return _trace_id.get()
+
+@contextmanager
+def trace(trace_id: str = None):
+    """Define o trace ID da requisição atual (propagado para as etapas do pipeline)."""
+    token = _trace_id.set(trace_id or uuid.uuid4().hex[:16])
+    try:
+        yield _trace_id.get()
+    finally:
+        _trace_id.reset(token)
+
+# --- Métricas no formato texto do Prometheus ---
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+# Preço em USD por 1M de tokens (entrada, saída) e por imagem
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "text-embedding-3-small": (0.02, 0.0),
+}
+IMAGE_PRICES = {
+    ("dall-e-3", "1024x1024"): 0.040,
+    ("dall-e-3", "1024x1792"): 0.080,
+    ("dall-e-3", "1792x1024"): 0.080,
+    ("dall-e-2", "1024x1024"): 0.020,
+}
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in labels]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def total(self, **labels) -> float:
+        """Soma de todas as séries que têm os rótulos informados."""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(v for key, v in self._values.items() if wanted <= set(key))
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (1 if value <= b else 0) for c, b in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bucket, c in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bucket),))} {c}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+llm_calls = Counter("llm_calls_total", "Chamadas à OpenAI por agente, modelo e resultado.")
+llm_latency = Histogram("llm_call_duration_seconds", "Tempo de parede de cada chamada à OpenAI.")
+llm_tokens = Counter("llm_tokens_total", "Tokens consumidos (prompt/completion) por agente e modelo.")
+llm_tokens_per_call = Histogram("llm_tokens_per_call", "Tokens totais por chamada.", buckets=TOKEN_BUCKETS)
+llm_cost = Counter("llm_cost_usd_total", "Custo estimado em USD por agente e modelo.")
+stage_latency = Histogram("pipeline_stage_duration_seconds", "Duração de cada etapa do pipeline.")
+llm_retries = Counter("llm_retries_total", "Novas tentativas após erros transitórios, por agente, modelo e erro.")
+llm_hedges = Counter("llm_hedges_total", "Requisições em hedge disparadas (fired) e vencidas pela cópia (won).")
+llm_deadline_exceeded = Counter("llm_deadline_exceeded_total", "Chamadas abandonadas por estourar o prazo do agente.")
+ratelimit_wait = Histogram("ratelimit_wait_seconds", "Espera pelo limite de taxa (RPM/TPM) por modelo e prioridade.")
+llm_parse = Counter("llm_parse_total", "Respostas estruturadas no formato pedido (ok) ou fora dele (invalid), por agente e modelo.")
+page_bytes = Counter("page_bytes_total", "Bytes das páginas geradas antes (original) e depois (optimized) do pós-processamento.")
+
+REGISTRY = [llm_calls, llm_latency, llm_tokens, llm_tokens_per_call, llm_cost, stage_latency,
+            llm_retries, llm_hedges, llm_deadline_exceeded, ratelimit_wait, llm_parse, page_bytes]
+
+# Fontes extras (ex.: contadores do cache) registradas por outros módulos.
+# Cada uma é uma função que devolve linhas no formato do Prometheus.
+_collectors = []
+
+def register_collector(collector) -> None:
+    _collectors.append(collector)
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+# --- Instrumentação das chamadas ---
+
+class CallRecord:
+    """Acumula o que foi observado durante uma chamada (uso, custo, resultado)."""
+    def __init__(self, agent: str, model: str):
+        self.agent = agent
+        self.model = model
+        self.outcome = "ok"
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def record_usage(self, usage) -> None:
+        if usage is None:
+            return
+        self.prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        self.completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        prices = MODEL_PRICES.get(self.model)
+        if prices:
+            self.cost = (self.prompt_tokens * prices[0] + self.completion_tokens * prices[1]) / 1_000_000
+
+    def record_image(self, size: str, n: int = 1) -> None:
+        self.cost = IMAGE_PRICES.get((self.model, size), 0.0) * n
+
+@contextmanager
+def observe_call(agent: str, model: str):
+    """
+    Mede uma chamada à OpenAI: tempo de parede, tokens, custo e resultado
+    ("ok", "error" ou o que for definido em `record.outcome`, ex.: "cache_hit").
+    """
+    record = CallRecord(agent, model)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception:
+        record.outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        labels = {"agent": agent, "model": model}
+        llm_calls.inc(outcome=record.outcome, **labels)
+        llm_latency.observe(elapsed, outcome=record.outcome, **labels)
+        if record.prompt_tokens or record.completion_tokens:
+            llm_tokens.inc(record.prompt_tokens, kind="prompt", **labels)
+            llm_tokens.inc(record.completion_tokens, kind="completion", **labels)
+            llm_tokens_per_call.observe(record.prompt_tokens + record.completion_tokens, **labels)
+        if record.cost:
+            llm_cost.inc(record.cost, **labels)
+        print(f"📊 [trace={current_trace_id()}] {agent} ({model}) {record.outcome} em {elapsed:.2f}s"
+              f" | tokens {record.prompt_tokens}/{record.completion_tokens} | ${record.cost:.4f}")
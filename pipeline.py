@@ -0,0 +1,501 @@
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from chat_agents import (
+    text_agent,
+    ux_research_agent,
+    ux_design_agent,
+    business_agent,
+    fused_agent,
+    photographer_agent,
+    spec_agent,
+    code_agent,
+)
+from artifacts import ARTIFACTS_ENABLED, artifact_store
+from cache import bypass_cache, cache_bypassed
+from html_optimizer import optimize_page
+from image_optimizer import optimize_images, relink_images
+from metrics import current_trace_id, stage_latency
+from resilience import to_thread
+from similarity import SIMILARITY_ENABLED, similarity_index
+
+# "staged": um agente por etapa; "fused": contexto, persona, UX e produtos numa só chamada
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "staged")
+# Limite de variantes de layout por geração (cada uma custa uma especificação e um código)
+PIPELINE_MAX_VARIANTS = int(os.getenv("PIPELINE_MAX_VARIANTS", "4"))
+
+# Callback de eventos do pipeline em execução (usado pelo streaming SSE)
+_on_event = contextvars.ContextVar("pipeline_on_event", default=None)
+
+def _token_emitter(stage: str = "code"):
+    """
+    Retorna um callback que repassa os tokens do CodeGeneratorAgent como
+    eventos, ou None quando ninguém está ouvindo (sem streaming).
+    """
+    on_event = _on_event.get()
+    if on_event is None:
+        return None
+    return lambda text: on_event("token", {"stage": stage, "text": text})
+
+# --- Definição das etapas ---
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    Uma etapa do pipeline: nome, entradas declaradas e a função que a executa.
+    A função recebe as entradas como argumentos nomeados. `afunc` é a versão
+    assíncrona (usada por arun_pipeline); sem ela, `func` roda numa thread.
+    """
+    name: str
+    inputs: Tuple[str, ...]
+    func: Callable
+    label: str = ""
+    afunc: Optional[Callable] = None
+
+@dataclass
+class StageTiming:
+    name: str
+    start: float
+    finish: float
+    reused: bool = False
+
+    @property
+    def duration(self) -> float:
+        return self.finish - self.start
+
+@dataclass
+class PipelineResult:
+    outputs: Dict[str, object]
+    timings: List[StageTiming] = field(default_factory=list)
+    total: float = 0.0
+    run_id: Optional[str] = None
+
+    @property
+    def reused(self) -> List[str]:
+        return [t.name for t in self.timings if t.reused]
+
+    @property
+    def variants(self) -> list:
+        """Páginas otimizadas, uma por variante de layout (a primeira é "page")."""
+        return [self.outputs[variant_name("page", n)] for n in range(1, variant_count(self.outputs) + 1)]
+
+# Grafo dos sete agentes: cada etapa declara apenas o que realmente consome,
+# então UXDesigner, Business e Photographer podem rodar em paralelo. A última
+# etapa só pós-processa o código (sem IA): CSS em arquivo com hash e minificação.
+STAGES = (
+    Stage("context", ("product",),
+          lambda product: text_agent.respond(product),
+          "📝 Etapa 1: Gerando contexto do produto...",
+          lambda product: text_agent.arespond(product)),
+    Stage("persona", ("context",),
+          lambda context: ux_research_agent.respond(context),
+          "👥 Etapa 2: Criando persona do cliente...",
+          lambda context: ux_research_agent.arespond(context)),
+    Stage("ux", ("persona",),
+          lambda persona: ux_design_agent.respond(persona),
+          "🎨 Etapa 3: Definindo elementos de UX...",
+          lambda persona: ux_design_agent.arespond(persona)),
+    Stage("products", ("persona",),
+          lambda persona: business_agent.respond(persona),
+          "🛒 Etapa 4: Criando lista de produtos (Máx 3)...",
+          lambda persona: business_agent.arespond(persona)),
+    # Os caminhos das imagens (e de suas variantes) são reservados logo que os
+    # produtos existem: especificação e código usam o plano, não os pixels, e
+    # rodam enquanto o DALL-E ainda gera as imagens.
+    Stage("image_plan", ("product", "products"),
+          lambda product, products: photographer_agent.plan(products, topic=product),
+          "🗂️ Etapa 5a: Reservando os caminhos das imagens..."),
+    Stage("images", ("image_plan",),
+          lambda image_plan: photographer_agent.respond(image_plan),
+          "🖼️ Etapa 5: Gerando e SALVANDO imagens dos produtos (Máx 3)...",
+          lambda image_plan: photographer_agent.arespond(image_plan)),
+    Stage("specification", ("persona", "ux", "image_plan"),
+          lambda persona, ux, image_plan: spec_agent.respond(persona, ux, image_plan),
+          "📜 Etapa 6: Criando especificação técnica...",
+          lambda persona, ux, image_plan: spec_agent.arespond(persona, ux, image_plan)),
+    Stage("optimized_images", ("images",),
+          lambda images: optimize_images(images),
+          "🗜️ Etapa 5b: Gerando variantes WebP/JPEG das imagens..."),
+    Stage("code", ("specification", "image_plan", "products"),
+          lambda specification, image_plan, products: code_agent.respond(
+              specification, image_plan, products, on_token=_token_emitter()),
+          "💻 Etapa 7: Gerando código HTML/CSS (Sem blocos Markdown)...",
+          lambda specification, image_plan, products: code_agent.arespond(
+              specification, image_plan, products, on_token=_token_emitter())),
+    # As imagens podem ter sido gravadas fora do caminho reservado (ver
+    # PhotographerAgent): a página usa os caminhos finais
+    Stage("page", ("code", "image_plan", "optimized_images"),
+          lambda code, image_plan, optimized_images: optimize_page(
+              relink_images(code, image_plan, optimized_images)),
+          "🗜️ Etapa 8: Otimizando a página (CSS com hash, minificação, preload das fontes)..."),
+)
+
+# Modo fundido: uma chamada substitui as quatro primeiras etapas. As etapas
+# "context", "persona", "ux" e "products" continuam existindo (só extraem a
+# parte correspondente), então o resto do grafo não muda.
+FUSED_OUTPUTS = ("context", "persona", "ux", "products")
+
+def _pick(name: str):
+    return lambda upstream: upstream[name]
+
+def _apick(name: str):
+    async def pick(upstream):
+        return upstream[name]
+    return pick
+
+FUSED_STAGES = (
+    Stage("upstream", ("product",),
+          lambda product: fused_agent.respond(product),
+          "⚡ Etapas 1-4 (modo fundido): contexto, persona, UX e produtos numa só chamada...",
+          lambda product: fused_agent.arespond(product)),
+    *(Stage(name, ("upstream",), _pick(name), afunc=_apick(name)) for name in FUSED_OUTPUTS),
+    *(s for s in STAGES if s.name not in FUSED_OUTPUTS),
+)
+
+# --- Variantes de layout (teste A/B) ---
+
+# Contexto, persona, UX, produtos e imagens rodam uma vez; só especificação,
+# código e página se multiplicam ("specification_2"/"code_2"/"page_2", ...) e
+# rodam em paralelo.
+# K layouts custam um pipeline mais K-1 pares de etapas finais.
+
+def variant_name(name: str, variant: int) -> str:
+    return name if variant == 1 else f"{name}_{variant}"
+
+def variant_count(names) -> int:
+    """Quantas variantes de código existem entre as etapas/saídas `names`."""
+    count = 1
+    while variant_name("code", count + 1) in names:
+        count += 1
+    return count
+
+def _variant_stages(variant: int) -> tuple:
+    specification, code, page = (variant_name(name, variant) for name in ("specification", "code", "page"))
+
+    def specify(persona, ux, image_plan):
+        return spec_agent.respond(persona, ux, image_plan, variant=variant)
+
+    async def aspecify(persona, ux, image_plan):
+        return await spec_agent.arespond(persona, ux, image_plan, variant=variant)
+
+    def generate(image_plan, products, **inputs):
+        return code_agent.respond(inputs[specification], image_plan, products, on_token=_token_emitter(code))
+
+    async def agenerate(image_plan, products, **inputs):
+        return await code_agent.arespond(inputs[specification], image_plan, products,
+                                         on_token=_token_emitter(code))
+
+    return (
+        Stage(specification, ("persona", "ux", "image_plan"), specify,
+              f"📜 Etapa 6 (variante {variant}): Criando especificação técnica...", aspecify),
+        Stage(code, (specification, "image_plan", "products"), generate,
+              f"💻 Etapa 7 (variante {variant}): Gerando código HTML/CSS...", agenerate),
+        Stage(page, (code, "image_plan", "optimized_images"),
+              lambda image_plan, optimized_images, **inputs: optimize_page(
+                  relink_images(inputs[code], image_plan, optimized_images)),
+              f"🗜️ Etapa 8 (variante {variant}): Otimizando a página..."),
+    )
+
+def stages_for(mode: str = None, variants: int = 1):
+    """
+    Grafo de etapas do modo pedido ("staged" ou "fused"; padrão: PIPELINE_MODE)
+    com `variants` layouts gerados a partir das mesmas etapas anteriores.
+    """
+    mode = mode or PIPELINE_MODE
+    if mode == "fused":
+        stages = FUSED_STAGES
+    elif mode == "staged":
+        stages = STAGES
+    else:
+        raise ValueError(f"Modo de pipeline desconhecido: {mode}")
+    variants = int(variants or 1)
+    if not 1 <= variants <= PIPELINE_MAX_VARIANTS:
+        raise ValueError(f"Número de variantes deve estar entre 1 e {PIPELINE_MAX_VARIANTS}")
+    return stages + tuple(s for variant in range(2, variants + 1) for s in _variant_stages(variant))
+
+# --- Produtos parecidos ---
+
+# Saídas que não dependem da lista de produtos sugeridos: podem vir de um
+# produto parecido já gerado ("fone de ouvido sem fio" ≈ "Fones de ouvido wireless")
+SIMILAR_REUSABLE = ("context", "persona", "ux")
+
+def _find_similar(product: str, stages) -> tuple:
+    """
+    Procura no índice de similaridade um produto parecido cuja execução ainda
+    tem contexto, persona e UX gravados. Retorna (match, saídas reaproveitadas,
+    grafo a executar); sem match, (None, {}, stages).
+    """
+    names = {s.name for s in stages}
+    if not (SIMILARITY_ENABLED and ARTIFACTS_ENABLED) or cache_bypassed() or not names.issuperset(SIMILAR_REUSABLE):
+        return None, {}, stages
+    try:
+        matches = similarity_index.matches(product)
+    except Exception as e:
+        print(f"⚠️ Índice de similaridade indisponível: {e}")
+        return None, {}, stages
+    for match in matches:
+        stored = artifact_store.load_outputs(match.run_id)
+        if all(name in stored for name in SIMILAR_REUSABLE):
+            break
+        if not stored:
+            # Execução apagada pela retenção dos artefatos: sai do índice
+            similarity_index.discard(match.run_id)
+    else:
+        return None, {}, stages
+    print(f"🔎 [trace={current_trace_id()}] '{product}' ≈ '{match.topic}' (similaridade {match.score:.2f}): "
+          f"reaproveitando contexto, persona e UX da execução {match.run_id}")
+    # No modo fundido a chamada única também gera os produtos: com a persona
+    # pronta, eles vêm do BusinessAgent como no modo por etapas (as demais
+    # etapas, inclusive as variantes de layout, continuam as mesmas)
+    if "upstream" in names:
+        stages = (tuple(s for s in STAGES if s.name in FUSED_OUTPUTS)
+                  + tuple(s for s in stages if s.name != "upstream" and s.name not in FUSED_OUTPUTS))
+    return match, {name: stored[name][1] for name in SIMILAR_REUSABLE}, stages
+
+def _record_similar(recorder, stages, outputs: dict) -> list:
+    """
+    Grava as saídas reaproveitadas na nova execução (a regeneração as encontra
+    como qualquer outra etapa) e devolve as marcações de tempo delas.
+    """
+    timings = []
+    for stage in stages:
+        if stage.name in SIMILAR_REUSABLE:
+            stage_hash, _, _ = recorder.lookup(stage.name, {name: outputs[name] for name in stage.inputs})
+            recorder.record(stage.name, stage_hash, outputs[stage.name], reused=True)
+            timings.append(StageTiming(stage.name, 0.0, 0.0, reused=True))
+    return timings
+
+def _index_product(product: str, run_id: str) -> None:
+    try:
+        similarity_index.add(product, run_id)
+    except Exception as e:
+        print(f"⚠️ Não foi possível indexar '{product}' no índice de similaridade: {e}")
+
+# --- Executor ---
+
+def _check_graph(stages, available) -> None:
+    """
+    Garante que toda entrada declarada é produzida por alguma etapa
+    (ou fornecida no início) e que não há ciclos.
+    """
+    known = set(available)
+    remaining = list(stages)
+    while remaining:
+        ready = [s for s in remaining if all(i in known for i in s.inputs)]
+        if not ready:
+            missing = {i for s in remaining for i in s.inputs if i not in known}
+            raise ValueError(f"Etapas com dependências não resolvidas: {sorted(missing)}")
+        for stage in ready:
+            known.add(stage.name)
+            remaining.remove(stage)
+
+def _finished(timing: StageTiming, emit) -> None:
+    print(f"⏱️ [trace={current_trace_id()}] {timing.name}: {timing.start:.2f}s → {timing.finish:.2f}s ({timing.duration:.2f}s)")
+    stage_latency.observe(timing.duration, stage=timing.name)
+    emit("stage_finished", {"stage": timing.name, "start": timing.start,
+                            "finish": timing.finish, "duration": timing.duration,
+                            "reused": timing.reused})
+
+def run_pipeline(product: str, stages=None, initial: Optional[dict] = None,
+                 max_workers: Optional[int] = None,
+                 on_event: Optional[Callable[[str, dict], None]] = None,
+                 recorder=None) -> PipelineResult:
+    """
+    Executa as etapas respeitando as dependências declaradas.
+    Etapas independentes rodam em paralelo; cada uma registra início e fim
+    (em segundos, relativos ao início do pipeline).
+    `on_event(tipo, dados)` recebe "stage_started", "stage_reused", "stage_finished" e "token".
+    `recorder` (artifacts.RunRecorder) grava a saída de cada etapa e reaproveita
+    as que já existem com o mesmo hash de entradas. Numa execução nova, se um
+    produto parecido já foi gerado, contexto, persona e UX vêm dele e só as
+    etapas específicas dos produtos rodam.
+    """
+    stages = stages or stages_for()
+    similar, reused, index_product = None, {}, False
+    if recorder is None and ARTIFACTS_ENABLED:
+        if not initial:
+            similar, reused, stages = _find_similar(product, stages)
+            index_product = similar is None
+        recorder = artifact_store.recorder(product)
+    outputs = {"product": product}
+    outputs.update(initial or {})
+    outputs.update(reused)
+    pending = [s for s in stages if s.name not in outputs]
+    _check_graph(pending, outputs)
+
+    t0 = time.perf_counter()
+
+    def emit(kind: str, data: dict) -> None:
+        if on_event:
+            on_event(kind, data)
+
+    timings = _record_similar(recorder, stages, outputs) if similar else []
+    for timing in timings:
+        emit("stage_reused", {"stage": timing.name, "start": 0.0, "similar_to": similar.topic})
+
+    def run_stage(stage: Stage):
+        start = time.perf_counter() - t0
+        if stage.label:
+            print(f"\n{stage.label}")
+        inputs = {name: outputs[name] for name in stage.inputs}
+        if recorder is None:
+            emit("stage_started", {"stage": stage.name, "label": stage.label, "start": start})
+            value = stage.func(**inputs)
+            return value, StageTiming(stage.name, start, time.perf_counter() - t0)
+
+        stage_hash, found, value = recorder.lookup(stage.name, inputs)
+        if found:
+            print(f"♻️ {stage.name}: entradas inalteradas, reaproveitando a saída anterior")
+            emit("stage_reused", {"stage": stage.name, "start": start})
+        else:
+            emit("stage_started", {"stage": stage.name, "label": stage.label, "start": start})
+            # Etapa pedida explicitamente: ignora o cache para obter uma resposta nova
+            with bypass_cache(True) if recorder.fresh(stage.name) else nullcontext():
+                value = stage.func(**inputs)
+        recorder.record(stage.name, stage_hash, value, reused=found)
+        return value, StageTiming(stage.name, start, time.perf_counter() - t0, reused=found)
+
+    # Executor explícito (sem `with`): numa falha o erro sobe na hora, sem
+    # esperar o shutdown pelas chamadas que ainda estão em andamento
+    executor = ThreadPoolExecutor(max_workers=max_workers or max(len(pending), 1))
+    running = {}
+    try:
+        while pending or running:
+            for stage in [s for s in pending if all(i in outputs for i in s.inputs)]:
+                pending.remove(stage)
+                # Copia o contexto para que contextvars da requisição sigam para a thread
+                ctx = contextvars.copy_context()
+                ctx.run(_on_event.set, on_event)
+                running[executor.submit(ctx.run, run_stage, stage)] = stage
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                value, timing = future.result()
+                outputs[stage.name] = value
+                timings.append(timing)
+                _finished(timing, emit)
+    except BaseException:
+        # As etapas que ainda não começaram são canceladas; as que estão rodando
+        # terminam em segundo plano e o resultado é descartado
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    if index_product:
+        _index_product(product, recorder.run_id)
+    return PipelineResult(outputs=outputs, timings=timings, total=time.perf_counter() - t0,
+                          run_id=recorder.run_id if recorder else None)
+
+async def arun_pipeline(product: str, stages=None, initial: Optional[dict] = None,
+                        on_event: Optional[Callable[[str, dict], None]] = None,
+                        recorder=None) -> PipelineResult:
+    """
+    Versão assíncrona de run_pipeline (servidor ASGI): cada etapa é uma task no
+    event loop em vez de uma thread, então uma geração não ocupa threads enquanto
+    espera a OpenAI. Etapas sem `afunc` (plano e variantes das imagens) e as
+    gravações no SQLite dos artefatos rodam no executor padrão.
+    """
+    stages = stages or stages_for()
+    similar, reused, index_product = None, {}, False
+    if recorder is None and ARTIFACTS_ENABLED:
+        if not initial:
+            similar, reused, stages = await to_thread(_find_similar, product, stages)
+            index_product = similar is None
+        recorder = await to_thread(artifact_store.recorder, product)
+    outputs = {"product": product}
+    outputs.update(initial or {})
+    outputs.update(reused)
+    pending = [s for s in stages if s.name not in outputs]
+    _check_graph(pending, outputs)
+
+    t0 = time.perf_counter()
+
+    def emit(kind: str, data: dict) -> None:
+        if on_event:
+            on_event(kind, data)
+
+    timings = await to_thread(_record_similar, recorder, stages, outputs) if similar else []
+    for timing in timings:
+        emit("stage_reused", {"stage": timing.name, "start": 0.0, "similar_to": similar.topic})
+
+    async def call(stage: Stage, inputs: dict):
+        if stage.afunc is not None:
+            return await stage.afunc(**inputs)
+        return await to_thread(stage.func, **inputs)
+
+    async def run_stage(stage: Stage):
+        start = time.perf_counter() - t0
+        if stage.label:
+            print(f"\n{stage.label}")
+        inputs = {name: outputs[name] for name in stage.inputs}
+        if recorder is None:
+            emit("stage_started", {"stage": stage.name, "label": stage.label, "start": start})
+            value = await call(stage, inputs)
+            return value, StageTiming(stage.name, start, time.perf_counter() - t0)
+
+        stage_hash, found, value = recorder.lookup(stage.name, inputs)
+        if found:
+            print(f"♻️ {stage.name}: entradas inalteradas, reaproveitando a saída anterior")
+            emit("stage_reused", {"stage": stage.name, "start": start})
+        else:
+            emit("stage_started", {"stage": stage.name, "label": stage.label, "start": start})
+            with bypass_cache(True) if recorder.fresh(stage.name) else nullcontext():
+                value = await call(stage, inputs)
+        await to_thread(recorder.record, stage.name, stage_hash, value, found)
+        return value, StageTiming(stage.name, start, time.perf_counter() - t0, reused=found)
+
+    running = {}
+    try:
+        while pending or running:
+            for stage in [s for s in pending if all(i in outputs for i in s.inputs)]:
+                pending.remove(stage)
+                # Cada task roda numa cópia do contexto, como as threads de run_pipeline
+                ctx = contextvars.copy_context()
+                ctx.run(_on_event.set, on_event)
+                running[asyncio.create_task(run_stage(stage), context=ctx)] = stage
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                stage = running.pop(task)
+                value, timing = task.result()
+                outputs[stage.name] = value
+                timings.append(timing)
+                _finished(timing, emit)
+    finally:
+        # Erro numa etapa (ou cliente desconectado): as demais não continuam sozinhas
+        for task in running:
+            task.cancel()
+
+    if index_product:
+        await to_thread(_index_product, product, recorder.run_id)
+    return PipelineResult(outputs=outputs, timings=timings, total=time.perf_counter() - t0,
+                          run_id=recorder.run_id if recorder else None)
+
+def regenerate(run_id: str, from_stage: str, stages=None, max_workers: Optional[int] = None,
+               on_event: Optional[Callable[[str, dict], None]] = None) -> PipelineResult:
+    """
+    Refaz uma execução anterior a partir da etapa `from_stage`. Essa etapa é
+    sempre recalculada; as demais só rodam de novo se alguma entrada mudou,
+    as outras reaproveitam a saída armazenada. O resultado é uma nova execução
+    (com o run_id anterior como pai).
+    """
+    run = artifact_store.get_run(run_id)
+    if run is None:
+        raise KeyError(run_id)
+    previous = artifact_store.load_outputs(run_id)
+    # Refaz com o mesmo grafo (modo e número de variantes) da execução original
+    stages = stages or stages_for("fused" if "upstream" in previous else "staged", variant_count(previous))
+    if from_stage not in {s.name for s in stages}:
+        raise ValueError(f"Etapa desconhecida: {from_stage}")
+    recorder = artifact_store.recorder(run["product"], parent_id=run_id,
+                                       previous=previous,
+                                       force={from_stage})
+    return run_pipeline(run["product"], stages, max_workers=max_workers,
+                        on_event=on_event, recorder=recorder)
@@ -0,0 +1,183 @@
+import asyncio
+import contextvars
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from metrics import current_trace_id, ratelimit_wait
+
+# --- Configuração via variáveis de ambiente ---
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "ratelimit.sqlite3")
+
+# Limites por minuto (requisições, tokens) de cada modelo; 0 = sem limite.
+# OPENAI_RATE_LIMITS sobrescreve modelos específicos: "gpt-4o=5000:800000,dall-e-3=50:0"
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "30000"))
+RATE_LIMITS = {
+    "dall-e-3": (int(os.getenv("IMAGE_RPM", "50")), 0),
+    "dall-e-2": (int(os.getenv("IMAGE_RPM", "50")), 0),
+}
+for _entry in filter(None, os.getenv("OPENAI_RATE_LIMITS", "").split(",")):
+    _model, _limits = _entry.split("=")
+    _rpm, _tpm = _limits.split(":")
+    RATE_LIMITS[_model.strip()] = (int(_rpm), int(_tpm))
+
+# Fração de cada limite reservada às requisições interativas: chamadas em lote
+# (batch.py, fila de jobs) só consomem enquanto sobra mais do que isso
+RATE_LIMIT_BATCH_RESERVE = float(os.getenv("RATE_LIMIT_BATCH_RESERVE", "0.2"))
+
+# Tokens de resposta somados à estimativa do prompt (o valor real é acertado depois)
+RATE_LIMIT_COMPLETION_TOKENS = int(os.getenv("RATE_LIMIT_COMPLETION_TOKENS", "1000"))
+
+# --- Prioridade da requisição atual ---
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+_priority = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+
+@contextmanager
+def request_priority(level: str):
+    """Define a prioridade das chamadas feitas neste contexto (propagada para as etapas)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def estimate_tokens(prompt: str) -> int:
+    """Estimativa grosseira (≈ 4 caracteres por token) mais a folga da resposta."""
+    return len(prompt) // 4 + RATE_LIMIT_COMPLETION_TOKENS
+
+class RateLimiter:
+    """
+    Token buckets de requisições e de tokens por minuto para cada modelo,
+    guardados em SQLite para que todos os processos (Flask, workers, lote)
+    dividam o mesmo limite da conta.
+    """
+    def __init__(self, path: str = RATE_LIMIT_DB_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def limits(model: str) -> tuple:
+        return RATE_LIMITS.get(model, (OPENAI_RPM, OPENAI_TPM))
+
+    def _take(self, model: str, tokens: int, priority: str) -> float:
+        """
+        Tenta consumir 1 requisição e `tokens` tokens de uma vez.
+        Retorna 0 se conseguiu, ou quantos segundos esperar antes de tentar de novo.
+        """
+        rpm, tpm = self.limits(model)
+        reserve = RATE_LIMIT_BATCH_RESERVE if priority == BATCH else 0.0
+        # Uma chamada maior que o bucket inteiro consome só o que cabe nele
+        wanted = [(name, limit, min(amount, (1 - reserve) * limit))
+                  for name, limit, amount in ((f"{model}:requests", rpm, 1), (f"{model}:tokens", tpm, tokens))
+                  if limit > 0]
+
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE: lê e atualiza os buckets sem que outro processo interfira
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            levels = {}
+            wait = 0.0
+            for name, limit, amount in wanted:
+                row = conn.execute("SELECT level, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                rate = limit / 60.0
+                level = limit if row is None else min(limit, row[0] + (now - row[1]) * rate)
+                levels[name] = level
+                missing = amount + reserve * limit - level
+                if missing > 0:
+                    wait = max(wait, missing / rate)
+            if wait == 0:
+                for name, limit, amount in wanted:
+                    levels[name] -= amount
+            for name, level in levels.items():
+                conn.execute("INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                             (name, level, now))
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def acquire(self, model: str, tokens: int = 0, timeout: float = None) -> float or None:
+        """
+        Espera até haver capacidade para a chamada. Retorna o tempo esperado,
+        ou None se a capacidade não apareceu dentro de `timeout` segundos.
+        """
+        if not RATE_LIMIT_ENABLED:
+            return 0.0
+        priority = _priority.get()
+        start = time.monotonic()
+        while True:
+            wait = self._take(model, tokens, priority)
+            waited = time.monotonic() - start
+            if wait == 0:
+                if waited > 0.05:
+                    print(f"🚦 [trace={current_trace_id()}] {model}: aguardou {waited:.2f}s pelo limite de taxa ({priority})")
+                ratelimit_wait.observe(waited, model=model, priority=priority)
+                return waited
+            if timeout is not None and waited + wait > timeout:
+                ratelimit_wait.observe(waited, model=model, priority=priority)
+                return None
+            # Lotes consultam com menos frequência, deixando a vez para os interativos
+            time.sleep(min(wait, 1.0 if priority == BATCH else 0.25))
+
+    def try_acquire(self, model: str, tokens: int = 0) -> bool:
+        """Consome a capacidade só se houver agora (usado pelo hedge, que é opcional)."""
+        return not RATE_LIMIT_ENABLED or self._take(model, tokens, _priority.get()) == 0
+
+    async def aacquire(self, model: str, tokens: int = 0, timeout: float = None) -> float or None:
+        """Versão assíncrona de `acquire`: espera com asyncio.sleep, sem ocupar uma thread."""
+        if not RATE_LIMIT_ENABLED:
+            return 0.0
+        priority = _priority.get()
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        while True:
+            # A transação no SQLite pode esperar o lock de outro processo: fica fora do event loop
+            wait = await loop.run_in_executor(None, self._take, model, tokens, priority)
+            waited = time.monotonic() - start
+            if wait == 0:
+                if waited > 0.05:
+                    print(f"🚦 [trace={current_trace_id()}] {model}: aguardou {waited:.2f}s pelo limite de taxa ({priority})")
+                ratelimit_wait.observe(waited, model=model, priority=priority)
+                return waited
+            if timeout is not None and waited + wait > timeout:
+                ratelimit_wait.observe(waited, model=model, priority=priority)
+                return None
+            await asyncio.sleep(min(wait, 1.0 if priority == BATCH else 0.25))
+
+    async def atry_acquire(self, model: str, tokens: int = 0) -> bool:
+        if not RATE_LIMIT_ENABLED:
+            return True
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._take, model, tokens, _priority.get()) == 0
+
+    def adjust(self, model: str, tokens: int) -> None:
+        """
+        Acerta o bucket de tokens depois da resposta: `tokens` é a diferença entre
+        o uso real e o estimado (positivo consome mais, negativo devolve).
+        """
+        _, tpm = self.limits(model)
+        if not RATE_LIMIT_ENABLED or not tpm or not tokens:
+            return
+        with self._connect() as conn:
+            conn.execute("UPDATE buckets SET level = MIN(?, level - ?) WHERE name = ?",
+                         (tpm, tokens, f"{model}:tokens"))
+
+rate_limiter = RateLimiter()
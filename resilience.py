@@ -0,0 +1,283 @@
+import asyncio
+import contextvars
+import functools
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import openai
+
+from metrics import current_trace_id, llm_deadline_exceeded, llm_hedges, llm_retries
+from ratelimit import rate_limiter
+
+# --- Configuração via variáveis de ambiente ---
+
+# Prazo total de cada chamada (somando as novas tentativas), por agente.
+# LLM_DEADLINES sobrescreve agentes específicos: "CodeGeneratorAgent=240,PhotographerAgent=120"
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "90"))
+AGENT_DEADLINES = {
+    "CodeGeneratorAgent": 180.0,  # gera a página inteira: a resposta mais longa do pipeline
+    "PhotographerAgent": 120.0,
+}
+for _entry in filter(None, os.getenv("LLM_DEADLINES", "").split(",")):
+    _agent, _seconds = _entry.split("=")
+    AGENT_DEADLINES[_agent.strip()] = float(_seconds)
+
+# Novas tentativas com backoff exponencial e jitter ("full jitter")
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+# Hedging: se a resposta demorar mais que o p95 observado, dispara uma cópia
+# da requisição e usa a que chegar primeiro. Desligado por padrão (custa tokens).
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+
+# Erros transitórios: vale a pena tentar de novo
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+class DeadlineExceeded(TimeoutError):
+    """O prazo do agente acabou antes de uma resposta válida."""
+
+def deadline_for(agent: str) -> float:
+    return AGENT_DEADLINES.get(agent, LLM_DEADLINE_SECONDS)
+
+def _deadline_exceeded(agent: str, model: str) -> DeadlineExceeded:
+    llm_deadline_exceeded.inc(agent=agent, model=model)
+    return DeadlineExceeded(f"{agent}: prazo de {deadline_for(agent):.0f}s esgotado")
+
+def backoff_delay(attempt: int, retry_after: float = None) -> float:
+    """Espera antes da tentativa `attempt` (1 = primeira nova tentativa)."""
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+def _retry_after(error) -> float or None:
+    """Respeita o cabeçalho Retry-After das respostas 429/503, quando presente."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after")) if response is not None else None
+    except (TypeError, ValueError):
+        return None
+
+class LatencyTracker:
+    """Últimas latências bem-sucedidas por agente/modelo, para calcular o atraso do hedge."""
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: tuple, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key: tuple, pct: float) -> float or None:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(pct / 100 * len(samples)) - 1)]
+
+latency_tracker = LatencyTracker()
+
+# Threads das requisições em hedge (a original e a cópia rodam aqui)
+_hedge_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_WORKERS", "32")),
+                                     thread_name_prefix="hedge")
+
+def _timed(request, timeout: float, key: tuple):
+    start = time.perf_counter()
+    response = request(timeout)
+    latency_tracker.observe(key, time.perf_counter() - start)
+    return response
+
+def _hedged_attempt(request, timeout: float, key: tuple, labels: dict, tokens: int = 0):
+    """
+    Uma tentativa com hedge: se a original não responder dentro do p95,
+    dispara uma cópia e devolve a primeira resposta bem-sucedida.
+    A requisição perdedora não é cancelada; termina sozinha pelo timeout.
+    """
+    delay = latency_tracker.percentile(key, LLM_HEDGE_PERCENTILE) if LLM_HEDGE else None
+    if delay is None:
+        return _timed(request, timeout, key)
+    delay = max(delay, LLM_HEDGE_MIN_DELAY)
+    if delay >= timeout:
+        return _timed(request, timeout, key)
+
+    primary = _hedge_executor.submit(contextvars.copy_context().run, _timed, request, timeout, key)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+    # A cópia só sai se houver folga no limite de taxa agora: hedge nunca espera na fila
+    if not rate_limiter.try_acquire(key[1], tokens):
+        return primary.result()
+
+    llm_hedges.inc(event="fired", **labels)
+    print(f"🪞 [trace={current_trace_id()}] {labels['agent']}: sem resposta em {delay:.2f}s (p{LLM_HEDGE_PERCENTILE:.0f}), disparando cópia")
+    backup = _hedge_executor.submit(contextvars.copy_context().run, _timed, request, timeout - delay, key)
+    pending = {primary, backup}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is backup:
+                    llm_hedges.inc(event="won", **labels)
+                return future.result()
+            error = future.exception()
+    raise error
+
+def call_with_policy(agent: str, model: str, request, hedge: bool = True, tokens: int = 0):
+    """
+    Executa `request(timeout)` respeitando o prazo do agente: cada tentativa
+    espera sua vez no limite de taxa compartilhado (`tokens` estimados), recebe
+    o tempo restante, erros transitórios são repetidos com backoff exponencial
+    com jitter e, se habilitado, a tentativa usa hedging.
+    """
+    labels = {"agent": agent, "model": model}
+    key = (agent, model)
+    deadline = time.monotonic() + deadline_for(agent)
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining > 0 and rate_limiter.acquire(model, tokens, timeout=remaining) is None:
+            remaining = 0
+        else:
+            remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise _deadline_exceeded(agent, model)
+        try:
+            if hedge:
+                return _hedged_attempt(request, remaining, key, labels, tokens)
+            return _timed(request, remaining, key)
+        except RETRYABLE_ERRORS as e:
+            attempt += 1
+            delay = backoff_delay(attempt, _retry_after(e))
+            out_of_time = time.monotonic() + delay >= deadline
+            if out_of_time:
+                llm_deadline_exceeded.inc(**labels)
+            if out_of_time or attempt > LLM_MAX_RETRIES:
+                raise
+            llm_retries.inc(reason=type(e).__name__, **labels)
+            print(f"🔁 [trace={current_trace_id()}] {agent}: {type(e).__name__}, nova tentativa "
+                  f"{attempt}/{LLM_MAX_RETRIES} em {delay:.2f}s")
+            time.sleep(delay)
+
+def stream_within_deadline(agent: str, model: str, stream, deadline: float):
+    """
+    Repassa os trechos de um stream já aberto por `call_with_policy`, que só
+    cobre a abertura. Se o prazo (`deadline`, em time.monotonic) acabar
+    enquanto os tokens chegam, fecha o stream e levanta DeadlineExceeded.
+    Um stream parado é interrompido pelo timeout de leitura do cliente.
+    """
+    try:
+        for chunk in stream:
+            if time.monotonic() > deadline:
+                raise _deadline_exceeded(agent, model)
+            yield chunk
+    finally:
+        stream.close()
+
+# --- Versão assíncrona (caminho ASGI) ---
+
+async def to_thread(func, *args, **kwargs):
+    """Roda uma função bloqueante no executor padrão mantendo os contextvars (trace ID, cache)."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(ctx.run, func, *args, **kwargs))
+
+async def _atimed(request, timeout: float, key: tuple):
+    start = time.perf_counter()
+    response = await request(timeout)
+    latency_tracker.observe(key, time.perf_counter() - start)
+    return response
+
+async def _ahedged_attempt(request, timeout: float, key: tuple, labels: dict, tokens: int = 0):
+    """Igual a _hedged_attempt, com tasks no lugar de threads; a perdedora é cancelada."""
+    delay = latency_tracker.percentile(key, LLM_HEDGE_PERCENTILE) if LLM_HEDGE else None
+    if delay is None or max(delay, LLM_HEDGE_MIN_DELAY) >= timeout:
+        return await _atimed(request, timeout, key)
+    delay = max(delay, LLM_HEDGE_MIN_DELAY)
+
+    primary = asyncio.ensure_future(_atimed(request, timeout, key))
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done or not await rate_limiter.atry_acquire(key[1], tokens):
+        return await primary
+
+    llm_hedges.inc(event="fired", **labels)
+    print(f"🪞 [trace={current_trace_id()}] {labels['agent']}: sem resposta em {delay:.2f}s (p{LLM_HEDGE_PERCENTILE:.0f}), disparando cópia")
+    backup = asyncio.ensure_future(_atimed(request, timeout - delay, key))
+    pending = {primary, backup}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        llm_hedges.inc(event="won", **labels)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def acall_with_policy(agent: str, model: str, request, hedge: bool = True, tokens: int = 0):
+    """Versão assíncrona de call_with_policy: `request(timeout)` é uma corrotina."""
+    labels = {"agent": agent, "model": model}
+    key = (agent, model)
+    deadline = time.monotonic() + deadline_for(agent)
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining > 0 and await rate_limiter.aacquire(model, tokens, timeout=remaining) is None:
+            remaining = 0
+        else:
+            remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise _deadline_exceeded(agent, model)
+        try:
+            if hedge:
+                return await _ahedged_attempt(request, remaining, key, labels, tokens)
+            return await _atimed(request, remaining, key)
+        except RETRYABLE_ERRORS as e:
+            attempt += 1
+            delay = backoff_delay(attempt, _retry_after(e))
+            out_of_time = time.monotonic() + delay >= deadline
+            if out_of_time:
+                llm_deadline_exceeded.inc(**labels)
+            if out_of_time or attempt > LLM_MAX_RETRIES:
+                raise
+            llm_retries.inc(reason=type(e).__name__, **labels)
+            print(f"🔁 [trace={current_trace_id()}] {agent}: {type(e).__name__}, nova tentativa "
+                  f"{attempt}/{LLM_MAX_RETRIES} em {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+async def astream_within_deadline(agent: str, model: str, stream, deadline: float):
+    """Versão assíncrona de stream_within_deadline: a espera por cada trecho também respeita o prazo."""
+    chunks = stream.__aiter__()
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise _deadline_exceeded(agent, model)
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), remaining)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise _deadline_exceeded(agent, model) from None
+            yield chunk
+    finally:
+        await stream.close()
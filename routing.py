@@ -0,0 +1,54 @@
+import contextvars
+import os
+from contextlib import contextmanager
+
+# --- Modelo de cada agente (perfis de roteamento) ---
+
+# "*" vale para os agentes que o perfil não lista. "quality" mantém tudo no
+# gpt-4o (comportamento original); "balanced" move as etapas leves, cuja saída
+# é curta ou só uma lista, para o gpt-4o-mini; "fast" usa o mini em todas.
+MODEL_PROFILES = {
+    "quality": {"*": "gpt-4o"},
+    "balanced": {
+        "*": "gpt-4o",
+        "TextGeneratorAgent": "gpt-4o-mini",
+        "BusinessAgent": "gpt-4o-mini",
+    },
+    "fast": {"*": "gpt-4o-mini"},
+}
+
+MODEL_PROFILE = os.getenv("MODEL_PROFILE", "quality")
+if MODEL_PROFILE not in MODEL_PROFILES:
+    raise ValueError(f"Perfil de modelos desconhecido: {MODEL_PROFILE}")
+
+# Modelo fixo de agentes específicos, em qualquer perfil:
+# "BusinessAgent=gpt-4o-mini,CodeGeneratorAgent=gpt-4.1"
+AGENT_MODELS = {}
+for _entry in filter(None, os.getenv("AGENT_MODELS", "").split(",")):
+    _agent, _model = _entry.split("=")
+    AGENT_MODELS[_agent.strip()] = _model.strip()
+
+# Perfil da requisição atual (propagado para as etapas, como o bypass do cache)
+_profile = contextvars.ContextVar("model_profile", default=MODEL_PROFILE)
+
+@contextmanager
+def model_profile(name: str = None):
+    """Usa o perfil `name` nas chamadas feitas neste contexto (None mantém o atual)."""
+    name = name or _profile.get()
+    if name not in MODEL_PROFILES:
+        raise ValueError(f"Perfil de modelos desconhecido: {name} (use {', '.join(MODEL_PROFILES)})")
+    token = _profile.set(name)
+    try:
+        yield
+    finally:
+        _profile.reset(token)
+
+def current_profile() -> str:
+    return _profile.get()
+
+def model_for(agent_name: str) -> str:
+    """Modelo de texto que `agent_name` usa no perfil atual."""
+    if agent_name in AGENT_MODELS:
+        return AGENT_MODELS[agent_name]
+    profile = MODEL_PROFILES[_profile.get()]
+    return profile.get(agent_name, profile["*"])
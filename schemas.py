@@ -0,0 +1,206 @@
+import json
+import re
+from typing import Annotated, List
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+# --- Saídas estruturadas dos agentes ---
+#
+# Cada schema vira o JSON Schema estrito enviado à OpenAI (response_format
+# "json_schema") e é o mesmo modelo pydantic que valida a resposta. Só
+# restrições aceitas no modo estrito entram no schema (pattern, minimum/maximum,
+# minItems/maxItems); as demais são validadores que rodam apenas aqui.
+
+HexColor = Annotated[str, Field(pattern=r"^#[0-9A-Fa-f]{6}$", description="cor em HEX, ex.: #1A237E")]
+CssSize = Annotated[str, Field(pattern=r"^\d+(\.\d+)?(px|rem|em|%)$", description="tamanho CSS, ex.: 48px")]
+FontWeight = Annotated[int, Field(ge=100, le=900)]
+
+class StrictModel(BaseModel):
+    # additionalProperties: false, exigido pelo modo estrito
+    model_config = ConfigDict(extra="forbid")
+
+def response_format(schema) -> dict:
+    """response_format da OpenAI que restringe a resposta ao schema."""
+    return {"type": "json_schema", "json_schema": {
+        "name": schema.__name__, "schema": schema.model_json_schema(), "strict": True,
+    }}
+
+def not_blank(value: str) -> str:
+    if not value.strip():
+        raise ValueError("não pode ser vazio")
+    return value.strip()
+
+# --- BusinessAgent ---
+
+class ProductSchema(StrictModel):
+    nome: str
+    descricao: str
+    preco: float = Field(gt=0, description="preço em USD")
+
+    @field_validator("nome", "descricao")
+    @classmethod
+    def check_text(cls, value: str) -> str:
+        return not_blank(value)
+
+class ProductListSchema(StrictModel):
+    produtos: List[ProductSchema] = Field(min_length=3, max_length=3)
+
+# --- FusedUpstreamAgent (modo fundido) ---
+
+class FusedUpstreamSchema(StrictModel):
+    contexto: str = Field(description="contexto detalhado do produto para um e-commerce")
+    persona: str = Field(description="persona do cliente ideal, com dores, necessidades e oportunidades")
+    ux: str = Field(description="elementos de UX: fontes, disposição das imagens, conversão e paleta")
+    produtos: List[ProductSchema] = Field(min_length=3, max_length=3)
+
+    @field_validator("contexto", "persona", "ux")
+    @classmethod
+    def check_text(cls, value: str) -> str:
+        return not_blank(value)
+
+# --- SpecificationAgent ---
+
+class Palette(StrictModel):
+    primaria: HexColor
+    secundaria: HexColor
+    destaque: HexColor = Field(description="cor dos CTAs")
+    fundo: HexColor
+    texto: HexColor
+
+class Typography(StrictModel):
+    fonte_titulos: str = Field(description="família do Google Fonts, ex.: Montserrat")
+    fonte_corpo: str = Field(description="família do Google Fonts, ex.: Open Sans")
+    tamanho_h1: CssSize
+    tamanho_h2: CssSize
+    tamanho_corpo: CssSize
+    peso_titulos: FontWeight
+    peso_corpo: FontWeight
+
+    @field_validator("fonte_titulos", "fonte_corpo")
+    @classmethod
+    def check_fonts(cls, value: str) -> str:
+        return not_blank(value)
+
+class Layout(StrictModel):
+    cabecalho: str
+    secao_produtos: str = Field(description="ex.: grid de 3 colunas, cards com sombra")
+    rodape: str
+    espacamento: str = Field(description="padding e margin entre os elementos")
+    largura_maxima: CssSize
+
+class Components(StrictModel):
+    botoes: str = Field(description="cor, tamanho e efeito hover")
+    cards: str = Field(description="altura, sombra e efeito ao passar o mouse")
+    imagens: str = Field(description="tamanho, border-radius e object-fit")
+
+class Effects(StrictModel):
+    transicoes: str = Field(description="duração e tipo")
+    hover: str
+    breakpoints: List[CssSize] = Field(min_length=1, max_length=4, description="larguras mobile/tablet/desktop")
+
+class SpecificationSchema(StrictModel):
+    paleta: Palette
+    tipografia: Typography
+    layout: Layout
+    componentes: Components
+    efeitos: Effects
+
+    def to_text(self) -> str:
+        """Especificação legível, no formato que o CodeGeneratorAgent recebe no prompt."""
+        p, t, l, c, e = self.paleta, self.tipografia, self.layout, self.componentes, self.efeitos
+        return (
+            f"1. PALETA DE CORES:\n"
+            f"   - Cor primária: {p.primaria}\n   - Cor secundária: {p.secundaria}\n"
+            f"   - Cor de destaque (CTAs): {p.destaque}\n   - Cor de fundo: {p.fundo}\n"
+            f"   - Cor de texto: {p.texto}\n"
+            f"2. TIPOGRAFIA:\n"
+            f"   - Títulos: {t.fonte_titulos}, peso {t.peso_titulos}, h1 {t.tamanho_h1}, h2 {t.tamanho_h2}\n"
+            f"   - Corpo: {t.fonte_corpo}, peso {t.peso_corpo}, {t.tamanho_corpo}\n"
+            f"3. LAYOUT E ESTRUTURA:\n"
+            f"   - Cabeçalho: {l.cabecalho}\n   - Seção de produtos: {l.secao_produtos}\n"
+            f"   - Rodapé: {l.rodape}\n   - Espaçamento: {l.espacamento}\n"
+            f"   - Largura máxima do container: {l.largura_maxima}\n"
+            f"4. COMPONENTES:\n"
+            f"   - Botões: {c.botoes}\n   - Cards de produto: {c.cards}\n   - Imagens: {c.imagens}\n"
+            f"5. EFEITOS E INTERATIVIDADE:\n"
+            f"   - Transições: {e.transicoes}\n   - Hover: {e.hover}\n"
+            f"   - Breakpoints: {', '.join(e.breakpoints)}"
+        )
+
+# --- CodeGeneratorAgent ---
+
+class HtmlCodeSchema(StrictModel):
+    html: str = Field(description="conteúdo do <body>, com a tag <style> de todo o CSS")
+
+    @field_validator("html")
+    @classmethod
+    def check_html(cls, value: str) -> str:
+        return not_blank(value)
+
+# --- Streaming de um campo JSON ---
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_PLAIN = re.compile(r'[^"\\]+')
+
+class JsonFieldStream:
+    """
+    Repassa a `on_text`, conforme os trechos do JSON chegam, o valor já
+    decodificado do campo string `field` (ex.: o "html" do CodeGeneratorAgent),
+    então o streaming continua mostrando HTML, não JSON escapado.
+    """
+    def __init__(self, field: str, on_text):
+        self._key = re.compile(re.escape(json.dumps(field)) + r'\s*:\s*"')
+        self._on_text = on_text
+        self._buffer = ""
+        self._state = "key"
+
+    def feed(self, chunk: str) -> None:
+        if self._state == "done":
+            return
+        self._buffer += chunk
+        if self._state == "key":
+            match = self._key.search(self._buffer)
+            if match is None:
+                return
+            self._buffer = self._buffer[match.end():]
+            self._state = "value"
+        text, consumed, closed = self._decode(self._buffer)
+        self._buffer = self._buffer[consumed:]
+        if closed:
+            self._state = "done"
+        if text:
+            self._on_text(text)
+
+    @staticmethod
+    def _decode(buffer: str) -> tuple:
+        """Decodifica o que já dá para decodificar; escapes incompletos esperam o próximo trecho."""
+        out = []
+        i = 0
+        while i < len(buffer):
+            plain = _PLAIN.match(buffer, i)
+            if plain:
+                out.append(plain.group())
+                i = plain.end()
+                continue
+            if buffer[i] == '"':
+                return "".join(out), i + 1, True
+            # Barra invertida: escape simples (\n) ou \uXXXX (e o par de surrogates)
+            if i + 1 >= len(buffer):
+                break
+            if buffer[i + 1] != "u":
+                out.append(_ESCAPES.get(buffer[i + 1], buffer[i + 1]))
+                i += 2
+                continue
+            if i + 6 > len(buffer):
+                break
+            code = int(buffer[i + 2:i + 6], 16)
+            if 0xD800 <= code < 0xDC00:
+                if i + 12 > len(buffer):
+                    break
+                low = int(buffer[i + 8:i + 12], 16)
+                out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                i += 12
+                continue
+            out.append(chr(code))
+            i += 6
+        return "".join(out), i, False
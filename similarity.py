@@ -0,0 +1,288 @@
+import array
+import hashlib
+import importlib
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+from typing import List, NamedTuple, Optional
+
+# --- Configuração via variáveis de ambiente ---
+
+SIMILARITY_ENABLED = os.getenv("SIMILARITY_ENABLED", "1") != "0"
+SIMILARITY_DB_PATH = os.getenv("SIMILARITY_DB_PATH", "similarity.sqlite3")
+# A partir de que similaridade (0-1) dois produtos compartilham contexto, persona e UX
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.8"))
+# "minhash" (padrão, local) ou "modulo:funcao" de embeddings, ex.: "chat_agents:embed_text"
+SIMILARITY_BACKEND = os.getenv("SIMILARITY_BACKEND", "minhash")
+# JSON {"termo": "forma canônica"} somado aos sinônimos padrão
+SIMILARITY_SYNONYMS_FILE = os.getenv("SIMILARITY_SYNONYMS_FILE", "")
+# Candidatos avaliados por consulta (os buckets mais cheios não viram varredura)
+SIMILARITY_MAX_CANDIDATES = int(os.getenv("SIMILARITY_MAX_CANDIDATES", "500"))
+
+# --- Normalização dos nomes de produto ---
+
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "de", "do", "da", "dos", "das", "e", "em", "no", "na",
+    "nos", "nas", "para", "pra", "com", "por", "the", "of", "for", "with", "and",
+}
+
+# Formas equivalentes → forma canônica. Palavras terminadas em "s" que estão
+# aqui (ex.: "tenis") não perdem o "s" como se fossem plural.
+SYNONYMS = {
+    "sem fio": "wireless",
+    "bluetooth": "wireless",
+    "headphone": "fone ouvido",
+    "headphones": "fone ouvido",
+    "earphone": "fone ouvido",
+    "earbuds": "fone ouvido",
+    "laptop": "notebook",
+    "celular": "smartphone",
+    "telefone celular": "smartphone",
+    "tenis": "tenis",
+    "sapatilha": "tenis",
+    "expresso": "espresso",
+    "abajur": "luminaria",
+}
+if SIMILARITY_SYNONYMS_FILE:
+    with open(SIMILARITY_SYNONYMS_FILE, encoding="utf-8") as _f:
+        SYNONYMS.update(json.load(_f))
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+_CANONICAL = {_fold(k): _fold(v) for k, v in SYNONYMS.items()}
+_SYNONYM_PATTERN = re.compile(
+    r"\b(" + "|".join(map(re.escape, sorted(_CANONICAL, key=len, reverse=True))) + r")\b"
+)
+
+def normalize(topic: str) -> str:
+    """
+    Forma canônica de um produto: minúsculas, sem acentos nem pontuação,
+    sinônimos unificados, sem stopwords e sem plural simples.
+    "Fones de ouvido wireless" e "fone de ouvido sem fio" → "fone ouvido wireless".
+    """
+    canonical = _CANONICAL
+    text = _fold(topic)
+    words = []
+    for word in text.split():
+        # Plural simples antes dos sinônimos: "fones" → "fone", "headphones" continua na tabela
+        if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")) and word not in canonical:
+            word = word[:-1]
+        words.append(word)
+    text = _SYNONYM_PATTERN.sub(lambda m: canonical[m.group(1)], " ".join(words))
+    return " ".join(sorted(set(w for w in text.split() if len(w) > 1 and w not in STOPWORDS)))
+
+def features(normalized: str) -> set:
+    """Palavras inteiras e trigramas de caracteres (tolera erros de digitação)."""
+    result = set()
+    for word in normalized.split():
+        result.add(word)
+        padded = f"^{word}$"
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+# --- Codificadores: assinatura para o LSH + pontuação exata dos candidatos ---
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+class MinHashEncoder:
+    """
+    MinHash dos trigramas/palavras: a fração de posições iguais estima o
+    Jaccard. Com 16 bandas de 4 valores, pares com Jaccard ≥ 0,8 caem no mesmo
+    bucket em pelo menos uma banda com probabilidade > 99%.
+    """
+    name = "minhash"
+
+    def __init__(self, bands: int = 16, rows: int = 4, seed: int = 1):
+        self.bands = bands
+        self.rows = rows
+        rng = random.Random(seed)
+        # Uma função de hash por posição: o hash de 64 bits com um XOR aleatório
+        self._salts = [rng.getrandbits(64) for _ in range(bands * rows)]
+
+    def encode(self, normalized: str) -> tuple:
+        hashes = [_hash64(f.encode("utf-8")) for f in features(normalized)] or [0]
+        signature = [min(map(salt.__xor__, hashes)) for salt in self._salts]
+        return signature, b""
+
+    def score(self, normalized_a: str, payload_a: bytes, normalized_b: str, payload_b: bytes) -> float:
+        return jaccard(features(normalized_a), features(normalized_b))
+
+class EmbeddingEncoder:
+    """
+    Embeddings de qualquer função `embed(texto) -> lista de floats`. O LSH usa
+    hiperplanos aleatórios (SimHash): cada banda junta `rows` bits de sinal.
+    A pontuação final é o cosseno entre os vetores guardados.
+    """
+    def __init__(self, embed, name: str, bands: int = 16, rows: int = 12, seed: int = 1):
+        self.embed = embed
+        self.name = f"embedding:{name}"
+        self.bands = bands
+        self.rows = rows
+        self.seed = seed
+        self._planes = None
+        self._lock = threading.Lock()
+
+    def _hyperplanes(self, dim: int) -> list:
+        with self._lock:
+            if self._planes is None:
+                rng = random.Random(self.seed)
+                self._planes = [[rng.gauss(0, 1) for _ in range(dim)] for _ in range(self.bands * self.rows)]
+        return self._planes
+
+    def encode(self, normalized: str) -> tuple:
+        vector = list(self.embed(normalized))
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        vector = [v / norm for v in vector]
+        signature = [int(sum(p * v for p, v in zip(plane, vector)) >= 0)
+                     for plane in self._hyperplanes(len(vector))]
+        return signature, array.array("f", vector).tobytes()
+
+    def score(self, normalized_a: str, payload_a: bytes, normalized_b: str, payload_b: bytes) -> float:
+        a, b = array.array("f"), array.array("f")
+        a.frombytes(payload_a)
+        b.frombytes(payload_b)
+        return sum(x * y for x, y in zip(a, b))
+
+def load_encoder(backend: str = SIMILARITY_BACKEND):
+    if backend == "minhash":
+        return MinHashEncoder()
+    module_name, _, func_name = backend.partition(":")
+    return EmbeddingEncoder(getattr(importlib.import_module(module_name), func_name), backend)
+
+# --- Índice ---
+
+class Match(NamedTuple):
+    topic: str
+    run_id: str
+    score: float
+
+class SimilarityIndex:
+    """
+    Produtos já gerados (com o run_id cujos artefatos podem ser reaproveitados),
+    indexados por LSH em SQLite: cada entrada grava um bucket por banda e a
+    consulta só pontua quem divide algum bucket com ela, então o custo não
+    cresce com o tamanho do índice.
+    """
+    def __init__(self, path: str = SIMILARITY_DB_PATH, encoder=None):
+        self.path = path
+        self._encoder = encoder
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS topics ("
+                " id INTEGER PRIMARY KEY, encoder TEXT NOT NULL, topic TEXT NOT NULL,"
+                " normalized TEXT NOT NULL, payload BLOB, run_id TEXT NOT NULL, created REAL NOT NULL,"
+                " UNIQUE (encoder, normalized))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS lsh ("
+                " encoder TEXT NOT NULL, bucket INTEGER NOT NULL, topic_id INTEGER NOT NULL,"
+                " PRIMARY KEY (encoder, bucket, topic_id)) WITHOUT ROWID"
+            )
+
+    @property
+    def encoder(self):
+        # Carregado sob demanda: o backend de embeddings pode importar os agentes
+        if self._encoder is None:
+            self._encoder = load_encoder()
+        return self._encoder
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _buckets(self, signature: list) -> list:
+        rows = self.encoder.rows
+        return [
+            struct.unpack(">q", hashlib.blake2b(
+                struct.pack(f">I{rows}Q", band, *signature[band * rows:(band + 1) * rows]),
+                digest_size=8).digest())[0]
+            for band in range(self.encoder.bands)
+        ]
+
+    def add(self, topic: str, run_id: str) -> None:
+        self.add_many([(topic, run_id)])
+
+    def add_many(self, entries) -> int:
+        """
+        Indexa vários (produto, run_id) numa transação só. Retorna quantos eram novos.
+        Uma forma canônica já indexada passa a apontar para a execução mais
+        recente (a anterior pode ter sido apagada pela retenção dos artefatos).
+        """
+        name = self.encoder.name
+        # Assinaturas calculadas antes de abrir a transação (embeddings podem chamar a API)
+        encoded = [(topic, run_id, normalized, *self.encoder.encode(normalized))
+                   for topic, run_id in entries for normalized in [normalize(topic)] if normalized]
+        added = 0
+        with self._connect() as conn:
+            for topic, run_id, normalized, signature, payload in encoded:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO topics (encoder, topic, normalized, payload, run_id, created)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, topic, normalized, payload, run_id, time.time())
+                )
+                if cursor.rowcount:
+                    added += 1
+                    conn.executemany("INSERT OR IGNORE INTO lsh (encoder, bucket, topic_id) VALUES (?, ?, ?)",
+                                     [(name, bucket, cursor.lastrowid) for bucket in self._buckets(signature)])
+                else:
+                    # Mesma forma canônica: mesmos buckets, só a execução de referência muda
+                    conn.execute("UPDATE topics SET topic = ?, payload = ?, run_id = ?, created = ?"
+                                 " WHERE encoder = ? AND normalized = ?",
+                                 (topic, payload, run_id, time.time(), name, normalized))
+        return added
+
+    def discard(self, run_id: str) -> None:
+        """Remove as entradas que apontam para `run_id` (ex.: execução apagada pela retenção)."""
+        with self._connect() as conn:
+            ids = [(row["id"],) for row in conn.execute("SELECT id FROM topics WHERE run_id = ?", (run_id,))]
+            conn.executemany("DELETE FROM lsh WHERE topic_id = ?", ids)
+            conn.executemany("DELETE FROM topics WHERE id = ?", ids)
+
+    def lookup(self, topic: str, threshold: float = SIMILARITY_THRESHOLD) -> Optional[Match]:
+        """Produto já gerado mais parecido com `topic`, se a similaridade passar de `threshold`."""
+        return next(iter(self.matches(topic, threshold)), None)
+
+    def matches(self, topic: str, threshold: float = SIMILARITY_THRESHOLD) -> List[Match]:
+        """
+        Produtos já gerados com similaridade acima de `threshold`, do mais
+        parecido ao menos (a mesma forma canônica primeiro, com 1.0).
+        """
+        normalized = normalize(topic)
+        if not normalized:
+            return []
+        name = self.encoder.name
+        with self._connect() as conn:
+            exact = [Match(row["topic"], row["run_id"], 1.0) for row in conn.execute(
+                "SELECT topic, run_id FROM topics WHERE encoder = ? AND normalized = ?", (name, normalized))]
+            signature, payload = self.encoder.encode(normalized)
+            buckets = self._buckets(signature)
+            candidates = conn.execute(
+                "SELECT t.topic, t.normalized, t.payload, t.run_id FROM topics t WHERE t.normalized != ?"
+                " AND t.id IN ("
+                f" SELECT topic_id FROM lsh WHERE encoder = ? AND bucket IN ({','.join('?' * len(buckets))})"
+                " LIMIT ?)",
+                (normalized, name, *buckets, SIMILARITY_MAX_CANDIDATES)
+            ).fetchall()
+        near = []
+        for candidate in candidates:
+            score = self.encoder.score(normalized, payload, candidate["normalized"], candidate["payload"])
+            if score >= threshold:
+                near.append(Match(candidate["topic"], candidate["run_id"], score))
+        return exact + sorted(near, key=lambda match: match.score, reverse=True)
+
+similarity_index = SimilarityIndex()
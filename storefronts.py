@@ -0,0 +1,140 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from typing import NamedTuple, Optional
+
+from image_store import image_store
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só existe a versão gzip
+    brotli = None
+
+# Diretório onde as páginas geradas ficam salvas
+STOREFRONT_DIR = os.getenv("STOREFRONT_DIR", "storefronts")
+
+_ID_PATTERN = re.compile(r"^[0-9a-f]{16}$")
+_ASSET_PATTERN = re.compile(r"^[0-9a-f]{16}\.css$")
+# Arquivos compartilhados pelas páginas (CSS extraído), também nomeados pelo hash
+ASSETS_DIR = "assets"
+
+# Codificações pré-comprimidas, na ordem de preferência
+ENCODINGS = (("br", "index.html.br"), ("gzip", "index.html.gz"))
+
+class Storefront(NamedTuple):
+    id: str
+    etag: str
+    product: str
+    created: float
+    sizes: dict
+
+    @property
+    def url(self) -> str:
+        return f"/s/{self.id}"
+
+class StorefrontStore:
+    """
+    Guarda cada e-commerce finalizado sob um ID estável (hash do conteúdo),
+    já comprimido em gzip e brotli, para ser servido como arquivo estático.
+    """
+    def __init__(self, directory: str = STOREFRONT_DIR):
+        self.directory = directory
+
+    def _path(self, storefront_id: str, name: str = "") -> str:
+        return os.path.join(self.directory, storefront_id, name)
+
+    def save(self, html: str, product: str = "") -> Storefront:
+        raw = html.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        storefront_id = digest[:16]
+        # As imagens da página não podem sumir enquanto ela é servida (cache imutável)
+        image_store.pin(html, f"/s/{storefront_id}")
+        existing = self.get(storefront_id)
+        if existing:
+            return existing
+
+        os.makedirs(self._path(storefront_id), exist_ok=True)
+        files = {"index.html": raw, "index.html.gz": gzip.compress(raw, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            files["index.html.br"] = brotli.compress(raw, quality=11, mode=brotli.MODE_TEXT)
+        for name, data in files.items():
+            self._write_atomic(self._path(storefront_id, name), data)
+
+        storefront = Storefront(
+            id=storefront_id,
+            etag=f'"{digest[:32]}"',
+            product=product,
+            created=time.time(),
+            sizes={name: len(data) for name, data in files.items()},
+        )
+        # meta.json por último: só existe quando todos os arquivos já foram gravados
+        meta = json.dumps(storefront._asdict(), ensure_ascii=False).encode("utf-8")
+        self._write_atomic(self._path(storefront_id, "meta.json"), meta)
+        print(f"💾 E-commerce salvo em {storefront.url} ({storefront.sizes})")
+        return storefront
+
+    def save_asset(self, content: str, extension: str = "css") -> str:
+        """
+        Grava um arquivo estático (ex.: o CSS extraído das páginas) nomeado pelo
+        hash do conteúdo, com as versões gzip e brotli. Retorna a URL
+        (/s/assets/<hash>.css); o mesmo conteúdo nunca é gravado duas vezes.
+        """
+        raw = content.encode("utf-8")
+        name = f"{hashlib.sha256(raw).hexdigest()[:16]}.{extension}"
+        path = self._path(ASSETS_DIR, name)
+        if not os.path.exists(path):
+            os.makedirs(self._path(ASSETS_DIR), exist_ok=True)
+            self._write_atomic(f"{path}.gz", gzip.compress(raw, compresslevel=9, mtime=0))
+            if brotli is not None:
+                self._write_atomic(f"{path}.br", brotli.compress(raw, quality=11, mode=brotli.MODE_TEXT))
+            # O arquivo sem compressão por último: ele marca o asset como completo
+            self._write_atomic(path, raw)
+        return f"/s/{ASSETS_DIR}/{name}"
+
+    def asset(self, name: str, accept_encoding: str) -> Optional[tuple]:
+        """Como `representation`, para um asset: (caminho, codificação, etag) ou None."""
+        if not _ASSET_PATTERN.match(name or ""):
+            return None
+        path = self._path(ASSETS_DIR, name)
+        if not os.path.exists(path):
+            return None
+        etag = f'"{name.split(".")[0]}"'
+        accepted = {part.split(";")[0].strip() for part in (accept_encoding or "").split(",")}
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding in accepted and os.path.exists(path + suffix):
+                return os.path.abspath(path + suffix), encoding, f'{etag[:-1]}-{encoding}"'
+        return os.path.abspath(path), None, etag
+
+    def get(self, storefront_id: str) -> Optional[Storefront]:
+        if not _ID_PATTERN.match(storefront_id or ""):
+            return None
+        try:
+            with open(self._path(storefront_id, "meta.json"), encoding="utf-8") as f:
+                return Storefront(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def representation(self, storefront: Storefront, accept_encoding: str) -> tuple:
+        """
+        Escolhe a melhor versão pré-comprimida aceita pelo cliente.
+        Retorna (caminho, codificação, etag); cada codificação tem seu próprio ETag.
+        """
+        accepted = {part.split(";")[0].strip() for part in (accept_encoding or "").split(",")}
+        for encoding, name in ENCODINGS:
+            if encoding in accepted and name in storefront.sizes:
+                etag = f'{storefront.etag[:-1]}-{encoding}"'
+                return os.path.abspath(self._path(storefront.id, name)), encoding, etag
+        return os.path.abspath(self._path(storefront.id, "index.html")), None, storefront.etag
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+storefront_store = StorefrontStore()
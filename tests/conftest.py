@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+# Os módulos leem a configuração e abrem os bancos SQLite na importação:
+# o ambiente dos testes é definido antes, num diretório temporário
+_workdir = tempfile.mkdtemp(prefix="tcc-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("CACHE_DIR", os.path.join(_workdir, ".cache"))
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+for _name in ("RATE_LIMIT", "ARTIFACTS", "IMAGE_STORE", "SIMILARITY", "JOB"):
+    os.environ.setdefault(f"{_name}_DB_PATH", os.path.join(_workdir, f"{_name.lower()}.sqlite3"))
+os.environ.setdefault("IMAGE_STORE_DIR", os.path.join(_workdir, "blobs"))
+os.environ.setdefault("STOREFRONT_DIR", os.path.join(_workdir, "storefronts"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,17 @@
+import app as appmod
+from artifacts import artifact_store
+from image_store import image_store
+from jobs import job_queue
+
+def test_background_work_starts_with_the_first_request(monkeypatch):
+    started = []
+    monkeypatch.setattr(job_queue, "start", lambda: started.append("jobs"))
+    monkeypatch.setattr(image_store, "start_gc", lambda: started.append("images"))
+    monkeypatch.setattr(artifact_store, "start_gc", lambda: started.append("artifacts"))
+    monkeypatch.setattr(appmod, "_background_started", False)
+    # Importar o app não inicia nada
+    assert image_store._thread is None and artifact_store._thread is None
+    client = appmod.app.test_client()
+    client.get("/metrics")
+    client.get("/metrics")
+    assert started == ["jobs", "images", "artifacts"]
@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+from batch import read_products
+
+def write_jsonl(path, rows):
+    path.write_text("\n".join(json.dumps(row) for row in rows), encoding="utf-8")
+    return str(path)
+
+def test_ids_default_to_slug_of_product(tmp_path):
+    items = read_products(write_jsonl(tmp_path / "in.jsonl", [{"product": "Fone de Ouvido!"}, {"product": "Café"}]))
+    assert [item["id"] for item in items] == ["00001_fone_de_ouvido", "00002_café"]
+
+def test_user_ids_are_kept(tmp_path):
+    items = read_products(write_jsonl(tmp_path / "in.jsonl", [{"id": "SKU-1.a", "product": "x"}]))
+    assert items[0]["id"] == "SKU-1.a"
+
+@pytest.mark.parametrize("item_id", ["../../x", "/etc/passwd", "a/b", "a\\b", "..", ".hidden", "x\n"])
+def test_ids_that_escape_the_output_directory_are_rejected(tmp_path, item_id):
+    with pytest.raises(ValueError, match="ID inválido"):
+        read_products(write_jsonl(tmp_path / "in.jsonl", [{"id": item_id, "product": "x"}]))
+
+def test_csv_ids_are_checked_too(tmp_path):
+    path = tmp_path / "in.csv"
+    path.write_text("id,product\n../x,Fone\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="ID inválido"):
+        read_products(str(path))
@@ -0,0 +1,43 @@
+from html_optimizer import minify_css, minify_html, used_names
+
+FONT = "https://fonts.googleapis.com/css2?family=Inter&display=swap"
+
+def test_minify_css_removes_unused_rules():
+    css = ".card { color: red; }\n.unused { color: blue; }\n@media (max-width: 600px) { .card { padding: 0 } .gone { margin: 0 } }"
+    minified, removed = minify_css(css, used_names('<div class="card">x</div>'))
+    assert minified == ".card{color:red}@media (max-width:600px){.card{padding:0}}"
+    assert removed == 2
+
+def test_minify_css_keeps_strings_and_drops_comments():
+    css = '/* comentário { } */ a[title="x{y}"] { content: "a;b  c" }'
+    minified, _ = minify_css(css, used_names("<a title=x>k</a>"))
+    assert minified == 'a[title="x{y}"]{content:"a;b  c"}'
+
+def test_minify_css_moves_font_imports():
+    fonts = []
+    minified, _ = minify_css(f'@import url("{FONT}");\nbody {{ margin: 0 }}', fonts=fonts)
+    assert fonts == [FONT]
+    assert minified == "body{margin:0}"
+
+def test_classes_added_by_script_are_kept():
+    html = "<div id=\"menu\"></div><script>menu.classList.add('active')</script>"
+    minified, removed = minify_css(".active { color: red }", used_names(html))
+    assert minified == ".active{color:red}" and removed == 0
+
+def test_minify_html_keeps_preformatted_text():
+    html = "<div>\n  <p>a   b</p>\n<!-- x -->\n<pre>  keep\n  this</pre></div>"
+    assert minify_html(html) == "<div><p>a b</p> <pre>  keep\n  this</pre></div>"
+
+def test_classes_toggled_by_inline_handlers_are_kept():
+    html = ('<button class="menu" onclick="document.body.classList.toggle(\'nav-open\')">x</button>'
+            '<a href="javascript:show(\'is-visible\')">y</a>')
+    css = ".menu { color: red } .nav-open .menu { color: blue } .is-visible { opacity: 1 } .gone { margin: 0 }"
+    minified, removed = minify_css(css, used_names(html))
+    assert minified == ".menu{color:red}.nav-open .menu{color:blue}.is-visible{opacity:1}"
+    assert removed == 1
+
+def test_external_scripts_disable_pruning():
+    html = '<div class="card"></div><script src="https://cdn.example.com/app.js"></script>'
+    assert used_names(html) is None
+    minified, removed = minify_css(".card { color: red } .open { color: blue }", used_names(html))
+    assert minified == ".card{color:red}.open{color:blue}" and removed == 0
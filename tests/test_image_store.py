@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+import image_store as image_store_module
+from image_store import ImageStore
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(image_store_module, "IMAGE_GC_GRACE_SECONDS", -1)
+    # Cota menor que duas imagens: a coleta precisa remover uma
+    return ImageStore(str(tmp_path / "images.sqlite3"), str(tmp_path / "blobs"), quota_mb=1.5 / 1024)
+
+def test_collect_keeps_images_pinned_by_saved_pages(store):
+    store.put_bytes(b"a" * 1024, "static/images/old.png")
+    store.put_bytes(b"b" * 1024, "static/images/new.png")
+    assert store.pin('<picture><img src="/static/images/old.png" alt="x"></picture>', "/s/page") == 1
+    removed = store.collect()
+    assert removed["blobs"] == 1
+    assert os.path.exists("static/images/old.png")
+    assert not os.path.exists("static/images/new.png")
+
+def test_collect_evicts_least_recently_used_unpinned_image(store):
+    store.put_bytes(b"a" * 1024, "static/images/old.png")
+    store.put_bytes(b"b" * 1024, "static/images/new.png")
+    store.collect()
+    assert not os.path.exists("static/images/old.png")
+    assert os.path.exists("static/images/new.png")
@@ -0,0 +1,24 @@
+import sqlite3
+import threading
+
+import jobs
+from jobs import JobQueue
+
+def test_worker_survives_claim_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_POLL_SECONDS", 0.01)
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), workers=1)
+    calls = []
+    recovered = threading.Event()
+
+    def claim():
+        calls.append(1)
+        if len(calls) <= 2:
+            raise sqlite3.OperationalError("database is locked")
+        recovered.set()
+        return None
+
+    monkeypatch.setattr(queue, "_claim", claim)
+    worker = threading.Thread(target=queue._work, daemon=True)
+    worker.start()
+    assert recovered.wait(5)
+    assert worker.is_alive()
@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+
+import pipeline
+from pipeline import Stage, run_pipeline
+
+@pytest.fixture(autouse=True)
+def no_artifacts(monkeypatch):
+    monkeypatch.setattr(pipeline, "ARTIFACTS_ENABLED", False)
+
+def test_independent_stages_run_in_parallel():
+    # Cada etapa só termina quando a outra também começou
+    barrier = threading.Barrier(2, timeout=5)
+
+    def parallel(name):
+        def run(product):
+            barrier.wait()
+            return name
+        return run
+
+    stages = (
+        Stage("a", ("product",), parallel("a")),
+        Stage("b", ("product",), parallel("b")),
+        Stage("c", ("a", "b"), lambda a, b: f"{a}+{b}"),
+    )
+    result = run_pipeline("x", stages=stages)
+    assert result.outputs["c"] == "a+b"
+    assert result.timings[-1].name == "c"
+
+def test_failure_is_raised_without_waiting_for_running_stages():
+    release = threading.Event()
+    started = []
+
+    def slow(product):
+        release.wait(5)
+        return "slow"
+
+    def fail(product):
+        time.sleep(0.05)
+        raise RuntimeError("falhou")
+
+    stages = (
+        Stage("slow", ("product",), slow),
+        Stage("fail", ("product",), fail),
+        Stage("after", ("slow", "fail"), lambda slow, fail: started.append("after")),
+    )
+    t0 = time.perf_counter()
+    try:
+        with pytest.raises(RuntimeError, match="falhou"):
+            run_pipeline("x", stages=stages)
+        assert time.perf_counter() - t0 < 1
+    finally:
+        release.set()
+    assert started == []
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import pytest
+
+from resilience import DeadlineExceeded, astream_within_deadline, stream_within_deadline
+
+class SlowStream:
+    """Stream que entrega um trecho a cada `interval` segundos."""
+    def __init__(self, chunks, interval):
+        self.chunks = list(chunks)
+        self.interval = interval
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            time.sleep(self.interval)
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+class AsyncSlowStream(SlowStream):
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.interval)
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+def test_stream_within_deadline_passes_chunks_through():
+    stream = SlowStream("abc", 0)
+    assert list(stream_within_deadline("Agent", "gpt", stream, time.monotonic() + 5)) == ["a", "b", "c"]
+    assert stream.closed
+
+def test_slow_stream_is_closed_when_deadline_expires():
+    stream = SlowStream("abcdefghij", 0.05)
+    received = []
+    with pytest.raises(DeadlineExceeded):
+        for chunk in stream_within_deadline("Agent", "gpt", stream, time.monotonic() + 0.12):
+            received.append(chunk)
+    assert 1 <= len(received) < 10
+    assert stream.closed
+
+def test_async_stalled_stream_is_closed_when_deadline_expires():
+    stream = AsyncSlowStream("ab", 5)
+
+    async def consume():
+        return [chunk async for chunk in astream_within_deadline("Agent", "gpt", stream, time.monotonic() + 0.1)]
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(consume())
+    assert time.monotonic() - start < 1
+    assert stream.closed
+
+def test_async_stream_within_deadline_passes_chunks_through():
+    stream = AsyncSlowStream("abc", 0)
+
+    async def consume():
+        return [chunk async for chunk in astream_within_deadline("Agent", "gpt", stream, time.monotonic() + 5)]
+
+    assert asyncio.run(consume()) == ["a", "b", "c"]
+    assert stream.closed
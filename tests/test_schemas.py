@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from schemas import FusedUpstreamSchema, HtmlCodeSchema, JsonFieldStream, ProductListSchema
+
+# Acento (é), emoji fora do BMP (par de surrogates 😀) e escapes simples
+HTML = 'Café 😀 <div class="card">\n\t"preço" \\ 10/12</div>'
+PAYLOAD = json.dumps({"other": "x", "html": HTML, "after": "ignored"})
+
+def stream(chunks, field="html") -> str:
+    out = []
+    decoder = JsonFieldStream(field, out.append)
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return "".join(out)
+
+def test_payload_uses_escapes():
+    assert "\\u00e9" in PAYLOAD and "\\ud83d\\ude00" in PAYLOAD
+
+def test_single_chunk():
+    assert stream([PAYLOAD]) == HTML
+
+def test_one_character_per_chunk():
+    assert stream(list(PAYLOAD)) == HTML
+
+@pytest.mark.parametrize("split", range(1, len(PAYLOAD)))
+def test_any_split_point(split):
+    assert stream([PAYLOAD[:split], PAYLOAD[split:]]) == HTML
+
+def test_split_inside_unicode_escape():
+    start = PAYLOAD.index("\\u00e9")
+    for offset in range(1, 6):
+        assert stream([PAYLOAD[:start + offset], PAYLOAD[start + offset:]]) == HTML
+
+def test_split_inside_surrogate_pair():
+    start = PAYLOAD.index("\\ud83d\\ude00")
+    for offset in range(1, 12):
+        assert stream([PAYLOAD[:start + offset], PAYLOAD[start + offset:]]) == HTML
+
+def test_split_inside_key():
+    start = PAYLOAD.index('"html"')
+    assert stream([PAYLOAD[:start + 3], PAYLOAD[start + 3:]]) == HTML
+
+def test_text_is_emitted_as_it_arrives():
+    out = []
+    decoder = JsonFieldStream("html", out.append)
+    decoder.feed('{"html": "<p>ol')
+    assert "".join(out) == "<p>ol"
+    decoder.feed('\\u00e')
+    assert "".join(out) == "<p>ol"
+    decoder.feed('1</p>"}')
+    assert "".join(out) == "<p>olá</p>"
+
+def test_missing_field_emits_nothing():
+    assert stream([json.dumps({"text": "x"})]) == ""
+
+def test_product_list_requires_three_products():
+    products = [{"nome": f"P{i}", "descricao": "d", "preco": 10} for i in range(2)]
+    with pytest.raises(ValidationError):
+        ProductListSchema.model_validate_json(json.dumps({"produtos": products}))
+
+def test_blank_and_non_positive_values_are_rejected():
+    products = [{"nome": " ", "descricao": "d", "preco": 10}, {"nome": "P", "descricao": "d", "preco": 0},
+                {"nome": "Q", "descricao": "d", "preco": 1}]
+    with pytest.raises(ValidationError) as error:
+        ProductListSchema.model_validate_json(json.dumps({"produtos": products}))
+    locations = {e["loc"] for e in error.value.errors()}
+    assert ("produtos", 0, "nome") in locations and ("produtos", 1, "preco") in locations
+
+def test_extra_fields_are_rejected():
+    with pytest.raises(ValidationError):
+        HtmlCodeSchema.model_validate_json(json.dumps({"html": "<p>x</p>", "css": ""}))
+
+def test_fused_upstream_schema():
+    products = [{"nome": f"P{i}", "descricao": "d", "preco": 10} for i in range(3)]
+    value = FusedUpstreamSchema.model_validate_json(json.dumps(
+        {"contexto": "c", "persona": "p", "ux": "u", "produtos": products}))
+    assert [p.nome for p in value.produtos] == ["P0", "P1", "P2"]
@@ -0,0 +1,51 @@
+import pytest
+
+import pipeline
+from artifacts import ArtifactStore
+from similarity import MinHashEncoder, SimilarityIndex, normalize
+
+def test_synonyms_plural_and_stopwords():
+    assert normalize("Fones de ouvido wireless") == normalize("fone de ouvido sem fio") == "fone ouvido wireless"
+
+def test_accents_case_and_punctuation():
+    assert normalize("Café, Orgânico!") == normalize("cafe organico")
+
+def test_word_order_does_not_matter():
+    assert normalize("tênis corrida") == normalize("corrida tênis")
+
+@pytest.fixture
+def index(tmp_path):
+    return SimilarityIndex(str(tmp_path / "similarity.sqlite3"), encoder=MinHashEncoder())
+
+def test_new_generation_replaces_the_indexed_run(index):
+    assert index.add_many([("Fones de ouvido wireless", "old")]) == 1
+    assert index.add_many([("fone de ouvido sem fio", "new")]) == 0
+    match = index.lookup("fones de ouvido sem fio")
+    assert (match.run_id, match.score) == ("new", 1.0)
+
+def test_matches_include_near_candidates_after_the_exact_one(index):
+    index.add_many([("fone de ouvido wireless", "exact"), ("fone de ouvido wireless preto", "near")])
+    assert [m.run_id for m in index.matches("fones de ouvido wireless", threshold=0.5)] == ["exact", "near"]
+
+def test_discard_removes_the_run(index):
+    index.add("fone de ouvido wireless", "gone")
+    index.discard("gone")
+    assert index.lookup("fone de ouvido wireless") is None
+
+def test_find_similar_skips_runs_without_artifacts(index, tmp_path, monkeypatch):
+    store = ArtifactStore(str(tmp_path / "artifacts.sqlite3"))
+    live = store.create_run("fone de ouvido wireless preto")
+    for name in pipeline.SIMILAR_REUSABLE:
+        store.save(live, name, "hash", f"saída {name}")
+    index.add_many([("fone de ouvido wireless", "deleted"), ("fone de ouvido wireless preto", live)])
+    monkeypatch.setattr(pipeline, "SIMILARITY_ENABLED", True)
+    monkeypatch.setattr(pipeline, "artifact_store", store)
+    monkeypatch.setattr(pipeline, "similarity_index", index)
+    # "preto" a mais: parecido, mas abaixo do limiar padrão
+    matches = index.matches
+    monkeypatch.setattr(index, "matches", lambda topic: matches(topic, threshold=0.5))
+    match, outputs, _ = pipeline._find_similar("fones de ouvido wireless", pipeline.STAGES)
+    assert match.run_id == live
+    assert outputs["persona"] == "saída persona"
+    # A execução apagada saiu do índice
+    assert [m.run_id for m in index.matches("fone de ouvido wireless")] == [live]
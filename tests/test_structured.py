@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import pytest
+
+import chat_agents
+from chat_agents import astructured_completion, structured_completion
+from schemas import HtmlCodeSchema, ProductListSchema
+
+VALID = json.dumps({"produtos": [{"nome": f"P{i}", "descricao": "d", "preco": 10} for i in range(3)]})
+INVALID = json.dumps({"produtos": [{"nome": "P0", "descricao": "d", "preco": -1}]})
+
+class FakeCompletion:
+    """Substitui a chamada à API: devolve as respostas em ordem e guarda os prompts recebidos."""
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.prompts = []
+
+    def __call__(self, agent_name, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return self.responses.pop(0)
+
+    async def acall(self, agent_name, prompt, **kwargs):
+        return self(agent_name, prompt, **kwargs)
+
+@pytest.fixture
+def completion(monkeypatch):
+    def install(*responses):
+        fake = FakeCompletion(*responses)
+        monkeypatch.setattr(chat_agents, "chat_completion", fake)
+        monkeypatch.setattr(chat_agents, "achat_completion", fake.acall)
+        return fake
+    return install
+
+def test_valid_response_needs_no_repair(completion):
+    fake = completion(VALID)
+    value = structured_completion("BusinessAgent", "PROMPT", ProductListSchema)
+    assert len(value.produtos) == 3
+    assert fake.prompts == ["PROMPT"]
+
+def test_invalid_response_is_repaired(completion):
+    fake = completion(INVALID, VALID)
+    value = structured_completion("BusinessAgent", "PROMPT", ProductListSchema)
+    assert len(value.produtos) == 3
+    assert len(fake.prompts) == 2
+    repair = fake.prompts[1]
+    # O prompt de correção repete o original, lista os erros e mostra a resposta recusada
+    assert repair.startswith("PROMPT\n")
+    assert "NÃO PASSOU NA VALIDAÇÃO" in repair
+    assert "- produtos.0.preco:" in repair
+    assert INVALID in repair
+
+def test_malformed_json_is_repaired(completion):
+    fake = completion('{"html": "<p>cortado', json.dumps({"html": "<p>ok</p>"}))
+    assert structured_completion("CodeGeneratorAgent", "PROMPT", HtmlCodeSchema).html == "<p>ok</p>"
+    assert "- resposta:" in fake.prompts[1]
+
+def test_gives_up_after_repair_attempts(completion, monkeypatch):
+    monkeypatch.setattr(chat_agents, "STRUCTURED_REPAIR_ATTEMPTS", 1)
+    fake = completion(INVALID, INVALID, VALID)
+    with pytest.raises(ValueError, match="fora do formato após 2 tentativa"):
+        structured_completion("BusinessAgent", "PROMPT", ProductListSchema)
+    assert len(fake.prompts) == 2
+
+def test_async_invalid_response_is_repaired(completion):
+    fake = completion(INVALID, VALID)
+    value = asyncio.run(astructured_completion("BusinessAgent", "PROMPT", ProductListSchema))
+    assert len(value.produtos) == 3
+    assert "NÃO PASSOU NA VALIDAÇÃO" in fake.prompts[1]
+
+def test_only_valid_responses_are_cacheable():
+    assert chat_agents._cacheable(VALID, ProductListSchema)
+    assert not chat_agents._cacheable(INVALID, ProductListSchema)
+    assert chat_agents._cacheable("texto livre")
@@ -0,0 +1,32 @@
+import json
+
+# Helpers HTTP compartilhados pelo servidor Flask (app.py) e pelo ASGI (asgi_app.py)
+
+def server_timing(result) -> str:
+    """Duração de cada etapa no cabeçalho Server-Timing (visível no DevTools e nos benchmarks)."""
+    entries = [f"{t.name};dur={t.duration * 1000:.1f}" for t in result.timings]
+    entries.append(f"total;dur={result.total * 1000:.1f}")
+    return ", ".join(entries)
+
+def sse(event: str, data: dict) -> str:
+    """Formata uma mensagem no padrão Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()
+                  for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+# Cabeçalhos das páginas salvas: o ID é o hash do conteúdo, então a página nunca muda
+def storefront_headers(etag: str) -> dict:
+    return {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept-Encoding",
+    }
+
+def variant_links(urls: list) -> str:
+    """Cabeçalho Link com a página salva de cada variante de layout (teste A/B)."""
+    return ", ".join(f'<{url}>; rel="alternate"; title="variante {n}"' for n, url in enumerate(urls, 1))